@@ -0,0 +1,222 @@
+# Copyright (c) 2022 Yoshihiro Ota <ota@j.email.ne.jp>
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+
+"""
+Micro-benchmarks of converters of sysctl values with synthetic data.
+They run on any system as no sysctl is called.
+
+% python benchmarks/bench_tconv.py
+% python benchmarks/bench_tconv.py --save benchmarks/tconv_baseline.json
+% python benchmarks/bench_tconv.py --compare benchmarks/tconv_baseline.json
+"""
+
+import argparse
+import functools
+import gc
+import json
+import platform
+import struct
+import sys
+import timeit
+import tracemalloc
+from typing import Any, Dict, List, Tuple
+
+from prdanlz.libc import sysctl, tconv
+
+SAMPLES = 64  # calls whose results are kept to count allocations
+
+
+def sample(conv: tconv.TypeConv) -> bytes:
+    """
+    Returns synthetic data that 'conv' converts as a sysctl value.
+    """
+    if conv is sysctl.loadavg:
+        long = tconv.long.format
+        return struct.pack(f"III{long}", 1024, 2048, 512, 2048)
+    if conv is sysctl.timeval:
+        return struct.pack(f"{tconv.int.format}{tconv.long.format}", 1651363200, 5)
+    if conv is sysctl.pagesizes:
+        return struct.pack(f"3{tconv.long.format}", 4096, 2 << 20, 1 << 30)
+    if conv is sysctl.bios_smap_xattr:
+        return struct.pack("QQII", 0, 1 << 20, 1, 0) * 8
+    if isinstance(conv, tconv.CstringConv):
+        return b"FreeBSD\x00" + b"\x00" * 8
+    if isinstance(conv, sysctl.DictConv):
+        return bytes(range(1, conv.sizeof + 1))
+    if isinstance(conv, sysctl.StructConv):
+        return bytes(range(1, conv.sizeof + 1))
+    if conv.size > 0:
+        return bytes(range(1, conv.size + 1))
+    return bytes(range(64))
+
+
+def converters() -> List[Tuple[str, tconv.TypeConv]]:
+    ctltypes = {
+        v: k
+        for k, v in vars(sysctl).items()
+        if k.startswith("CTLTYPE_") and k != "CTLTYPE_STRUCT"
+    }
+    convs = [(f"TYPE2CONV[{k}]", v) for k, v in tconv.TYPE2CONV.items()]
+    convs += [(f"FMT2TCONV[{k}]", v) for k, v in sysctl.FMT2TCONV.items()]
+    convs += [(f"TYPE2TCONV[{ctltypes[k]}]", v) for k, v in sysctl.TYPE2TCONV.items()]
+    return convs
+
+
+def allocations(conv: tconv.TypeConv) -> Dict[str, float]:
+    """
+    Returns memory blocks and bytes kept per call by results, and the peak
+    of bytes allocated during a call.
+    """
+    data = sample(conv)
+    c2p = conv.c2p
+    results: List[Any] = [None] * SAMPLES
+    gc.collect()  # garbage left by timing is not freed while counting
+    gc.disable()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    for i in range(SAMPLES):
+        results[i] = c2p(data)
+    after = tracemalloc.take_snapshot()
+    kept = [
+        stat
+        for stat in after.compare_to(before, "filename")
+        if stat.traceback[0].filename != tracemalloc.__file__
+    ]
+    del results
+    current, _ = tracemalloc.get_traced_memory()
+    if hasattr(tracemalloc, "reset_peak"):  # Python 3.9 or later
+        tracemalloc.reset_peak()
+    c2p(data)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    gc.enable()
+    return {
+        "blocks_per_op": sum(s.count_diff for s in kept) / SAMPLES,
+        "bytes_per_op": sum(s.size_diff for s in kept) / SAMPLES,
+        "peak_bytes_per_op": float(max(0, peak - current)),
+    }
+
+
+def run(selected: str, repeat: int) -> Dict[str, Dict[str, float]]:
+    """
+    Returns nanoseconds per call of each converter, the best of 'repeat'
+    rounds, with allocations.
+    A round times every converter once so that each converter is timed
+    across the whole run rather than only during one burst of other load,
+    which only ever makes calls slower.
+    """
+    timers = {}
+    for name, conv in converters():
+        if selected in name:
+            timer = timeit.Timer(functools.partial(conv.c2p, sample(conv)))
+            number, _ = timer.autorange()
+            timers[name] = (conv, timer, number)
+    seconds: Dict[str, List[float]] = {name: [] for name in timers}
+    for _ in range(repeat):
+        for name, (_, timer, number) in timers.items():
+            seconds[name].append(timer.timeit(number) / number)
+    results = {}
+    for name, (conv, _, _) in timers.items():
+        results[name] = {
+            "ns_per_op": min(seconds[name]) * 1e9,
+            **allocations(conv),
+        }
+    return results
+
+
+def report(results: Dict[str, Dict[str, float]], baseline: Dict[str, Any]) -> None:
+    print(
+        f"{'converter':42} {'ns/op':>9} {'blocks/op':>9} {'bytes/op':>9}"
+        f" {'peak B/op':>9}" + (f" {'vs base':>8}" if baseline else "")
+    )
+    for name, r in results.items():
+        line = (
+            f"{name:42} {r['ns_per_op']:9.1f} {r['blocks_per_op']:9.2f}"
+            f" {r['bytes_per_op']:9.1f} {r['peak_bytes_per_op']:9.0f}"
+        )
+        base = baseline.get(name, None)
+        if base:
+            line += f" {r['ns_per_op'] / base['ns_per_op']:7.2f}x"
+        print(line)
+
+
+def regressions(
+    results: Dict[str, Dict[str, float]], baseline: Dict[str, Any], threshold: float
+) -> List[str]:
+    """
+    Returns converters slower than the baseline by more than 'threshold'
+    or keeping more memory blocks per call.
+    """
+    found = []
+    for name, r in results.items():
+        base = baseline.get(name, None)
+        if base is None:
+            continue
+        if r["ns_per_op"] > base["ns_per_op"] * (1 + threshold):
+            found.append(f"{name} takes {r['ns_per_op']:.1f} ns/op")
+        if r["blocks_per_op"] > base["blocks_per_op"] + 0.5:
+            found.append(f"{name} keeps {r['blocks_per_op']:.2f} blocks/op")
+    return found
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("-k", dest="selected", default="", help="substring of names")
+    parser.add_argument("-r", "--repeat", type=int, default=11)
+    parser.add_argument("--save", help="write results as a baseline")
+    parser.add_argument("--compare", help="compare results with a baseline")
+    parser.add_argument(
+        "--threshold", type=float, default=0.5, help="ratio of slowdown to fail"
+    )
+    args = parser.parse_args()
+
+    baseline: Dict[str, Any] = {}
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+
+    results = run(args.selected, args.repeat)
+    report(results, baseline)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(
+                {
+                    "python": platform.python_version(),
+                    "machine": platform.machine(),
+                    "results": results,
+                },
+                f,
+                indent=2,
+                sort_keys=True,
+            )
+    if args.compare:
+        found = regressions(results, baseline, args.threshold)
+        for regression in found:
+            print(f"Regression: {regression}", file=sys.stderr)
+        return 1 if found else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
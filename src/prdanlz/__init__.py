@@ -21,6 +21,15 @@
 # OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
 # SUCH DAMAGE.
 
-from .variable import Variable, SyscmdVariable, SysctlVariable, instantiate_variable
+from .variable import (
+    Variable,
+    SyscmdVariable,
+    SysctlVariable,
+    FileVariable,
+    SyntheticVariable,
+    instantiate_variable,
+)
 from .incident import Incident
 from .monitor import Monitor
+from .asyncmonitor import AsyncMonitor
+from .shard import ShardedMonitor
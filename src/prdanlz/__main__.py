@@ -23,28 +23,56 @@
 
 import argparse
 import logging
+import logging.handlers
 import json
+import queue
 import signal
 import sys
 import os
+import tempfile
+from typing import Dict, Optional
 
-from . import Monitor, Incident
+from . import AsyncMonitor, Monitor, Incident, ShardedMonitor
+from . import artifact, bench, control, replay, store
+from .escalation import Batch, Throttle
+from .exporter import MetricsExporter
+from .flight import FlightRecorder
+from .jsonl import JsonlSink
+from .profiler import Profiler
+from .shm import SharedSnapshot
+from .statsd import StatsdSink
 
 logger = logging.getLogger(__name__)
 
 
 def parse_args():
     parser = argparse.ArgumentParser()
-    parser.add_argument(
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument(
         "-c",
         "--config",
         dest="config",
         type=argparse.FileType("r"),
-        required=True,
         nargs="+",
         help="configuration file to specify sysctl monitoring and their actions",
     )
 
+    source.add_argument(
+        "--artifact",
+        dest="artifact",
+        type=str,
+        default=None,
+        help="start from an artifact written by --compile instead of configuration files",
+    )
+
+    parser.add_argument(
+        "--compile",
+        dest="compile",
+        type=str,
+        default=None,
+        help="write configuration files validated and resolved to an artifact and exit",
+    )
+
     parser.add_argument(
         "-i",
         "--interval",
@@ -54,6 +82,285 @@ def parse_args():
         help="positive number to specify interval in second to re-evaluate rules",
     )
 
+    parser.add_argument(
+        "--overrun",
+        dest="overrun",
+        type=str,
+        default="skip",
+        choices=Monitor.overruns,
+        help="how to handle interval deadlines missed by a long cycle: skip them, catch-up by running all of them, or coalesce them into one cycle",
+    )
+
+    parser.add_argument(
+        "--budget",
+        dest="budget",
+        type=float,
+        default=None,
+        help="seconds a cycle may take before it is logged as an overrun; defaults to the interval",
+    )
+
+    parser.add_argument(
+        "-w",
+        "--workers",
+        dest="workers",
+        type=int,
+        default=1,
+        help="number of threads to fetch variables in parallel; 1 fetches them one by one",
+    )
+
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument(
+        "--async",
+        dest="asyncio",
+        action="store_true",
+        help="run fetches and escalations in an asyncio event loop of a single thread",
+    )
+    parser.set_defaults(asyncio=False)
+
+    mode.add_argument(
+        "--shards",
+        dest="shards",
+        type=int,
+        default=0,
+        help="number of worker processes to evaluate incidents in; 0 evaluates them in this process",
+    )
+
+    parser.add_argument(
+        "--timeout",
+        dest="timeout",
+        type=float,
+        default=None,
+        help="seconds to wait for each escalation, and for each system command with --async",
+    )
+
+    parser.add_argument(
+        "--escalation-workers",
+        dest="escalation_workers",
+        type=int,
+        default=0,
+        help="number of threads to run escalations and log their output without holding back evaluation; 0, the default, runs them inline",
+    )
+
+    parser.add_argument(
+        "--escalation-limit",
+        dest="escalation_limit",
+        type=int,
+        default=None,
+        help="maximum number of escalations of all incidents per --escalation-period",
+    )
+
+    parser.add_argument(
+        "--escalation-period",
+        dest="escalation_period",
+        type=float,
+        default=60,
+        help="seconds of the period for --escalation-limit",
+    )
+
+    parser.add_argument(
+        "--batch-escalation",
+        dest="batch_escalation",
+        type=str,
+        default=None,
+        help="command to run batched escalations of a cycle with {count} and {summary}; without it, they run in one shell",
+    )
+
+    parser.add_argument(
+        "--metrics",
+        dest="metrics",
+        type=str,
+        default=None,
+        help="serve latest values and timings in Prometheus format at HOST:PORT or a Unix socket path",
+    )
+
+    parser.add_argument(
+        "--control",
+        dest="control",
+        type=str,
+        default=None,
+        help="answer queries of 'python -m prdanlz ctl' on this Unix socket path",
+    )
+
+    parser.add_argument(
+        "--statsd",
+        dest="statsd",
+        type=str,
+        default=None,
+        help="send values and triggered levels as statsd gauges every cycle to HOST:PORT over UDP or a Unix datagram socket path",
+    )
+
+    parser.add_argument(
+        "--statsd-prefix",
+        dest="statsd_prefix",
+        type=str,
+        default="prdanlz",
+        help="prefix of statsd gauge names",
+    )
+
+    parser.add_argument(
+        "--statsd-include",
+        dest="statsd_include",
+        type=str,
+        nargs="+",
+        default=None,
+        help="glob patterns of names of variables and derivatives to send; all by default",
+    )
+
+    parser.add_argument(
+        "--statsd-tags",
+        dest="statsd_tags",
+        type=str,
+        nargs="+",
+        default=None,
+        help="DogStatsD tags such as host:db1 to add to every gauge",
+    )
+
+    parser.add_argument(
+        "--shm",
+        dest="shm",
+        type=str,
+        default=None,
+        help="publish numbers of every cycle to the shared memory of this name for prdanlz.shm.SnapshotReader",
+    )
+
+    parser.add_argument(
+        "--shm-slots",
+        dest="shm_slots",
+        type=int,
+        default=4096,
+        help="maximum number of series in the shared memory",
+    )
+
+    parser.add_argument(
+        "--samples",
+        dest="samples",
+        type=str,
+        default=None,
+        help="append values and triggered levels of every cycle as a line of JSON to this file",
+    )
+
+    parser.add_argument(
+        "--samples-interval",
+        dest="samples_interval",
+        type=float,
+        default=10,
+        help="seconds to buffer samples before writing them",
+    )
+
+    parser.add_argument(
+        "--samples-fsync",
+        dest="samples_fsync",
+        type=str,
+        default="rotate",
+        choices=JsonlSink.fsyncs,
+        help="when to sync samples to disk: never, on every write, or on rotation and exit",
+    )
+
+    parser.add_argument(
+        "--samples-max-bytes",
+        dest="samples_max_bytes",
+        type=int,
+        default=0,
+        help="rotate the samples file when it grows to this size; 0 never rotates",
+    )
+
+    parser.add_argument(
+        "--samples-backups",
+        dest="samples_backups",
+        type=int,
+        default=5,
+        help="number of rotated samples files to keep",
+    )
+
+    parser.add_argument(
+        "--store",
+        dest="store",
+        type=str,
+        default=None,
+        help="append numbers of every cycle to columns per series in this directory for 'query'",
+    )
+
+    parser.add_argument(
+        "--store-interval",
+        dest="store_interval",
+        type=float,
+        default=10,
+        help="seconds to buffer numbers before appending them to columns",
+    )
+
+    parser.add_argument(
+        "--flight-recorder",
+        dest="flight_recorder",
+        type=str,
+        default=None,
+        help="directory to write recent cycles to when an incident escalates, given to escalations as {flight_record}",
+    )
+
+    parser.add_argument(
+        "--flight-cycles",
+        dest="flight_cycles",
+        type=int,
+        default=60,
+        help="number of recent cycles to keep in memory for --flight-recorder",
+    )
+
+    parser.add_argument(
+        "--flight-files",
+        dest="flight_files",
+        type=int,
+        default=100,
+        help="number of files written by --flight-recorder to keep; older ones are removed",
+    )
+
+    parser.add_argument(
+        "--profile",
+        dest="profile",
+        type=int,
+        default=0,
+        help="number of cycles to profile from the start, and on each SIGUSR2",
+    )
+
+    parser.add_argument(
+        "--profile-dir",
+        dest="profile_dir",
+        type=str,
+        default=tempfile.gettempdir(),
+        help="directory to write profiles to",
+    )
+
+    parser.add_argument(
+        "--tracemalloc",
+        dest="tracemalloc",
+        type=int,
+        default=0,
+        help="number of frames to trace allocations of profiled cycles with; 0 disables",
+    )
+
+    parser.add_argument(
+        "--bench",
+        dest="bench",
+        type=int,
+        default=0,
+        help="run this many cycles back to back without escalating, report latency, throughput, and peak memory, and exit",
+    )
+
+    parser.add_argument(
+        "--replay",
+        dest="replay",
+        type=str,
+        nargs="+",
+        default=None,
+        help="evaluate derivatives and incidents on samples recorded by --samples, oldest file first, print transitions of levels and escalations instead of running them, and exit",
+    )
+
+    parser.add_argument(
+        "--fetch-all",
+        dest="fetch_all",
+        action="store_true",
+        help="fetch and calculate all variables and derivatives even if no incident refers to them, to log, record, and serve all of them",
+    )
+    parser.set_defaults(fetch_all=False)
+
     parser.add_argument(
         "-l",
         "--log",
@@ -63,6 +370,14 @@ def parse_args():
         help="the name of the log file.  If not specified, logging is disabled",
     )
 
+    parser.add_argument(
+        "--log-changes",
+        dest="log_changes",
+        action="store_true",
+        help="log values of variables and derivatives only when they change",
+    )
+    parser.set_defaults(log_changes=False)
+
     parser.add_argument(
         "--log-format",
         dest="logformat",
@@ -105,10 +420,29 @@ def parse_args():
     )
     parser.set_defaults(debug=False)
 
-    return parser.parse_args()
+    args = parser.parse_args()
+    if args.escalation_period <= 0:
+        parser.error("--escalation-period must be positive")
+    return args
 
 
-def analyze(args) -> None:
+class _DeferredHandler(logging.handlers.QueueHandler):
+    """
+    Records are queued as they are and formatted by the listener thread.
+    Arguments of per-cycle logging are values fetched or calculated for the
+    cycle, which are not modified afterward.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def setup_logging(args) -> Optional[logging.handlers.QueueListener]:
+    """
+    With --log, the file is written by a listener thread so that evaluation
+    does not wait for writes.  The returned listener must be stopped to
+    write out the queued records.
+    """
     if args.verify:
         logging.basicConfig(
             stream=sys.stdout,
@@ -117,34 +451,155 @@ def analyze(args) -> None:
             datefmt=args.logdateformat,
         )
     elif args.log:
+        handler = logging.FileHandler(args.log)
+        handler.setFormatter(logging.Formatter(args.logformat, args.logdateformat))
+        records: queue.Queue = queue.Queue()
+        listener = logging.handlers.QueueListener(records, handler)
+        listener.start()
         logging.basicConfig(
-            filename=args.log,
             level=logging.DEBUG if args.debug else logging.INFO,
-            format=args.logformat,
-            datefmt=args.logdateformat,
+            handlers=[_DeferredHandler(records)],
         )
+        return listener
     else:
         logging.disable(logging.CRITICAL)
+    return None
 
+
+def analyze(args) -> None:
     Incident.levels = args.levels
-    m = Monitor(args.interval)
-    for file in args.config:
-        with file as json_file:
-            setting = json.load(json_file)
+    if args.artifact:
+        configs = [(args.artifact, artifact.read(args.artifact))]
+        reloader = lambda: [artifact.read(args.artifact)]
+    else:
+        configs = []
+        for file in args.config:
+            with file as json_file:
+                configs.append((file.name, json.load(json_file)))
+        reloader = lambda: [_read_json(file.name) for file in args.config]
+    batch = Batch(args.batch_escalation)
+    if args.replay:
+        cycles, events, skipped = replay.replay(
+            [setting for _, setting in configs],
+            args.replay,
+            args.escalation_limit,
+            args.escalation_period,
+            batch,
+        )
+        for line in replay.report(cycles, events, skipped):
+            print(line)
+        return
+
+    throttle = Throttle(args.escalation_limit, args.escalation_period)
+    if args.asyncio:
+        m = AsyncMonitor(
+            args.interval,
+            args.overrun,
+            args.budget,
+            args.timeout,
+            prune=not args.fetch_all,
+            throttle=throttle,
+            batch=batch,
+        )
+    elif args.shards > 0:
+        m = ShardedMonitor(
+            args.interval,
+            args.overrun,
+            args.budget,
+            args.workers,
+            prune=not args.fetch_all,
+            escalation_workers=args.escalation_workers,
+            timeout=args.timeout,
+            throttle=throttle,
+            batch=batch,
+            shards=args.shards,
+        )
+    else:
+        m = Monitor(
+            args.interval,
+            args.overrun,
+            args.budget,
+            args.workers,
+            prune=not args.fetch_all,
+            escalation_workers=args.escalation_workers,
+            timeout=args.timeout,
+            throttle=throttle,
+            batch=batch,
+        )
+    try:
+        for name, setting in configs:
             counts = m.load_json(setting)
-            logger.info(f"Loaded from '{file.name}'")
+            logger.info(f"Loaded from '{name}'")
             logger.info(f"Loaded {counts[0]} constants")
             logger.info(f"Loaded {counts[1]} variables")
             logger.info(f"Loaded {counts[2]} derivatives")
             logger.info(f"Loaded {counts[3]} incidents")
-    if args.verify:
-        m.verify()
-    else:
-        m.start()
+        if args.compile:
+            artifact.write(m, args.compile)
+        elif args.verify:
+            m.verify()
+        elif args.bench > 0:
+            for line in bench.report(bench.run(m, args.bench)):
+                print(line)
+        else:
+            m.set_reloader(reloader)
+            m.set_log_changes(args.log_changes)
+            if args.metrics:
+                m.add_sink(MetricsExporter(args.metrics))
+            if args.flight_recorder:
+                recorder = FlightRecorder(
+                    args.flight_recorder, args.flight_cycles, args.flight_files
+                )
+                m.set_flight_recorder(recorder)
+            if args.control:
+                m.add_sink(control.ControlServer(args.control))
+            if args.statsd:
+                m.add_sink(
+                    StatsdSink(
+                        args.statsd,
+                        args.statsd_prefix,
+                        args.statsd_include,
+                        args.statsd_tags,
+                    )
+                )
+            if args.shm:
+                m.add_sink(SharedSnapshot(args.shm, args.shm_slots))
+            if args.samples:
+                m.add_sink(
+                    JsonlSink(
+                        args.samples,
+                        args.samples_interval,
+                        fsync=args.samples_fsync,
+                        max_bytes=args.samples_max_bytes,
+                        backups=args.samples_backups,
+                    )
+                )
+            if args.store:
+                m.add_sink(store.ColumnStore(args.store, args.store_interval))
+            profiler = Profiler(args.profile_dir, args.tracemalloc)
+            m.set_profiler(profiler, max(1, args.profile))
+            if args.profile > 0:
+                profiler.arm(args.profile)
+            m.start()
+    finally:
+        # start() closes it too; early exits such as --bench close it here
+        m.close()
+
+
+def _read_json(path: str) -> Dict:
+    with open(path) as json_file:
+        return json.load(json_file)
 
 
 def main():
+    if sys.argv[1:2] == ["query"]:
+        store.main(sys.argv[2:])
+        return
+    if sys.argv[1:2] == ["ctl"]:
+        control.main(sys.argv[2:])
+        return
     args = parse_args()
+    listener = setup_logging(args)
     try:
         analyze(args)
     except KeyboardInterrupt:
@@ -153,6 +608,9 @@ def main():
             sys.exit(0)
         except SystemExit:
             os._exit(0)
+    finally:
+        if listener is not None:
+            listener.stop()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,96 @@
+# Copyright (c) 2022 Yoshihiro Ota <ota@j.email.ne.jp>
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+
+import base64
+import json
+import logging
+import marshal
+import sys
+from typing import Dict
+
+from . import expression, Incident, Monitor
+
+logger = logging.getLogger(__name__)
+
+FORMAT = 1
+
+
+def build(monitor: Monitor) -> Dict:
+    """
+    Returns an artifact of the configuration loaded to 'monitor'.
+    Variables carry resolved sysctl MIBs and formats and defer their first
+    values to the first cycle.  Expressions are stored compiled together
+    with identifiers they refer to.  Compiled code is only usable by the
+    same Python implementation and version given by "cache_tag".
+    """
+    expressions = {}
+    for expr in sorted(monitor.expressions()):
+        code = expression.template(expr)
+        expressions[expr] = {
+            "code": base64.b64encode(marshal.dumps(code)).decode(),
+            "names": sorted(expression.names(expr)),
+        }
+    return {
+        "format": FORMAT,
+        "cache_tag": sys.implementation.cache_tag,
+        "levels": Incident.levels,
+        "config": monitor.config(resolved=True),
+        "expressions": expressions,
+    }
+
+
+def write(monitor: Monitor, path: str) -> None:
+    with open(path, "w") as artifact:
+        json.dump(build(monitor), artifact, indent=2, sort_keys=True)
+    logger.info(f"Compiled configuration to '{path}'")
+
+
+def read(path: str) -> Dict:
+    """
+    Reads an artifact and returns its configuration to load.
+    Compiled expressions are taken as well.  The artifact must have been
+    compiled with the incident levels in use.
+    """
+    with open(path) as artifact:
+        data = json.load(artifact)
+    if data.get("format", None) != FORMAT:
+        raise Exception(f"Unsupported artifact format in '{path}'")
+    if data["levels"] != Incident.levels:
+        raise Exception(
+            f"'{path}' was compiled with levels {', '.join(data['levels'])}"
+            f" instead of {', '.join(Incident.levels)}"
+        )
+    expressions = data["expressions"]
+    if data["cache_tag"] == sys.implementation.cache_tag:
+        templates = {
+            expr: marshal.loads(base64.b64decode(e["code"]))
+            for expr, e in expressions.items()
+        }
+    else:
+        logger.warning(
+            f"'{path}' was compiled for {data['cache_tag']};"
+            f" expressions are compiled again"
+        )
+        templates = {}
+    expression.preload(templates, {e: v["names"] for e, v in expressions.items()})
+    return data["config"]
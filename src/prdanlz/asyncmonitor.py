@@ -0,0 +1,266 @@
+# Copyright (c) 2022 Yoshihiro Ota <ota@j.email.ne.jp>
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+
+import asyncio
+import logging
+import os
+import signal
+import threading
+import time
+from typing import Dict, List, Optional, Set
+
+from . import Incident, SyscmdVariable, Variable
+from .escalation import Batch, Throttle
+from .monitor import Monitor
+
+logger = logging.getLogger(__name__)
+
+
+async def _kill(proc: asyncio.subprocess.Process) -> None:
+    """
+    Kills a shell and commands it started; they are in their own session.
+    """
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+    await proc.wait()
+
+
+class AsyncMonitor(Monitor):
+    """
+    AsyncMonitor runs cycles in an asyncio event loop of a single thread.
+    System commands of variables and escalations run as subprocesses
+    without blocking the loop and each of them is given 'timeout' seconds.
+    A variable keeps its previous value when its command times out.
+    Other variables, such as sysctl, are fetched in the default executor
+    of the loop so that a slow one does not block the loop either.
+    Escalations of an incident run one after another in order while those
+    of different incidents run concurrently.
+    Exit status and output of escalations are logged as with Escalator.
+    Escalations still running at exit are awaited for 'timeout' seconds and
+    then cancelled.
+    """
+
+    def __init__(
+        self,
+        interval: float = -1,
+        overrun: str = "skip",
+        budget: Optional[float] = None,
+        timeout: Optional[float] = None,
+        prune: bool = False,
+        throttle: Optional[Throttle] = None,
+        batch: Optional[Batch] = None,
+    ):
+        super().__init__(
+            interval,
+            overrun,
+            budget,
+            prune=prune,
+            timeout=timeout,
+            throttle=throttle,
+            batch=batch,
+        )
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._stop: Optional[asyncio.Event] = None
+        self._tasks: Set[asyncio.Future] = set()
+        self._last_tasks: Dict[str, asyncio.Future] = {}
+
+    def exit(self, *args):
+        super().exit(*args)
+        if self._loop is not None and self._stop is not None:
+            self._loop.call_soon_threadsafe(self._stop.set)
+
+    def start(self) -> None:
+        self.fetch_constants()
+        self._schedule()
+
+        self._loop = asyncio.new_event_loop()
+        try:
+            self._loop.run_until_complete(self._arun())
+        finally:
+            self._loop.close()
+            self._loop = None
+            self.close()
+
+    async def _arun(self) -> None:
+        self._stop = asyncio.Event()
+        self._running = threading.Event()
+        if self._interval <= 0:
+            await self._acycle()
+        else:
+            loop = asyncio.get_event_loop()
+            start = loop.time()
+            tick = 0
+            while not self._stop.is_set():
+                deadline = start + tick * self._interval
+                now = loop.time()
+                if now < deadline:
+                    try:
+                        await asyncio.wait_for(self._stop.wait(), deadline - now)
+                        break
+                    except asyncio.TimeoutError:
+                        pass
+                    now = loop.time()
+
+                self._tick = tick
+                try:
+                    await self._acycle()
+                except Exception:
+                    # counted as an error of ("stage", "cycle") by its measure
+                    logger.exception(f"Cycle {tick} failed")
+                tick = self._next_tick(tick, start, deadline, now, loop.time())
+            logger.info(f"Cycle stats: {self._stats}")
+        await self._drain()
+
+    async def _drain(self) -> None:
+        if not self._tasks:
+            return
+        logger.info(f"Waiting for {len(self._tasks)} escalations")
+        done, pending = await asyncio.wait(self._tasks, timeout=self._timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.wait(pending)
+
+    async def _acycle(self) -> None:
+        if self._profiler is None or not self._profiler.begin(self._tick):
+            await self.afetch_and_evaluate()
+            return
+        try:
+            await self.afetch_and_evaluate()
+        finally:
+            self._profiler.end()
+
+    async def afetch_and_evaluate(self) -> None:
+        measure = self._timings.measure
+        with measure(("stage", "cycle")):
+            due, locals = self._prepare()
+            try:
+                with measure(("stage", "variables")):
+                    await self.afetch_variables(locals, due)
+                with measure(("stage", "derivatives")):
+                    self.evaludate_derivatives(locals, due)
+                with measure(("stage", "incidents")):
+                    self.evaluate_incidents(locals, due)
+            except IndexError:
+                pass
+            self._flush()
+            self._last = locals
+            self._publish(locals)
+
+    async def afetch_variables(self, locals: Dict, due: Optional[Set] = None) -> None:
+        variables = self._due_variables(due)
+        await self._afetch_all(locals, [v for v in variables if v.when is None])
+        guarded = [v for v in variables if v.when is not None]
+        if guarded:
+            await self._afetch_all(locals, self._guard(locals, guarded))
+
+    async def _afetch_all(self, locals: Dict, variables: List[Variable]) -> None:
+        fetched = await asyncio.gather(*[self._afetch(v) for v in variables])
+        self._fetched(locals, [v for v, ok in zip(variables, fetched) if ok])
+
+    async def _afetch(self, v: Variable) -> bool:
+        with self._timings.measure(("variable", v.name)):
+            return await self._afetch_value(v)
+
+    async def _afetch_value(self, v: Variable) -> bool:
+        if not isinstance(v, SyscmdVariable):
+            await asyncio.get_event_loop().run_in_executor(None, v.new_value)
+            return True
+        proc = await asyncio.create_subprocess_shell(
+            v.command, stdout=asyncio.subprocess.PIPE, start_new_session=True
+        )
+        try:
+            out, _ = await asyncio.wait_for(proc.communicate(), self._timeout)
+        except asyncio.TimeoutError:
+            await _kill(proc)
+            self._timings.error(("variable", v.name))
+            logger.error(f"'{v.name}' timed out after {self._timeout} seconds")
+            return False
+        v.store_value(out.decode().strip())
+        return True
+
+    def _dispatch(self, incident: Incident, level: str, cmd: str) -> None:
+        if self._handler is not None:
+            self._handler(incident, level, cmd)
+            return
+        previous = self._last_tasks.get(incident.name, None)
+        task = asyncio.ensure_future(self._aescalate(incident, level, cmd, previous))
+        self._tasks.add(task)
+        self._last_tasks[incident.name] = task
+        task.add_done_callback(lambda t: self._done(incident.name, t))
+
+    def _done(self, name: str, task: asyncio.Future) -> None:
+        self._tasks.discard(task)
+        if self._last_tasks.get(name, None) is task:
+            del self._last_tasks[name]
+
+    async def _aescalate(
+        self,
+        incident: Incident,
+        level: str,
+        cmd: str,
+        previous: Optional[asyncio.Future] = None,
+    ) -> None:
+        if previous is not None:
+            await asyncio.wait([previous])
+        key = ("escalation", incident.name)
+        start = time.monotonic()
+        proc = await asyncio.create_subprocess_shell(
+            cmd,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.STDOUT,
+            start_new_session=True,
+        )
+        try:
+            out, _ = await asyncio.wait_for(proc.communicate(), self._timeout)
+        except asyncio.TimeoutError:
+            await _kill(proc)
+            self._timings.error(key)
+            self._timings.record(key, time.monotonic() - start)
+            logger.error(
+                f"Escalation of '{incident.name}' at level={level} was killed"
+                f" after {self._timeout} seconds: [{cmd}]"
+            )
+            return
+        except asyncio.CancelledError:
+            await _kill(proc)
+            self._timings.error(key)
+            self._timings.record(key, time.monotonic() - start)
+            logger.error(
+                f"Escalation of '{incident.name}' at level={level} was cancelled:"
+                f" [{cmd}]"
+            )
+            raise
+        if proc.returncode != 0:
+            self._timings.error(key)
+        self._timings.record(key, time.monotonic() - start)
+        logger.info(
+            f"Escalation of '{incident.name}' at level={level} exited with"
+            f" {proc.returncode}: [{cmd}]"
+        )
+        if out:
+            logger.info(
+                f"Escalation of '{incident.name}' output: {out.decode().strip()}"
+            )
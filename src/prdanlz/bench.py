@@ -0,0 +1,190 @@
+# Copyright (c) 2022 Yoshihiro Ota <ota@j.email.ne.jp>
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+
+import argparse
+import json
+import random
+import resource
+import sys
+import time
+from typing import Dict, List, Optional
+
+from .incident import Incident
+from .monitor import Monitor
+from .timing import Histogram
+
+
+def generate(
+    variables: int,
+    derivatives: int,
+    incidents: int,
+    levels: Optional[List[str]] = None,
+    history: int = 0,
+    complexity: int = 2,
+    seed: int = 0,
+) -> Dict:
+    """
+    Returns a configuration of synthetic variables, derivatives, and
+    incidents.
+    Each derivative sums 'complexity' variables, and each trigger compares
+    a sum of 'complexity' variables and derivatives.
+    With 'history', variables keep that many values and expressions also
+    refer to previous values.
+    Escalations are shell no-ops.
+    """
+    if variables < 1:
+        raise ValueError("At least one variable is required")
+    levels = Incident.levels if levels is None else levels
+    rand = random.Random(seed)
+
+    config: Dict = {"variables": {}, "derivatives": {}, "incidents": {}}
+    names = []
+    for i in range(variables):
+        name = f"v{i}"
+        params: Dict = {"type": "synthetic", "synthetic": "random", "seed": i}
+        if history > 0:
+            params["history"] = history
+        config["variables"][name] = params
+        names.append(name)
+
+    def terms(operands: List[str], count: int) -> str:
+        picked = [rand.choice(operands) for _ in range(count)]
+        refs = []
+        for name in picked:
+            if history > 0 and name in config["variables"] and rand.random() < 0.5:
+                refs.append(f"{{{name}[-1]}}")
+            else:
+                refs.append(f"{{{name}}}")
+        return " + ".join(refs)
+
+    for i in range(derivatives):
+        config["derivatives"][f"d{i}"] = terms(names, complexity)
+    operands = names + list(config["derivatives"])
+
+    for i in range(incidents):
+        incident: Dict = {"description": f"synthetic incident {i}"}
+        for level in levels:
+            total = terms(operands, complexity)
+            # derivatives are sums of variables between 0 and 100
+            threshold = rand.uniform(0, 100 * complexity * complexity)
+            incident[level] = {
+                "trigger": f"{total} > {threshold:.1f}",
+                "untrigger": f"{total} <= {threshold:.1f}",
+                "escalation": ":",
+            }
+        config["incidents"][f"i{i}"] = incident
+    return config
+
+
+def run(monitor: Monitor, cycles: int, warmup: Optional[int] = None) -> Dict:
+    """
+    Runs 'warmup' and then 'cycles' cycles back to back without escalating
+    and returns latency percentiles in seconds, throughput in cycles per
+    second, and peak resident set size in kilobytes.
+    'warmup' defaults to the deepest history so that measured cycles have
+    previous values to evaluate.
+    """
+    if warmup is None:
+        depths = [
+            v.params.get("depth", None) or v.params.get("history", 0)
+            for v in monitor._variables
+        ]
+        warmup = max(depths + [0])
+    escalations = 0
+
+    def dispatch(incident, level, cmd) -> None:
+        nonlocal escalations
+        escalations += 1
+
+    monitor.set_escalation_handler(dispatch)
+    monitor.fetch_constants()
+    monitor._schedule()
+    for _ in range(warmup):
+        monitor.fetch_and_evaluate()
+    escalations = 0
+
+    latency = Histogram(max(1, cycles))
+    start = time.monotonic()
+    for _ in range(cycles):
+        began = time.monotonic()
+        monitor.fetch_and_evaluate()
+        latency.add(time.monotonic() - began)
+    seconds = time.monotonic() - start
+
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        rss //= 1024
+    return {
+        **latency.summary(),
+        "seconds": seconds,
+        "throughput": cycles / seconds if seconds > 0 else 0.0,
+        "escalations": escalations,
+        "peak_rss_kb": rss,
+    }
+
+
+def report(result: Dict) -> List[str]:
+    return [
+        f"cycles={result['count']} seconds={result['seconds']:.3f}"
+        f" throughput={result['throughput']:.1f}/s",
+        f"latency mean={result['mean']:.6f} p50={result['p50']:.6f}"
+        f" p95={result['p95']:.6f} p99={result['p99']:.6f} max={result['max']:.6f}",
+        f"escalations={result['escalations']} peak_rss={result['peak_rss_kb']}KB",
+    ]
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        prog="python -m prdanlz.bench",
+        description="generate a synthetic configuration for --bench",
+    )
+    parser.add_argument("--variables", type=int, default=100)
+    parser.add_argument("--derivatives", type=int, default=50)
+    parser.add_argument("--incidents", type=int, default=50)
+    parser.add_argument(
+        "--levels", type=str, nargs="+", default=["error", "warn", "info"]
+    )
+    parser.add_argument(
+        "--history", type=int, default=0, help="number of previous values to keep"
+    )
+    parser.add_argument(
+        "--complexity", type=int, default=2, help="number of terms per expression"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    config = generate(
+        args.variables,
+        args.derivatives,
+        args.incidents,
+        args.levels,
+        args.history,
+        args.complexity,
+        args.seed,
+    )
+    json.dump(config, sys.stdout, indent=1)
+    sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()
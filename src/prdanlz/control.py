@@ -0,0 +1,187 @@
+# Copyright (c) 2022 Yoshihiro Ota <ota@j.email.ne.jp>
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+
+import argparse
+import collections
+import fnmatch
+import json
+import logging
+import os
+import socket
+import socketserver
+import stat
+import sys
+import threading
+from typing import Any, Deque, Dict, List, Optional
+
+from .snapshot import Sink, Snapshot
+
+logger = logging.getLogger(__name__)
+
+
+def _encode(response: Dict) -> bytes:
+    return json.dumps(response, separators=(",", ":"), default=repr).encode() + b"\n"
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self) -> None:
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                query = json.loads(line)
+                if not isinstance(query, dict):
+                    raise ValueError("A query must be an object")
+                response = self.server.control.answer(query)
+            except Exception as e:
+                response = {"error": f"{type(e).__name__}: {e}"}
+            self.wfile.write(_encode(response))
+
+
+class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class ControlServer(Sink):
+    """
+    ControlServer answers queries of a line of JSON each with a line of
+    JSON on a Unix socket given by its path:
+    {"get": PATTERN} values of names matching the glob pattern,
+    {"levels": PATTERN} levels of incidents matching the pattern,
+    {"history": NAME, "last": N} times and values of the last N cycles, and
+    {"timings": KIND} timings of the kind, or all without one.
+    Answers are made from snapshots of ended cycles; cycles only replace
+    the latest reference and are never waited for.
+    Once timings are queried, they are summarized as each cycle ends so
+    that queries do not take the lock of timings from evaluation.
+    """
+
+    def __init__(self, path: str, history: int = 60):
+        self._path = path
+        self._snapshots: Deque[Snapshot] = collections.deque(maxlen=max(1, history))
+        self._timings = False
+        if os.path.exists(path) and stat.S_ISSOCK(os.stat(path).st_mode):
+            os.unlink(path)
+        self._server = _UnixServer(path, _Handler)
+        self._server.control = self
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name="prdanlz-control", daemon=True
+        )
+        self._thread.start()
+        logger.info(f"Answering queries on '{path}'")
+
+    def publish(self, snapshot: Snapshot) -> None:
+        if self._timings:
+            snapshot.timings  # summarized in the thread of evaluation
+        self._snapshots.append(snapshot)
+
+    def answer(self, query: Dict) -> Dict:
+        try:
+            snapshot = self._snapshots[-1]
+        except IndexError:
+            return {"error": "No cycle has ended yet"}
+        response: Dict[str, Any] = {"tick": snapshot.tick, "time": snapshot.time}
+        if "get" in query:
+            pattern = query["get"]
+            response["values"] = {
+                k: v
+                for k, v in snapshot.values.items()
+                if fnmatch.fnmatchcase(k, pattern)
+            }
+        elif "levels" in query:
+            pattern = query["levels"]
+            response["levels"] = {
+                k: v
+                for k, v in snapshot.levels.items()
+                if fnmatch.fnmatchcase(k, pattern)
+            }
+        elif "history" in query:
+            name = query["history"]
+            last = query.get("last", 10)
+            if type(last) is not int or last < 1:
+                raise ValueError(f"'last' must be a positive integer: {last!r}")
+            snapshots = list(self._snapshots)[-last:]
+            response["history"] = [
+                [s.time, s.values[name]] for s in snapshots if name in s.values
+            ]
+        elif "timings" in query:
+            self._timings = True
+            timings = snapshot.timings
+            kind = query["timings"]
+            response["timings"] = timings if kind is None else timings.get(kind, {})
+        else:
+            return {"error": "Unknown query"}
+        return response
+
+    def close(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+        if os.path.exists(self._path):
+            os.unlink(self._path)
+
+
+def query(path: str, queries: List[Dict]) -> List[Dict]:
+    """
+    Sends queries to a ControlServer at 'path' and returns the answers.
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+        s.connect(path)
+        s.sendall(b"".join(_encode(q) for q in queries))
+        s.shutdown(socket.SHUT_WR)
+        with s.makefile("rb") as f:
+            return [json.loads(line) for line in f]
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        prog="python -m prdanlz ctl",
+        description="query a running prdanlz started with --control",
+    )
+    parser.add_argument(
+        "-s", "--socket", dest="socket", type=str, required=True, help="socket path"
+    )
+    commands = parser.add_subparsers(dest="command")
+    commands.required = True
+    get = commands.add_parser("get", help="values of variables and derivatives")
+    get.add_argument("pattern", type=str, nargs="?", default="*")
+    levels = commands.add_parser("levels", help="levels of incidents")
+    levels.add_argument("pattern", type=str, nargs="?", default="*")
+    history = commands.add_parser("history", help="values of recent cycles")
+    history.add_argument("name", type=str)
+    history.add_argument("--last", dest="last", type=int, default=10)
+    timings = commands.add_parser("timings", help="timings of evaluations")
+    timings.add_argument("kind", type=str, nargs="?", default=None)
+    args = parser.parse_args(argv)
+
+    if args.command == "history":
+        request: Dict[str, Any] = {"history": args.name, "last": args.last}
+    elif args.command == "timings":
+        request = {"timings": args.kind}
+    else:
+        request = {args.command: args.pattern}
+    response = query(args.socket, [request])[0]
+    json.dump(response, sys.stdout, indent=1, default=repr)
+    sys.stdout.write("\n")
+    if "error" in response:
+        sys.exit(1)
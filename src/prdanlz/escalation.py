@@ -0,0 +1,277 @@
+# Copyright (c) 2022 Yoshihiro Ota <ota@j.email.ne.jp>
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+
+import collections
+import concurrent.futures
+import logging
+import os
+import shlex
+import signal
+import subprocess
+import threading
+import time
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+from .timing import Timings
+
+logger = logging.getLogger(__name__)
+
+
+class Escalator:
+    """
+    Escalator runs escalation commands in worker threads so that a slow
+    command does not hold back evaluation of incidents.
+    Commands of the same incident run one by one in the escalated order.
+    Each command is given 'timeout' seconds and then killed.
+    Exit status and output of commands are logged.
+    At most 'limit' commands wait to run; more are dropped.
+    Time taken and failures are recorded to 'timings' if given.
+    """
+
+    def __init__(
+        self,
+        workers: int = 4,
+        timeout: Optional[float] = None,
+        timings: Optional[Timings] = None,
+        limit: int = 1024,
+    ):
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            workers, thread_name_prefix="prdanlz-escalation"
+        )
+        self._timeout = timeout
+        self._timings = timings
+        self._limit = limit
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._queues: Dict[str, Deque[Tuple[str, str]]] = {}
+        self._pending = 0
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    def submit(self, incident, level: str, cmd: str) -> bool:
+        with self._lock:
+            if self._pending >= self._limit:
+                if self._timings is not None:
+                    self._timings.error(("escalation", incident.name))
+                logger.error(
+                    f"Dropped escalation of '{incident.name}' at level={level}"
+                    f" as {self._pending} escalations are pending: [{cmd}]"
+                )
+                return False
+            self._pending += 1
+            queue = self._queues.get(incident.name, None)
+            if queue is not None:  # a worker is running the incident's commands
+                queue.append((level, cmd))
+                return True
+            self._queues[incident.name] = collections.deque([(level, cmd)])
+        self._executor.submit(self._drain, incident.name)
+        return True
+
+    def _drain(self, name: str) -> None:
+        while True:
+            with self._lock:
+                queue = self._queues[name]
+                if not queue:
+                    del self._queues[name]
+                    return
+                level, cmd = queue.popleft()
+            start = time.monotonic()
+            status = None
+            try:
+                status = self.run(name, level, cmd)
+            except Exception as e:
+                logger.error(f"Escalation of '{name}' at level={level} failed: {e}")
+            if self._timings is not None:
+                key = ("escalation", name)
+                if status != 0:
+                    self._timings.error(key)
+                self._timings.record(key, time.monotonic() - start)
+            with self._lock:
+                self._pending -= 1
+                if self._pending == 0:
+                    self._idle.notify_all()
+
+    def run(self, name: str, level: str, cmd: str) -> Optional[int]:
+        proc = subprocess.Popen(
+            cmd,
+            shell=True,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            start_new_session=True,
+        )
+        try:
+            out, _ = proc.communicate(timeout=self._timeout)
+        except subprocess.TimeoutExpired:
+            # kill the shell and commands it started
+            os.killpg(proc.pid, signal.SIGKILL)
+            proc.communicate()
+            logger.error(
+                f"Escalation of '{name}' at level={level} was killed"
+                f" after {self._timeout} seconds: [{cmd}]"
+            )
+            return None
+        logger.info(
+            f"Escalation of '{name}' at level={level} exited with"
+            f" {proc.returncode}: [{cmd}]"
+        )
+        if out:
+            logger.info(f"Escalation of '{name}' output: {out.decode().strip()}")
+        return proc.returncode
+
+    def drain(self, timeout: Optional[float] = None) -> bool:
+        """
+        Waits for pending commands and returns False if they didn't finish
+        within 'timeout' seconds.
+        """
+        with self._idle:
+            return self._idle.wait_for(lambda: self._pending == 0, timeout)
+
+    def shutdown(self, timeout: Optional[float] = None) -> None:
+        if self._pending:
+            logger.info(f"Waiting for {self._pending} escalations")
+        if not self.drain(timeout):
+            logger.warning(f"Exiting with {self._pending} escalations pending")
+        self._executor.shutdown(wait=False)
+
+
+class TokenBucket:
+    """
+    TokenBucket allows 'count' events per 'period' seconds with bursts of
+    up to 'count' events.
+    """
+
+    def __init__(
+        self,
+        count: int,
+        period: float,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        if period <= 0:
+            raise ValueError(f"period must be positive: {period}")
+        self._capacity = float(count)
+        self._rate = count / period
+        self._tokens = float(count)
+        self._clock = clock
+        self._last = clock()
+
+    def take(self) -> bool:
+        now = self._clock()
+        self._tokens = min(
+            self._capacity, self._tokens + (now - self._last) * self._rate
+        )
+        self._last = now
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+
+class Throttle:
+    """
+    Throttle decides whether an escalation may run.
+    An escalation is suppressed when the same command ran within "dedup"
+    seconds of the incident, when the incident escalated more than
+    "rate_limit" times in "rate_period" seconds, or when all incidents
+    escalated more than 'limit' times in 'period' seconds.
+    """
+
+    def __init__(
+        self,
+        limit: Optional[int] = None,
+        period: float = 60,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self._clock = clock
+        self._bucket = TokenBucket(limit, period, clock) if limit else None
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._seen: Dict[Tuple[str, str, str], float] = {}
+
+    def admit(self, incident, level: str, cmd: str) -> bool:
+        now = self._clock()
+        key = (incident.name, level, cmd)
+        if incident.dedup and self._seen.get(key, 0) > now:
+            logger.info(
+                f"Suppressed duplicated escalation of '{incident.name}': [{cmd}]"
+            )
+            return False
+        if incident.rate_limit:
+            bucket = self._buckets.get(incident.name, None)
+            if bucket is None:
+                bucket = TokenBucket(
+                    incident.rate_limit, incident.rate_period, self._clock
+                )
+                self._buckets[incident.name] = bucket
+            if not bucket.take():
+                logger.warning(
+                    f"Rate limited escalation of '{incident.name}' at level={level}"
+                )
+                return False
+        if self._bucket is not None and not self._bucket.take():
+            logger.warning(
+                f"Rate limited escalation of '{incident.name}' at level={level} by global limit"
+            )
+            return False
+        if incident.dedup:
+            if len(self._seen) > 1024:
+                self._seen = {k: v for k, v in self._seen.items() if v > now}
+            self._seen[key] = now + incident.dedup
+        return True
+
+
+class Batch:
+    """
+    Batch collects escalations of incidents with "batch" in a cycle to run
+    them in one invocation.
+    Without 'command', collected commands run in one shell.
+    'command' is a template that takes {count} and {summary}, a quoted
+    string with a line of incident, level, and command per escalation;
+    other braces in it are left as they are for the shell.
+    """
+
+    name = "batch"
+
+    def __init__(self, command: Optional[str] = None):
+        self._command = command
+        self._items: List[Tuple[str, str, str]] = []
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def add(self, incident, level: str, cmd: str) -> None:
+        self._items.append((incident.name, level, cmd))
+
+    def flush(self) -> Optional[str]:
+        if not self._items:
+            return None
+        items, self._items = self._items, []
+        logger.info(
+            f"Batched {len(items)} escalations of"
+            f" {', '.join(f'{name}({level})' for name, level, _ in items)}"
+        )
+        if self._command is None:
+            return "\n".join(cmd for _, _, cmd in items)
+        summary = "\n".join(f"{name} {level}: {cmd}" for name, level, cmd in items)
+        cmd = self._command.replace("{count}", str(len(items)))
+        return cmd.replace("{summary}", shlex.quote(summary))
@@ -0,0 +1,174 @@
+# Copyright (c) 2022 Yoshihiro Ota <ota@j.email.ne.jp>
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+
+import http.server
+import logging
+import os
+import socketserver
+import stat
+import threading
+from typing import Any, Dict, List, Optional
+
+from .snapshot import flatten, Sink, Snapshot
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(**labels: str) -> str:
+    pairs = [f'{k}="{_escape(v)}"' for k, v in labels.items() if v != ""]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def render(snapshot: Snapshot) -> str:
+    """
+    Renders a snapshot in Prometheus text exposition format.
+    """
+    lines: List[str] = []
+
+    def family(name: str, kind: str, help: str) -> None:
+        lines.append(f"# HELP {name} {help}")
+        lines.append(f"# TYPE {name} {kind}")
+
+    family("prdanlz_value", "gauge", "Latest values of variables and derivatives")
+    for name in sorted(snapshot.values):
+        for key, number in flatten(snapshot.values[name]):
+            lines.append(f"prdanlz_value{_labels(name=name, key=key)} {number!r}")
+
+    family("prdanlz_triggered", "gauge", "1 if the level of the incident triggered")
+    for name in sorted(snapshot.levels):
+        for level, triggered in snapshot.levels[name].items():
+            labels = _labels(incident=name, level=level)
+            lines.append(f"prdanlz_triggered{labels} {int(triggered)}")
+
+    timings: Dict[str, Any] = dict(snapshot.timings)
+    cycles = timings.pop("cycles", {})
+    family("prdanlz_seconds", "summary", "Seconds taken by recent evaluations")
+    for kind, items in timings.items():
+        for name, item in items.items():
+            for quantile in ["p50", "p95", "p99"]:
+                labels = _labels(kind=kind, name=name, quantile=f"0.{quantile[1:]}")
+                lines.append(f"prdanlz_seconds{labels} {item[quantile]!r}")
+            labels = _labels(kind=kind, name=name)
+            total = item["mean"] * item["count"]
+            lines.append(f"prdanlz_seconds_sum{labels} {total!r}")
+            lines.append(f"prdanlz_seconds_count{labels} {item['count']}")
+    family("prdanlz_errors_total", "counter", "Errors of evaluations")
+    for kind, items in timings.items():
+        for name, item in items.items():
+            labels = _labels(kind=kind, name=name)
+            lines.append(f"prdanlz_errors_total{labels} {item['errors']}")
+
+    for key, help in [
+        ("cycles", "Cycles run"),
+        ("overruns", "Cycles over their budget"),
+        ("skipped", "Cycles skipped by overruns"),
+    ]:
+        family(f"prdanlz_{key}_total", "counter", help)
+        lines.append(f"prdanlz_{key}_total {cycles.get(key, 0)}")
+    family("prdanlz_snapshot_timestamp_seconds", "gauge", "When the cycle ended")
+    lines.append(f"prdanlz_snapshot_timestamp_seconds {snapshot.time!r}")
+    return "\n".join(lines) + "\n"
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self) -> None:
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = self.server.exporter.body()
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        logger.debug(format % args)
+
+
+class _TCPServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+
+
+class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class MetricsExporter(Sink):
+    """
+    MetricsExporter serves the latest snapshot in Prometheus text format at
+    "/metrics" on "host:port" or on a Unix socket given by its path.
+    The body is rendered by the first scrape after each cycle and served
+    from the cache afterwards, so scrapes do not fetch nor evaluate.
+    """
+
+    def __init__(self, address: str):
+        self._lock = threading.Lock()
+        self._snapshot: Optional[Snapshot] = None
+        self._body: Optional[bytes] = None
+        self._path: Optional[str] = None
+        if "/" in address:
+            self._path = address
+            if os.path.exists(address) and stat.S_ISSOCK(os.stat(address).st_mode):
+                os.unlink(address)
+            self._server = _UnixServer(address, _Handler)
+        else:
+            host, port = address.rsplit(":", 1)
+            self._server = _TCPServer((host, int(port)), _Handler)
+        self._server.exporter = self
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name="prdanlz-metrics", daemon=True
+        )
+        self._thread.start()
+        logger.info(f"Serving metrics on '{address}'")
+
+    @property
+    def address(self) -> Any:
+        return self._server.server_address
+
+    def publish(self, snapshot: Snapshot) -> None:
+        with self._lock:
+            self._snapshot = snapshot
+            self._body = None
+
+    def body(self) -> bytes:
+        with self._lock:
+            if self._body is None:
+                if self._snapshot is None:
+                    self._body = b""
+                else:
+                    self._body = render(self._snapshot).encode()
+            return self._body
+
+    def close(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+        if self._path is not None and os.path.exists(self._path):
+            os.unlink(self._path)
@@ -0,0 +1,113 @@
+# Copyright (c) 2022 Yoshihiro Ota <ota@j.email.ne.jp>
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+
+import ast
+import functools
+import re
+import string
+from types import CodeType
+from typing import Dict, FrozenSet, Iterable, Optional, Set
+
+_IDENTIFIER = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+_templates: Dict[str, CodeType] = {}
+_names: Dict[str, FrozenSet[str]] = {}
+
+
+def names(expr: str, known: Optional[Iterable[str]] = None) -> Set[str]:
+    """
+    Returns identifiers that appear in an expression or a template.
+    Identifiers inside string literals are also returned and thus the result
+    is a superset; narrow it down with 'known' names.
+    """
+    cached = _names.get(expr, None)
+    if cached is None:
+        cached = frozenset(_IDENTIFIER.findall(expr))
+        _names[expr] = cached
+    found = set(cached)
+    if known is not None:
+        found.intersection_update(known)
+    return found
+
+
+def fields(expr: str) -> Set[str]:
+    """
+    Returns names that replacement fields of a template refer to, such as
+    "load" of "{load[0]} > 4".
+    """
+    found: Set[str] = set()
+    try:
+        parsed = list(string.Formatter().parse(expr))
+    except ValueError:
+        return found
+    for _, field, _, _ in parsed:
+        if not field:
+            continue
+        try:
+            tree = ast.parse(field, mode="eval")
+        except SyntaxError:
+            continue
+        found.update(n.id for n in ast.walk(tree) if isinstance(n, ast.Name))
+    return found
+
+
+def template(expr: str) -> CodeType:
+    """
+    Returns code that renders an expression or a template as an f-string.
+    Each distinct text is compiled once and thus unchanged expressions are
+    not compiled again after reloading configuration.
+    """
+    code = _templates.get(expr, None)
+    if code is None:
+        code = compile(f'f"{expr}"', "<string>", "eval")
+        _templates[expr] = code
+    return code
+
+
+def retain(exprs: Iterable[str]) -> None:
+    """
+    Drops code and identifiers of expressions other than 'exprs', such as
+    those of a configuration replaced by reloading.
+    """
+    keep = set(exprs)
+    for cache in [_templates, _names]:
+        for expr in [e for e in cache if e not in keep]:
+            del cache[expr]
+
+
+def preload(
+    templates: Dict[str, CodeType], identifiers: Dict[str, Iterable[str]]
+) -> None:
+    """
+    Takes code and identifiers of expressions prepared in advance.
+    """
+    _templates.update(templates)
+    _names.update({expr: frozenset(found) for expr, found in identifiers.items()})
+
+
+@functools.lru_cache(maxsize=4096)
+def compiled(expr: str) -> CodeType:
+    """
+    Returns code of a rendered expression, which often repeats while values
+    stay the same.
+    """
+    return compile(expr, "<string>", "eval")
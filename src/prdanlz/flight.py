@@ -0,0 +1,86 @@
+# Copyright (c) 2022 Yoshihiro Ota <ota@j.email.ne.jp>
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+
+import collections
+import logging
+import os
+from typing import Deque, Optional
+
+from .jsonl import encode
+from .snapshot import Sink, Snapshot
+
+logger = logging.getLogger(__name__)
+
+
+class FlightRecorder(Sink):
+    """
+    FlightRecorder keeps the last 'cycles' snapshots encoded as lines of
+    JSON, as written by --samples, in memory.
+    When an incident escalates, they are written to a file under
+    'directory' before the escalation runs, and the cycle escalating is
+    appended to the file when it ends.
+    Only the last 'files' files written are kept; older ones are removed.
+    """
+
+    def __init__(self, directory: str, cycles: int = 60, files: int = 100):
+        self._directory = directory
+        self._ring: Deque[bytes] = collections.deque(maxlen=max(1, cycles))
+        self._dumped: Optional[int] = None
+        self._files: Deque[str] = collections.deque()
+        self._limit = max(1, files)
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, tick: int) -> str:
+        """
+        Returns the path of the file written when the cycle of 'tick'
+        escalates.
+        """
+        return os.path.join(self._directory, f"prdanlz-{os.getpid()}-{tick}.jsonl")
+
+    def dump(self, tick: int) -> str:
+        """
+        Writes recent cycles for the cycle of 'tick' once and returns the path.
+        """
+        path = self.path(tick)
+        if self._dumped != tick:
+            temporary = f"{path}.tmp"
+            with open(temporary, "wb") as f:
+                f.write(b"".join(self._ring))
+            os.replace(temporary, path)
+            self._dumped = tick
+            self._files.append(path)
+            while len(self._files) > self._limit:
+                old = self._files.popleft()
+                try:
+                    os.remove(old)
+                except OSError as e:
+                    logger.warning(f"Failed to remove '{old}': {e}")
+            logger.info(f"Recent {len(self._ring)} cycles are written to '{path}'")
+        return path
+
+    def publish(self, snapshot: Snapshot) -> None:
+        line = encode(snapshot)
+        if self._dumped == snapshot.tick:
+            with open(self.path(snapshot.tick), "ab") as f:
+                f.write(line)
+        self._ring.append(line)
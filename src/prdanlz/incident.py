@@ -21,9 +21,13 @@
 # OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
 # SUCH DAMAGE.
 
+import functools
 import os
 import logging
-from typing import Dict
+import time
+from typing import Callable, Dict, List, Optional
+
+from . import expression
 
 logger = logging.getLogger(__name__)
 
@@ -54,41 +58,87 @@ class Incident:
 
             self._triggered: bool = False
 
+        @property
+        def expressions(self) -> List[str]:
+            return [self._trigger, self._untrigger, self._escalation]
+
+        @property
+        def conditions(self) -> List[str]:
+            return [self._trigger, self._untrigger]
+
+        @property
+        def escalation(self) -> str:
+            return self._escalation
+
+        @property
+        def triggered(self) -> bool:
+            return self._triggered
+
+        @triggered.setter
+        def triggered(self, triggered: bool) -> None:
+            self._triggered = triggered
+
         def clear(self) -> None:
             self._triggered = False
 
-        def escalate_if_in_range(self, locals: Dict) -> bool:
+        def escalate_if_in_range(
+            self, locals: Dict, escalate: Optional[Callable[[str, str], None]] = None
+        ) -> bool:
             my_locals = {**locals, **self._vars}
-            logger.debug(f"Checking trigger='{self._trigger}' at level={self._level}")
-            expr = eval(f'f"{self._trigger}"', {"__builtins__": {}}, my_locals)
-            logger.debug(f"Resolved to expression='{expr}'")
-            if eval(expr, {"__builtins__": {}}, my_locals):
+            debug = logger.isEnabledFor(logging.DEBUG)
+            if debug:
+                logger.debug(
+                    "Checking trigger='%s' at level=%s", self._trigger, self._level
+                )
+            expr = eval(
+                expression.template(self._trigger), {"__builtins__": {}}, my_locals
+            )
+            if debug:
+                logger.debug("Resolved to expression='%s'", expr)
+            if eval(expression.compiled(expr), {"__builtins__": {}}, my_locals):
                 if not self._triggered:
-                    cmd = eval(f'f"{self._escalation}"', my_locals)
-                    logger.debug(f"Escalating at level={self._level} with cmd=[{cmd}]")
+                    cmd = eval(expression.template(self._escalation), my_locals)
+                    logger.debug(
+                        "Escalating at level=%s with cmd=[%s]", self._level, cmd
+                    )
                     self._triggered = True
-                    os.system(cmd)
+                    if escalate is None:
+                        os.system(cmd)
+                    else:
+                        escalate(self._level, cmd)
                 return True
             if self._triggered:
-                logger.debug(
-                    f"Checking untrigger='{self._untrigger}' at level='{self._level}"
+                if debug:
+                    logger.debug(
+                        "Checking untrigger='%s' at level='%s",
+                        self._untrigger,
+                        self._level,
+                    )
+                expr = eval(
+                    expression.template(self._untrigger),
+                    {"__builtins__": {}},
+                    my_locals,
                 )
-                expr = eval(f'f"{self._untrigger}"', {"__builtins__": {}}, my_locals)
-                logger.debug(f"Resolved to expression='{expr}'")
-                if eval(expr, {"__builtins__": {}}, my_locals):
+                if debug:
+                    logger.debug("Resolved to expression='%s'", expr)
+                if eval(expression.compiled(expr), {"__builtins__": {}}, my_locals):
                     self._triggered = False
-                    logger.debug(f"Untriggered at level={self._level}")
+                    logger.debug("Untriggered at level=%s", self._level)
                 else:
                     return True
             return False
 
         def verify(self, locals: Dict) -> None:
             my_locals = {**locals, **self._vars}
-            expr = eval(f'f"{self._trigger}"', {"__builtins__": {}}, my_locals)
+            expr = eval(
+                expression.template(self._trigger), {"__builtins__": {}}, my_locals
+            )
             logger.debug(f"Resolved '{self._trigger}' to trigger='{expr}'")
-            expr = eval(f'f"{self._untrigger}"', {"__builtins__": {}}, my_locals)
+            expr = eval(
+                expression.template(self._untrigger), {"__builtins__": {}}, my_locals
+            )
             logger.debug(f"Resolved '{self._untrigger}' to untrigger='{expr}'")
-            expr = eval(f'f"{self._escalation}"', my_locals)
+            expr = eval(expression.template(self._escalation), my_locals)
             logger.debug(f"Resolved '{self._escalation}' to escalation='{expr}'")
 
     def __init__(self, name: str, params: Dict):
@@ -118,7 +168,15 @@ class Incident:
             msg = f"One or more of {', '.join(l[:-1])} and/or {l[-1]} must be specified"
             raise Exception(msg)
         self._name: str = name
+        self._params: Dict = params
         self._vars: Dict = _clone_with_primitives(params)
+        self._interval: Optional[float] = params.get("interval", None)
+        self._rate_limit: Optional[int] = params.get("rate_limit", None)
+        self._rate_period: float = params.get("rate_period", 60)
+        if self._rate_period <= 0:
+            raise Exception(f"'rate_period' of '{name}' incident must be positive")
+        self._dedup: Optional[float] = params.get("dedup", None)
+        self._batch: bool = params.get("batch", False)
 
     def __hash__(self):
         return hash(self._name)
@@ -130,9 +188,87 @@ class Incident:
     def name(self) -> str:
         return self._name
 
-    def escalated(self, locals: Dict) -> bool:
+    @property
+    def params(self) -> Dict:
+        return self._params
+
+    @property
+    def interval(self) -> Optional[float]:
+        return self._interval
+
+    @property
+    def rate_limit(self) -> Optional[int]:
+        return self._rate_limit
+
+    @property
+    def rate_period(self) -> float:
+        return self._rate_period
+
+    @property
+    def dedup(self) -> Optional[float]:
+        return self._dedup
+
+    @property
+    def batch(self) -> bool:
+        return self._batch
+
+    @property
+    def expressions(self) -> List[str]:
+        exprs = []
+        for level in self._levels.values():
+            if level:
+                exprs.extend(level.expressions)
+        return exprs
+
+    @property
+    def conditions(self) -> List[str]:
+        exprs = []
+        for level in self._levels.values():
+            if level:
+                exprs.extend(level.conditions)
+        return exprs
+
+    @property
+    def escalations(self) -> List[str]:
+        return [level.escalation for level in self._levels.values() if level]
+
+    @property
+    def triggered_level(self) -> Optional[str]:
+        """
+        The highest level triggered, or None
+        """
+        for key in Incident.levels:
+            level = self._levels[key]
+            if level and level.triggered:
+                return key
+        return None
+
+    @property
+    def triggered(self) -> Dict[str, bool]:
+        return {key: level.triggered for key, level in self._levels.items() if level}
+
+    @triggered.setter
+    def triggered(self, triggered: Dict[str, bool]) -> None:
+        for key, value in triggered.items():
+            level = self._levels.get(key, None)
+            if level:
+                level.triggered = value
+
+    def escalated(
+        self,
+        locals: Dict,
+        escalate: Optional[Callable[["Incident", str, str], None]] = None,
+        record: Optional[Callable[[str, float], None]] = None,
+    ) -> bool:
+        """
+        Escalation commands are run with os.system unless 'escalate' is
+        given; it is called with the incident, the level, and the command.
+        'record' is called with each level evaluated and seconds taken.
+        """
         in_range = False
         my_locals = None
+        if escalate is not None:
+            escalate = functools.partial(escalate, self)
         for key in Incident.levels:  # be explicit about ordering
             level = self._levels[key]
             if level:
@@ -141,10 +277,20 @@ class Incident:
                 else:
                     if my_locals is None:
                         my_locals = {**locals, **self._vars}
-                    if level.escalate_if_in_range(my_locals):
+                    start = time.monotonic()
+                    if level.escalate_if_in_range(my_locals, escalate):
                         in_range = True
+                    if record is not None:
+                        record(key, time.monotonic() - start)
         return in_range
 
+    def render(self, level: str, locals: Dict) -> str:
+        """
+        Returns the escalation command of 'level' rendered with 'locals'.
+        """
+        my_locals = {**locals, **self._vars, **self._levels[level]._vars}
+        return eval(expression.template(self._levels[level].escalation), my_locals)
+
     def verify(self, locals: Dict) -> None:
         for key, level in self._levels.items():
             if level:
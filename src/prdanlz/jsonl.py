@@ -0,0 +1,141 @@
+# Copyright (c) 2022 Yoshihiro Ota <ota@j.email.ne.jp>
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+
+import json
+import logging
+import os
+import time
+from typing import Callable, List
+
+from .snapshot import Sink, Snapshot
+
+logger = logging.getLogger(__name__)
+
+
+def encode(snapshot: Snapshot) -> bytes:
+    """
+    Encodes a snapshot to a line of compact JSON with its time, tick,
+    values, and triggered levels of incidents.
+    """
+    record = {
+        "time": snapshot.time,
+        "tick": snapshot.tick,
+        "values": snapshot.values,
+        "levels": {
+            name: [level for level, triggered in levels.items() if triggered]
+            for name, levels in snapshot.levels.items()
+        },
+    }
+    line = json.dumps(record, separators=(",", ":"), default=repr)
+    return line.encode() + b"\n"
+
+
+class JsonlSink(Sink):
+    """
+    JsonlSink appends a line of JSON per cycle to a file.
+    Lines are buffered and written at once when 'buffer_size' bytes are
+    buffered or 'interval' seconds passed since the last write.
+    'fsync' is "never", "flush" to sync every write, or "rotate" to sync
+    only before rotation and closing.
+    With 'max_bytes', the file is renamed to ".1" when it grows larger and
+    up to 'backups' older files are kept.
+    """
+
+    fsyncs = ["never", "flush", "rotate"]
+
+    def __init__(
+        self,
+        path: str,
+        interval: float = 10,
+        buffer_size: int = 1 << 20,
+        fsync: str = "rotate",
+        max_bytes: int = 0,
+        backups: int = 5,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        if fsync not in JsonlSink.fsyncs:
+            raise ValueError(f"Unknown fsync policy '{fsync}'")
+        self._path = path
+        self._interval = interval
+        self._buffer_size = buffer_size
+        self._fsync = fsync
+        self._max_bytes = max_bytes
+        self._backups = backups
+        self._clock = clock
+        self._buffer: List[bytes] = []
+        self._buffered = 0
+        self._flushed = clock()
+        self._fd = self._open()
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    def _open(self) -> int:
+        return os.open(self._path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+
+    def publish(self, snapshot: Snapshot) -> None:
+        line = encode(snapshot)
+        self._buffer.append(line)
+        self._buffered += len(line)
+        if (
+            self._buffered >= self._buffer_size
+            or self._clock() - self._flushed >= self._interval
+        ):
+            self.flush()
+
+    def flush(self) -> None:
+        self._flushed = self._clock()
+        if not self._buffer:
+            return
+        data = b"".join(self._buffer)
+        self._buffer = []
+        self._buffered = 0
+        view = memoryview(data)
+        while view:
+            view = view[os.write(self._fd, view) :]
+        if self._fsync == "flush":
+            os.fsync(self._fd)
+        if self._max_bytes > 0 and os.fstat(self._fd).st_size >= self._max_bytes:
+            self._rotate()
+
+    def _rotate(self) -> None:
+        if self._fsync != "never":
+            os.fsync(self._fd)
+        os.close(self._fd)
+        if self._backups > 0:
+            for i in range(self._backups - 1, 0, -1):
+                older = f"{self._path}.{i}"
+                if os.path.exists(older):
+                    os.replace(older, f"{self._path}.{i + 1}")
+            os.replace(self._path, f"{self._path}.1")
+        else:
+            os.unlink(self._path)
+        self._fd = self._open()
+        logger.info(f"Rotated samples of '{self._path}'")
+
+    def close(self) -> None:
+        self.flush()
+        if self._fsync != "never":
+            os.fsync(self._fd)
+        os.close(self._fd)
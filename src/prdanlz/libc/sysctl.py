@@ -381,11 +381,20 @@ FMT2TCONV = {
 
 
 class Sysctl:
-    def __init__(self, name: str) -> None:
+    def __init__(
+        self,
+        name: str,
+        mib: typing.Optional[typing.List[int]] = None,
+        kind: typing.Optional[int] = None,
+        fmt: typing.Optional[str] = None,
+    ) -> None:
+        """
+        'mib', 'kind', and 'fmt' resolved earlier skip looking them up.
+        """
         self._name: str = name
-        self._mib: typing.List[int] = name2oid(name)
-        self._kind: typing.Optional[int] = None
-        self._fmt: typing.Optional[str] = None
+        self._mib: typing.List[int] = mib if mib else name2oid(name)
+        self._kind: typing.Optional[int] = kind
+        self._fmt: typing.Optional[str] = fmt
         self._tconv: typing.Optional[tconv.TypeConv] = None
         self._buflen: typing.Optional[int] = None
         self._description: typing.Optional[str] = None
@@ -394,6 +403,10 @@ class Sysctl:
     def name(self) -> str:
         return self._name
 
+    @property
+    def mib(self) -> typing.List[int]:
+        return self._mib
+
     @property
     def kind(self) -> int:
         if self._kind is None:
@@ -21,39 +21,324 @@
 # OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
 # SUCH DAMAGE.
 
+import concurrent.futures
 import copy
+import functools
 import logging
+import os
 import signal
 import threading
-from typing import Dict, Optional, Set, Tuple
+import time
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
 
-from . import Incident, instantiate_variable, Variable
+from . import expression, Incident, instantiate_variable, Variable
+from .escalation import Batch, Escalator, Throttle
+from .flight import FlightRecorder
+from .variable import LazyVariable
+from .profiler import Profiler
+from .schedule import CycleStats, Scheduler
+from .snapshot import Sink, Snapshot
+from .timing import Timings
 
 logger = logging.getLogger(__name__)
 
 
 class Monitor:
     _functions = {"__builtins__": {"abs": abs, "len": len, "max": max, "min": min}}
+    overruns = ["skip", "catch-up", "coalesce"]
 
-    def __init__(self, interval: float = -1):
+    def __init__(
+        self,
+        interval: float = -1,
+        overrun: str = "skip",
+        budget: Optional[float] = None,
+        workers: int = 1,
+        prune: bool = False,
+        escalation_workers: int = 0,
+        timeout: Optional[float] = None,
+        throttle: Optional[Throttle] = None,
+        batch: Optional[Batch] = None,
+    ):
+        if overrun not in Monitor.overruns:
+            raise ValueError(f"Unknown overrun policy '{overrun}'")
         self._interval = interval
+        self._overrun = overrun
+        self._budget = budget if budget else interval
+        self._stats = CycleStats()
+        self._timings = Timings()
+        self._prune = prune
+        self._timeout = timeout
+        self._escalator: Optional[Escalator] = None
+        if escalation_workers > 0:
+            self._escalator = Escalator(escalation_workers, timeout, self._timings)
+        self._throttle = throttle if throttle else Throttle()
+        self._batch = batch if batch is not None else Batch()
+        self._live: Set[str] = set()
+        self._lazy: List[Variable] = []
+        self._guards: Dict[str, str] = {}
+        self._executor: Optional[concurrent.futures.Executor] = None
+        if workers > 1:
+            self._executor = concurrent.futures.ThreadPoolExecutor(
+                workers, thread_name_prefix="prdanlz-fetch"
+            )
         self._constants: Set[Variable] = set()
         self._variables: Set[Variable] = set()
         self._derivatives: Dict[str, str] = {}
+        self._derivative_intervals: Dict[str, float] = {}
         self._incidents: Set[Incident] = set()
         self._locals: Dict[str, Any] = {}
+        self._last: Dict[str, Any] = {}
         self._running: Optional[Event] = None
+        self._scheduler: Optional[Scheduler] = None
+        self._tick = 0
+        self._dependents: Dict[str, Set[Tuple[str, str]]] = {}
+        self._stale: Set[Tuple[str, str]] = set()
+        self._reusable: Dict[Tuple[str, str], Any] = {}
+        self._staged: Optional[Monitor] = None
+        self._hungup = False
+        self._namespace: Dict[str, Any] = {}
+        self._reloader: Optional[Callable[[], List[Dict]]] = None
+        self._sinks: List[Sink] = []
+        self._profiler: Optional[Profiler] = None
+        self._logged: Optional[Dict[str, Any]] = None
+        self._flight: Optional[FlightRecorder] = None
+        self._handler: Optional[Callable[[Incident, str, str], None]] = None
 
         if self._interval > 0:
             signal.signal(signal.SIGINT, self.exit)
             signal.signal(signal.SIGTERM, self.exit)
+            signal.signal(signal.SIGUSR1, self._dump)
             logger.info(f"Monitoring is set for {interval} seconds.")
 
+    @property
+    def stats(self) -> CycleStats:
+        return self._stats
+
+    def set_profiler(self, profiler: Profiler, cycles: int = 1) -> None:
+        """
+        SIGUSR2 requests 'profiler' to profile next 'cycles' cycles.
+        """
+        self._profiler = profiler
+        if self._interval > 0:
+            signal.signal(signal.SIGUSR2, lambda *args: profiler.arm(cycles))
+
+    def set_log_changes(self, enabled: bool = True) -> None:
+        """
+        Values of variables and derivatives are logged only when they differ
+        from the values logged last.
+        """
+        self._logged = {} if enabled else None
+
+    def _changed(self, name: str, value: Any) -> bool:
+        if self._logged is None:
+            return True
+        if name in self._logged and self._logged[name] == value:
+            return False
+        self._logged[name] = value
+        return True
+
+    def add_sink(self, sink: Sink) -> None:
+        """
+        'sink' receives a snapshot at the end of every cycle.
+        """
+        self._sinks.append(sink)
+
+    def set_flight_recorder(self, recorder: FlightRecorder) -> None:
+        """
+        'recorder' receives snapshots and writes recent cycles before an
+        escalation; escalations refer to the file as {flight_record}, which
+        is empty without a recorder.
+        """
+        self._flight = recorder
+        self.add_sink(recorder)
+
+    def set_escalation_handler(
+        self, handler: Callable[[Incident, str, str], None]
+    ) -> None:
+        """
+        'handler' receives the incident, level, and command of escalations
+        admitted by the throttle instead of running them; batched ones come
+        with the batch as the incident and "batch" as the level.
+        """
+        self._handler = handler
+
+    def _flight_record(self, tick: int) -> str:
+        return "" if self._flight is None else self._flight.path(tick)
+
+    def _publish(self, locals: Dict) -> None:
+        if not self._sinks:
+            return
+        values = {}
+        for name, value in locals.items():
+            if name == "flight_record":
+                continue
+            if isinstance(value, LazyVariable):
+                if not value.fetched:
+                    continue
+                value = value.variable
+            if isinstance(value, Variable):
+                value = value.value
+            if value is not None:
+                values[name] = value
+        levels = {i.name: i.triggered for i in self._incidents}
+        snapshot = Snapshot(self._tick - 1, time.time(), values, levels, self.timings)
+        for sink in self._sinks:
+            try:
+                sink.publish(snapshot)
+            except Exception as e:
+                logger.error(f"Failed to publish to {type(sink).__name__}: {e}")
+
+    def timings(self) -> Dict[str, Dict]:
+        """
+        Returns histograms of seconds taken, in "count", "mean", "p50",
+        "p95", "p99", and "max", and counts of "errors" by "stage",
+        "variable", "derivative", "incident", "level", and "escalation",
+        and then by their names, together with "cycles" statistics.
+        """
+        return {**self._timings.summary(), "cycles": self._stats.summary()}
+
+    def _dump(self, *args) -> None:
+        logger.info(f"Cycle stats: {self._stats}")
+        for line in self._timings.report():
+            logger.info(f"Timing of {line}")
+
     def exit(self, *args):
         logger.info(f"Exiting")
         if self._running is not None:
             self._running.set()
 
+    def set_reloader(self, reloader: Callable[[], List[Dict]]) -> None:
+        """
+        'reloader' returns configurations to reload on SIGHUP.
+        """
+        self._reloader = reloader
+        if self._interval > 0:
+            signal.signal(signal.SIGHUP, self._hangup)
+
+    def _hangup(self, *args) -> None:
+        # read and staged by the next cycle, not in the signal handler
+        self._hungup = True
+
+    def _read_reloaded(self) -> None:
+        logger.info(f"Reloading configuration")
+        try:
+            configs = self._reloader()
+        except Exception as e:
+            logger.error(f"Failed to read configuration: {e}")
+            return
+        self.reload(configs)
+
+    def _empty(self) -> "Monitor":
+        """
+        Returns a monitor of the same class and settings without any
+        configuration to stage one in.
+        """
+        staged = copy.copy(self)
+        staged._constants = set()
+        staged._variables = set()
+        staged._derivatives = {}
+        staged._derivative_intervals = {}
+        staged._incidents = set()
+        staged._guards = {}
+        staged._reusable = {}
+        staged._staged = None
+        return staged
+
+    def reload(self, configs: List[Dict]) -> bool:
+        """
+        Stages 'configs' to replace the running configuration at the start
+        of the next cycle.  Variables and incidents with unchanged
+        configuration are carried over with their history and levels while
+        new or changed ones are instantiated.
+        An invalid configuration is not staged and False is returned.
+        """
+        staged = self._empty()
+        for v in self._constants | self._variables:
+            staged._reusable[("variable", v.name)] = v
+        for incident in self._incidents:
+            staged._reusable[("incident", incident.name)] = incident
+        try:
+            for json in configs:
+                staged.load_json(json)
+            staged._check_guards()
+            for expr in staged.expressions():
+                expression.template(expr)
+        except Exception as e:
+            logger.error(f"Not reloading invalid configuration: {e}")
+            return False
+        self._staged = staged
+        return True
+
+    def _apply(self, staged: "Monitor") -> None:
+        running = {id(x) for x in self._variables | self._incidents}
+        reused = [v for v in staged._variables if id(v) in running]
+        kept = [i for i in staged._incidents if id(i) in running]
+        carried = {id(v) for v in staged._constants | staged._variables}
+        for v in self._constants | self._variables:
+            if id(v) not in carried:
+                v.close()
+        self._constants = staged._constants
+        self._variables = staged._variables
+        self._derivatives = staged._derivatives
+        self._derivative_intervals = staged._derivative_intervals
+        self._incidents = staged._incidents
+        self._locals = {}
+        self.fetch_constants()
+        # drop values of removed or re-instantiated variables
+        current = {v.name: v for v in self._variables}
+        self._last = {
+            k: v
+            for k, v in self._last.items()
+            if k in self._derivatives or current.get(k, None) is v
+        }
+        tick = self._tick
+        self._schedule()
+        self._tick = tick
+        expression.retain(self.expressions())
+        logger.info(
+            f"Reloaded configuration keeping {len(reused)} of"
+            f" {len(self._variables)} variables and {len(kept)} of"
+            f" {len(self._incidents)} incidents"
+        )
+
+    def config(self, resolved: bool = False) -> Dict:
+        """
+        Returns the configuration merged from all of loaded JSON.
+        With 'resolved', variables carry what was looked up at startup and
+        defer their first values to the first cycle.
+        """
+        derivatives: Dict[str, Any] = {}
+        for name, expr in self._derivatives.items():
+            if name in self._derivative_intervals:
+                interval = self._derivative_intervals[name]
+                derivatives[name] = {"expression": expr, "interval": interval}
+            else:
+                derivatives[name] = expr
+        if resolved:
+            constants = {v.name: v.resolved() for v in self._constants}
+            variables = {
+                v.name: {**v.resolved(), "defer": True} for v in self._variables
+            }
+        else:
+            constants = {v.name: v.params for v in self._constants}
+            variables = {v.name: v.params for v in self._variables}
+        return {
+            "constants": constants,
+            "variables": variables,
+            "derivatives": derivatives,
+            "incidents": {i.name: i.params for i in self._incidents},
+        }
+
+    def expressions(self) -> Set[str]:
+        """
+        Returns all of expressions and templates to evaluate.
+        """
+        exprs = set(self._derivatives.values())
+        exprs.update(v.when for v in self._variables if v.when is not None)
+        for incident in self._incidents:
+            exprs.update(incident.expressions)
+        return exprs
+
     def load_json(self, json: Dict) -> Tuple[int, int, int, int]:
         constants = 0
         variables = 0
@@ -86,6 +371,12 @@ class Monitor:
                 if key in container:
                     raise Exception(f"Variable '{key}' already exists")
 
+            if isinstance(value, dict):
+                if "expression" not in value:
+                    raise Exception(f"'expression' is missing in '{key}' derivative")
+                if "interval" in value:
+                    self._derivative_intervals[key] = value["interval"]
+                value = value["expression"]
             self._derivatives[key] = value
             logger.info(f"Derivative '{key}' is configured")
             count += 1
@@ -94,7 +385,9 @@ class Monitor:
     def add_incidents(self, json: Dict) -> int:
         count = 0
         for key, json in json.items():
-            incident = Incident(key, json)
+            incident = self._reusable.get(("incident", key), None)
+            if incident is None or incident.params != json:
+                incident = Incident(key, json)
             if incident in self._incidents:
                 raise Exception(f"Incident '{key}' already exists")
             self._incidents.add(incident)
@@ -104,58 +397,420 @@ class Monitor:
 
     def start(self) -> None:
         self.fetch_constants()
+        self._schedule()
 
-        self.fetch_and_evaluate()
-        if self._interval > 0:
-            thread: threading.Thread = None
+        try:
+            if self._interval <= 0:
+                self._cycle()
+                return
             self._running = threading.Event()
+            worker = threading.Thread(target=self._run, name="prdanlz-monitor")
+            worker.start()
+            # the main thread stays here to receive signals
             while not self._running.wait(self._interval):
-                if thread:
-                    thread.join()
-                if not self._running.is_set():
-                    thread = threading.Thread(target=self.fetch_and_evaluate)
-                    thread.start()
+                pass
+            worker.join()
+            logger.info(f"Cycle stats: {self._stats}")
+        finally:
+            self.close()
 
-    def fetch_and_evaluate(self) -> None:
-        locals = copy.deepcopy(self._locals)
+    def close(self) -> None:
+        """
+        Waits for escalations running and closes sinks.  start() closes the
+        monitor when it returns; close it when cycles are run otherwise.
+        """
+        executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown()
+        escalator, self._escalator = self._escalator, None
+        if escalator is not None:
+            escalator.shutdown(self._timeout)
+        sinks, self._sinks = self._sinks, []
+        for sink in sinks:
+            sink.close()
+        for v in self._constants | self._variables:
+            v.close()
+
+    def _run(self) -> None:
+        """
+        Cycles are run at absolute deadlines of 'interval' apart from the
+        start and thus time taken by cycles does not accumulate.
+        When a cycle runs past next deadlines, the missed deadlines are
+        handled by the overrun policy.
+        "skip" drops them and waits for the next deadline.
+        "catch-up" runs all of them back to back.
+        "coalesce" runs one cycle immediately in place of them.
+        A cycle failing with an exception is logged and the next one runs.
+        """
+        start = time.monotonic()
+        tick = 0
+        while not self._running.is_set():
+            deadline = start + tick * self._interval
+            now = time.monotonic()
+            if now < deadline:
+                if self._running.wait(deadline - now):
+                    break
+                now = time.monotonic()
+
+            self._tick = tick
+            try:
+                self._cycle()
+            except Exception:
+                # counted as an error of ("stage", "cycle") by its measure
+                logger.exception(f"Cycle {tick} failed")
+            tick = self._next_tick(tick, start, deadline, now, time.monotonic())
+
+    def _cycle(self) -> None:
+        if self._profiler is None or not self._profiler.begin(self._tick):
+            self.fetch_and_evaluate()
+            return
         try:
-            self.fetch_variables(locals)
-            self.evaludate_derivatives(locals)
-            self.evaluate_incidents(locals)
-        except IndexError:
-            pass
+            self.fetch_and_evaluate()
+        finally:
+            self._profiler.end()
+
+    def _next_tick(
+        self, tick: int, start: float, deadline: float, began: float, finished: float
+    ) -> int:
+        """
+        Records the cycle of 'tick' and returns the tick of the next cycle
+        following the overrun policy.
+        """
+        duration = finished - began
+        if self._stats.record(began - deadline, duration, self._budget):
+            logger.warning(
+                f"Cycle {tick} took {duration:.3f} seconds"
+                f" over its budget of {self._budget} seconds"
+            )
+
+        tick += 1
+        passed = int((finished - start) // self._interval)
+        if passed >= tick:
+            if self._overrun == "skip":
+                self._stats.skipped += passed + 1 - tick
+                tick = passed + 1
+            elif self._overrun == "coalesce":
+                self._stats.skipped += passed - tick
+                tick = passed
+        return tick
+
+    def _prepare(self) -> Tuple[Set, Dict]:
+        """
+        Returns items due at this cycle and the namespace for the cycle.
+        The namespace starts with values of the previous cycle.
+        """
+        if self._hungup:
+            self._hungup = False
+            self._read_reloaded()
+        staged, self._staged = self._staged, None
+        if staged is not None:
+            self._apply(staged)
+        if self._scheduler is None:
+            self._schedule()
+        due = self._scheduler.due(self._tick)
+        self._tick += 1
+        locals = {**self._last, **copy.deepcopy(self._locals)}
+        locals["flight_record"] = self._flight_record(self._tick - 1)
+        for v in self._lazy:
+            locals[v.name] = LazyVariable(v)
+        self._namespace = locals
+        return (due, locals)
+
+    def fetch_and_evaluate(self) -> None:
+        measure = self._timings.measure
+        with measure(("stage", "cycle")):
+            due, locals = self._prepare()
+            try:
+                with measure(("stage", "variables")):
+                    self.fetch_variables(locals, due)
+                with measure(("stage", "derivatives")):
+                    self.evaludate_derivatives(locals, due)
+                with measure(("stage", "incidents")):
+                    self.evaluate_incidents(locals, due)
+            except IndexError:
+                pass
+            self._flush()
+            self._last = locals
+            self._publish(locals)
 
     def fetch_constants(self) -> None:
-        for v in self._constants:
-            self._locals[v.name] = v.value
-            logger.info(f"Constant '{v.name}' holds {v.value}")
+        with self._timings.measure(("stage", "constants")):
+            for v in self._constants:
+                self._locals[v.name] = v.value
+                logger.info(f"Constant '{v.name}' holds {v.value}")
 
-    def fetch_variables(self, locals: Dict) -> None:
-        for v in self._variables:
-            v.new_value()
-            locals[v.name] = v
-            logger.info(f"'{v.name}' is loaded and holds {v}")
+    def fetch_variables(self, locals: Dict, due: Optional[Set] = None) -> None:
+        """
+        Variables are fetched in the order of their names, or in parallel
+        when there are 2 or more workers.  Either way, they are put to
+        'locals' together after all of them are fetched.
+        Variables with "when" are fetched after others when their "when"
+        holds with the values fetched in this cycle.
+        """
+        variables = self._due_variables(due)
+        fetching = [v for v in variables if v.when is None]
+        self._fetch(fetching)
+        self._fetched(locals, fetching)
+        guarded = [v for v in variables if v.when is not None]
+        if guarded:
+            fetching = self._guard(locals, guarded)
+            self._fetch(fetching)
+            self._fetched(locals, fetching)
         logger.debug("Reloaded all variables")
 
-    def evaludate_derivatives(self, locals: Dict) -> None:
+    def _fetch(self, variables: List[Variable]) -> None:
+        if self._executor is None or len(variables) < 2:
+            for v in variables:
+                self._fetch_one(v)
+        else:
+            for _ in self._executor.map(self._fetch_one, variables):
+                pass
+
+    def _fetch_one(self, v: Variable) -> None:
+        with self._timings.measure(("variable", v.name)):
+            v.new_value()
+
+    def _due_variables(self, due: Optional[Set]) -> List[Variable]:
+        return sorted(
+            (v for v in self._variables if due is None or ("variable", v.name) in due),
+            key=lambda v: v.name,
+        )
+
+    def _fetched(self, locals: Dict, variables: List[Variable]) -> None:
+        locals.update({v.name: v for v in variables})
+        for v in variables:
+            self._refreshed(v.name)
+        if logger.isEnabledFor(logging.INFO):
+            for v in variables:
+                if self._changed(v.name, v.value):
+                    logger.info("'%s' is loaded and holds %s", v.name, v.value)
+
+    def _guard(self, locals: Dict, variables: List[Variable]) -> List[Variable]:
+        """
+        Returns variables whose "when" holds.  Others keep their previous
+        values, or None if never fetched.
+        """
+        passed = []
+        for v in variables:
+            locals.setdefault(v.name, v)
+            try:
+                expr = eval(expression.template(v.when), Monitor._functions, locals)
+                if eval(expression.compiled(expr), Monitor._functions, locals):
+                    passed.append(v)
+                    continue
+            except IndexError:
+                pass
+            except (NameError, TypeError) as e:
+                logger.debug("'when' of '%s' is taken as false: %s", v.name, e)
+            logger.debug("'%s' is not fetched as when='%s' is false", v.name, v.when)
+        return passed
+
+    def evaludate_derivatives(self, locals: Dict, due: Optional[Set] = None) -> None:
+        debug = logger.isEnabledFor(logging.DEBUG)
+        info = logger.isEnabledFor(logging.INFO)
         for v, expr in self._derivatives.items():
-            expr = eval(f'f"{expr}"', Monitor._functions, locals)
-            logger.debug(f"Resolved derivative={v} to expression='{expr}'")
-            value = eval(expr, Monitor._functions, locals)
+            key = ("derivative", v)
+            if due is not None and (key not in due or key not in self._stale):
+                continue
+            with self._timings.measure(("derivative", v)):
+                expr = eval(expression.template(expr), Monitor._functions, locals)
+                if debug:
+                    logger.debug("Resolved derivative=%s to expression='%s'", v, expr)
+                value = eval(expression.compiled(expr), Monitor._functions, locals)
             locals[v] = value
-            logger.info(f"'{v}' is calculated and holds '{value}'")
+            self._stale.discard(key)
+            self._refreshed(v)
+            if info and self._changed(v, value):
+                logger.info("'%s' is calculated and holds '%s'", v, value)
         logger.debug("Calculated all derivatives")
 
-    def evaluate_incidents(self, locals: Dict) -> None:
-        for incident in self._incidents:
-            logger.debug(f"Evaluating '{incident.name}' incident")
-            incident.escalated(locals)
+    def evaluate_incidents(self, locals: Dict, due: Optional[Set] = None) -> None:
+        debug = logger.isEnabledFor(logging.DEBUG)
+        for incident in self._due_incidents(due):
+            if debug:
+                logger.debug("Evaluating '%s' incident", incident.name)
+            record = functools.partial(self._record_level, incident.name)
+            with self._timings.measure(("incident", incident.name)):
+                incident.escalated(locals, self._escalate, record)
+            self._stale.discard(("incident", incident.name))
         logger.debug("Evaluated all incidents")
 
+    def _record_level(self, name: str, level: str, seconds: float) -> None:
+        self._timings.record(("level", f"{name}.{level}"), seconds)
+
+    def _due_incidents(self, due: Optional[Set]) -> List[Incident]:
+        """
+        Returns incidents due with any of their inputs refreshed.
+        """
+        incidents = []
+        for incident in self._incidents:
+            key = ("incident", incident.name)
+            if due is None or (key in due and key in self._stale):
+                incidents.append(incident)
+        return incidents
+
+    def _escalate(self, incident: Incident, level: str, cmd: str) -> None:
+        if not self._throttle.admit(incident, level, cmd):
+            return
+        if self._flight is not None:
+            try:
+                self._flight.dump(self._tick - 1)
+            except OSError as e:
+                logger.error(f"Failed to write recent cycles: {e}")
+                # escalates without the file
+                locals = {**self._namespace, "flight_record": ""}
+                cmd = incident.render(level, locals)
+        if incident.batch:
+            self._batch.add(incident, level, cmd)
+        else:
+            self._dispatch(incident, level, cmd)
+
+    def _flush(self) -> None:
+        try:
+            cmd = self._batch.flush()
+            if cmd:
+                self._dispatch(self._batch, "batch", cmd)
+        except Exception as e:
+            logger.error(f"Failed to run batched escalations: {e}")
+
+    def _dispatch(self, incident: Incident, level: str, cmd: str) -> None:
+        if self._handler is not None:
+            self._handler(incident, level, cmd)
+        elif self._escalator is None:
+            key = ("escalation", incident.name)
+            start = time.monotonic()
+            if os.system(cmd) != 0:
+                self._timings.error(key)
+            self._timings.record(key, time.monotonic() - start)
+        else:
+            self._escalator.submit(incident, level, cmd)
+
+    def _period(self, interval: Optional[float]) -> int:
+        if interval is None or self._interval <= 0:
+            return 1
+        return max(1, round(interval / self._interval))
+
+    def _schedule(self) -> None:
+        """
+        Each variable, derivative, and incident is scheduled at its own
+        "interval" rounded to a multiple of the monitor interval.
+        Derivatives and incidents are evaluated only when due and any of
+        their inputs have been refreshed since their last evaluation.
+        """
+        self._analyze()
+        self._scheduler = Scheduler()
+        self._tick = 0
+        for v in self._variables:
+            if v.name in self._live and v not in self._lazy:
+                self._scheduler.add(("variable", v.name), self._period(v.interval))
+        for name in self._derivatives:
+            if name in self._live:
+                interval = self._derivative_intervals.get(name, None)
+                self._scheduler.add(("derivative", name), self._period(interval))
+        for incident in self._incidents:
+            key = ("incident", incident.name)
+            self._scheduler.add(key, self._period(incident.interval))
+
+        known = {v.name for v in self._constants | self._variables}
+        known.update(self._derivatives)
+        self._dependents = {}
+        self._stale = set()
+        for name, expr in self._derivatives.items():
+            for input in expression.names(expr, known):
+                self._dependents.setdefault(input, set()).add(("derivative", name))
+            self._stale.add(("derivative", name))
+        for incident in self._incidents:
+            key = ("incident", incident.name)
+            for expr in incident.expressions:
+                for input in expression.names(expr, known):
+                    self._dependents.setdefault(input, set()).add(key)
+            self._stale.add(key)
+
+    def _analyze(self) -> None:
+        """
+        With 'prune', only variables and derivatives that incidents refer to
+        directly or through derivatives are fetched and calculated.
+        Variables referred only by escalations are fetched when an
+        escalation is rendered.
+        """
+        self._check_guards()
+        variables = {v.name for v in self._variables}
+        self._guards = {v.name: v.when for v in self._variables if v.when is not None}
+        if not self._prune:
+            self._live = variables | set(self._derivatives)
+            self._lazy = []
+            return
+
+        known = variables | set(self._derivatives)
+        conditions: Set[str] = set()
+        escalations: Set[str] = set()
+        for incident in self._incidents:
+            for expr in incident.conditions:
+                conditions.update(expression.names(expr, known))
+            for expr in incident.escalations:
+                escalations.update(expression.names(expr, known))
+
+        eager = self._closure(conditions, known)
+        # derivatives are calculated every cycle even for escalations
+        eager.update(self._closure(escalations - variables, known))
+        lazy = escalations - eager
+        self._live = eager | lazy
+        self._lazy = sorted(
+            (v for v in self._variables if v.name in lazy), key=lambda v: v.name
+        )
+        skipped = known - self._live
+        if skipped:
+            logger.warning(
+                f"Not fetching nor calculating what no incident refers to:"
+                f" {', '.join(sorted(skipped))}"
+            )
+        if self._lazy:
+            logger.info(
+                f"Fetching only when escalations refer to:"
+                f" {', '.join(v.name for v in self._lazy)}"
+            )
+
+    def _check_guards(self) -> None:
+        """
+        "when" is evaluated before derivatives are calculated and thus may
+        refer only to constants and variables.
+        """
+        known = {v.name for v in self._constants | self._variables}
+        known.update(Monitor._functions["__builtins__"])
+        for v in sorted(self._variables, key=lambda v: v.name):
+            if v.when is None:
+                continue
+            for name in sorted(expression.fields(v.when) - known):
+                if name in self._derivatives:
+                    raise Exception(
+                        f"'when' of '{v.name}' refers to derivative '{name}'"
+                    )
+                raise Exception(f"'when' of '{v.name}' refers to unknown '{name}'")
+
+    def _closure(self, names: Set[str], known: Set[str]) -> Set[str]:
+        found: Set[str] = set()
+        names = list(names)
+        while names:
+            name = names.pop()
+            if name not in found:
+                found.add(name)
+                if name in self._derivatives:
+                    names.extend(expression.names(self._derivatives[name], known))
+                elif name in self._guards:
+                    names.extend(expression.names(self._guards[name], known))
+        return found
+
+    def _refreshed(self, name: str) -> None:
+        dependents = self._dependents.get(name, None)
+        if dependents:
+            self._stale.update(dependents)
+
     def _parse_variables(self, json: Dict, container: Set) -> int:
         count = 0
         for key, json in json.items():
-            variable = instantiate_variable(key, json)
+            variable = self._reusable.get(("variable", key), None)
+            if variable is None or variable.params != json:
+                variable = instantiate_variable(key, json)
             for existing in [self._constants, self._variables, self._derivatives]:
                 if variable in existing:
                     raise Exception(f"Variable '{key}' already exists")
@@ -165,9 +820,11 @@ class Monitor:
         return count
 
     def verify(self) -> None:
+        self._check_guards()
         self.fetch_constants()
         self.fetch_variables(self._locals)
         self.evaludate_derivatives(self._locals)
+        self._locals["flight_record"] = self._flight_record(0)
 
         for incident in self._incidents:
             incident.verify(self._locals)
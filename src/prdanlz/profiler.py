@@ -0,0 +1,98 @@
+# Copyright (c) 2022 Yoshihiro Ota <ota@j.email.ne.jp>
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+
+import cProfile
+import logging
+import os
+import tracemalloc
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+class Profiler:
+    """
+    Profiler profiles as many cycles as requested with cProfile and writes
+    pstats of each cycle to 'directory'.  Only the thread running cycles
+    is profiled; fetches in worker threads are not.
+    With 'frames', allocations are traced with as many frames and those
+    left by each profiled cycle are written next to the pstats.
+    """
+
+    def __init__(self, directory: str, frames: int = 0):
+        self._directory = directory
+        self._frames = frames
+        self._remaining = 0
+        self._tick = 0
+        self._profile: Optional[cProfile.Profile] = None
+        self._previous: Optional[tracemalloc.Snapshot] = None
+
+    def arm(self, cycles: int) -> None:
+        """
+        Requests to profile next 'cycles' cycles.
+        """
+        self._remaining += cycles
+        logger.info(f"Profiling next {self._remaining} cycles")
+
+    def begin(self, tick: int) -> bool:
+        """
+        Starts profiling the cycle of 'tick' if requested.
+        """
+        if self._remaining <= 0:
+            return False
+        self._remaining -= 1
+        self._tick = tick
+        if self._frames and self._previous is None:
+            tracemalloc.start(self._frames)
+            self._previous = self._snapshot()
+        self._profile = cProfile.Profile()
+        self._profile.enable()
+        return True
+
+    def end(self) -> None:
+        self._profile.disable()
+        path = self._path("pstats")
+        self._profile.dump_stats(path)
+        self._profile = None
+        logger.info(f"Profile of cycle {self._tick} is written to '{path}'")
+        if self._previous is not None:
+            snapshot = self._snapshot()
+            stats = snapshot.compare_to(self._previous, "lineno")
+            self._previous = snapshot
+            path = self._path("tracemalloc")
+            with open(path, "w") as out:
+                for stat in stats[:100]:
+                    out.write(f"{stat}\n")
+            logger.info(f"Allocations of cycle {self._tick} are written to '{path}'")
+            if self._remaining <= 0:
+                tracemalloc.stop()
+                self._previous = None
+
+    def _path(self, suffix: str) -> str:
+        name = f"prdanlz-{os.getpid()}-{self._tick}.{suffix}"
+        return os.path.join(self._directory, name)
+
+    def _snapshot(self) -> tracemalloc.Snapshot:
+        return tracemalloc.take_snapshot().filter_traces(
+            [tracemalloc.Filter(False, tracemalloc.__file__)]
+        )
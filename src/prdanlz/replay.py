@@ -0,0 +1,235 @@
+# Copyright (c) 2022 Yoshihiro Ota <ota@j.email.ne.jp>
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+
+import copy
+import datetime
+import json
+import logging
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+from . import expression
+from .escalation import Batch, Throttle
+from .incident import Incident
+from .monitor import Monitor
+from .variable import Variable
+
+logger = logging.getLogger(__name__)
+
+# time, incident, level, "triggered", "untriggered", or "escalated", and
+# the command of escalations
+Event = Tuple[float, str, str, str, Optional[str]]
+
+
+class Recording:
+    """
+    Recording reads samples written by --samples a cycle at a time.
+    Lines which are not JSON, such as one cut by a crash, are skipped.
+    """
+
+    def __init__(self, paths: List[str]):
+        self._paths = paths
+        self._records = self._read(paths)
+        self.time = 0.0
+        self.values: Dict[str, Any] = {}
+        self.count = 0
+
+    def _read(self, paths: List[str]) -> Iterator[Dict]:
+        for path in paths:
+            with open(path, "rb") as f:
+                for number, line in enumerate(f, 1):
+                    if not line.strip():
+                        continue
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        logger.warning(f"Skipped line {number} of '{path}'")
+
+    def names(self) -> Set[str]:
+        """
+        Returns names of all values recorded, reading the recording through.
+        """
+        names: Set[str] = set()
+        for record in self._read(self._paths):
+            names.update(record["values"])
+        return names
+
+    def advance(self) -> bool:
+        """
+        Moves to the next cycle and returns False at the end.
+        """
+        record = next(self._records, None)
+        if record is None:
+            return False
+        self.time = record["time"]
+        self.values = record["values"]
+        self.count += 1
+        return True
+
+
+class RecordedVariable(Variable):
+    """
+    RecordedVariable stands in for a configured variable and takes its
+    values from a recording instead of fetching them.  A value missing
+    from a record, such as one not fetched in that cycle, keeps the last
+    recorded one; values not recorded yet are None.
+    """
+
+    def __init__(self, name: str, params: Dict, recording: Recording):
+        super().__init__(name, params.get("type", None), params)
+        self._recording = recording
+        if not self._deferred:
+            self._value = self._fetch_value()
+
+    def _fetch_value(self) -> Any:
+        return self._recording.values.get(self._name, self._value)
+
+
+def _without(configs: List[Dict], recorded: Set[str]) -> Dict[str, Set[str]]:
+    """
+    Removes derivatives and incidents whose conditions refer to variables
+    never recorded, directly or through derivatives, from 'configs'.
+    Returns names of incidents removed with the variables they lack.
+    """
+    variables = set()
+    derivatives = {}
+    for config in configs:
+        for section in ["constants", "variables"]:
+            variables.update(config.get(section, {}))
+        for name, value in config.get("derivatives", {}).items():
+            derivatives[name] = (
+                value["expression"] if isinstance(value, dict) else value
+            )
+    known = variables | set(derivatives)
+
+    # variables lacking in each derivative, through other derivatives
+    lacking = {name: {name} for name in variables - recorded}
+    changed = True
+    while changed:
+        changed = False
+        for name, expr in derivatives.items():
+            missing = set()
+            for input in expression.names(expr, known):
+                missing.update(lacking.get(input, set()))
+            if missing and missing != lacking.get(name, set()):
+                lacking[name] = missing
+                changed = True
+
+    skipped = {}
+    for config in configs:
+        for name in list(config.get("derivatives", {})):
+            if name in lacking:
+                del config["derivatives"][name]
+        for name, params in list(config.get("incidents", {}).items()):
+            missing = set()
+            for expr in Incident(name, params).conditions:
+                for input in expression.names(expr, known):
+                    missing.update(lacking.get(input, set()))
+            if missing:
+                del config["incidents"][name]
+                skipped[name] = missing
+    return skipped
+
+
+def replay(
+    configs: List[Dict],
+    paths: List[str],
+    limit: Optional[int] = None,
+    period: float = 60,
+    batch: Optional[Batch] = None,
+) -> Tuple[int, List[Event], Dict[str, Set[str]]]:
+    """
+    Evaluates derivatives and incidents of 'configs' on every cycle
+    recorded in 'paths' in order, as fast as possible.
+    Variables take recorded values, escalations are captured instead of
+    run, and throttling follows recorded times.
+    Incidents referring to variables not in the recording, such as those
+    not fetched by pruning when it was recorded, are skipped.
+    Returns the number of cycles, transitions of levels and escalations
+    in order, and incidents skipped with the variables they lack.
+    """
+    recording = Recording(paths)
+    configs = copy.deepcopy(configs)
+    skipped = _without(configs, recording.names())
+    for name, missing in sorted(skipped.items()):
+        logger.warning(
+            f"Skipping '{name}' as {', '.join(sorted(missing))} are not recorded"
+        )
+    if not recording.advance():
+        return (0, [], skipped)
+    throttle = Throttle(limit, period, lambda: recording.time)
+    monitor = Monitor(prune=True, throttle=throttle, batch=batch)
+    for config in configs:
+        for section in ["constants", "variables"]:
+            for name, params in config.get(section, {}).items():
+                variable = RecordedVariable(name, params, recording)
+                monitor._reusable[("variable", name)] = variable
+        monitor.load_json(config)
+
+    events: List[Event] = []
+
+    def dispatch(incident, level: str, cmd: str) -> None:
+        events.append((recording.time, incident.name, level, "escalated", cmd))
+
+    monitor.set_escalation_handler(dispatch)
+    monitor.fetch_constants()
+    levels = {i.name: dict(i.triggered) for i in monitor._incidents}
+    try:
+        while True:
+            escalated = len(events)
+            try:
+                monitor.fetch_and_evaluate()
+            except Exception:
+                logger.exception(f"Cycle at {recording.time} failed")
+            transitions: List[Event] = []
+            for incident in sorted(monitor._incidents, key=lambda i: i.name):
+                previous = levels[incident.name]
+                for level, triggered in incident.triggered.items():
+                    if triggered != previous.get(level, False):
+                        kind = "triggered" if triggered else "untriggered"
+                        transitions.append(
+                            (recording.time, incident.name, level, kind, None)
+                        )
+                levels[incident.name] = dict(incident.triggered)
+            events[escalated:escalated] = transitions
+            if not recording.advance():
+                return (recording.count, events, skipped)
+    finally:
+        monitor.close()
+
+
+def report(
+    cycles: int, events: List[Event], skipped: Optional[Dict[str, Set[str]]] = None
+) -> List[str]:
+    lines = []
+    for name, missing in sorted((skipped or {}).items()):
+        lines.append(
+            f"Skipped '{name}' which refers to what is not recorded:"
+            f" {', '.join(sorted(missing))}"
+        )
+    for time, incident, level, kind, cmd in events:
+        stamp = datetime.datetime.fromtimestamp(time).isoformat()
+        line = f"{stamp} '{incident}' {level} {kind}"
+        lines.append(f"{line}: [{cmd}]" if cmd is not None else line)
+    changes = sum(1 for e in events if e[3] != "escalated")
+    lines.append(f"Replayed {cycles} cycles with {changes} transitions")
+    return lines
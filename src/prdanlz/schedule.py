@@ -0,0 +1,117 @@
+# Copyright (c) 2022 Yoshihiro Ota <ota@j.email.ne.jp>
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+
+import heapq
+from typing import Any, Dict, List, Set, Tuple
+
+
+class Scheduler:
+    """
+    Scheduler tells which items are due at each tick of a monitor.
+    Every item is due at the first tick.  Then, an item with a period of
+    N ticks is due every N ticks.  Items sharing the same period are
+    staggered over the period so that they don't fall on the same tick.
+    """
+
+    def __init__(self) -> None:
+        self._heap: List[Tuple[int, int, Any, int, int]] = []
+        self._phases: Dict[int, int] = {}
+        self._seq = 0
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def add(self, item: Any, period: int = 1) -> None:
+        period = max(1, period)
+        phase = self._phases.get(period, 0)
+        self._phases[period] = (phase + 1) % period
+        heapq.heappush(self._heap, (0, self._seq, item, period, phase))
+        self._seq += 1
+
+    def due(self, tick: int) -> Set[Any]:
+        items = set()
+        heap = self._heap
+        while heap and heap[0][0] <= tick:
+            due, seq, item, period, phase = heapq.heappop(heap)
+            items.add(item)
+            if due == 0 and phase > 0:
+                due = phase
+            else:
+                due += period
+            if due <= tick:  # ticks were skipped
+                due += period * ((tick - due) // period + 1)
+            heapq.heappush(heap, (due, seq, item, period, phase))
+        return items
+
+
+class CycleStats:
+    """
+    CycleStats keeps how late cycles started against their deadlines and
+    how long they took.  A cycle longer than its budget is an overrun.
+    """
+
+    def __init__(self) -> None:
+        self.cycles = 0
+        self.overruns = 0
+        self.skipped = 0
+        self.lateness = 0.0
+        self.total_lateness = 0.0
+        self.max_lateness = 0.0
+        self.duration = 0.0
+        self.max_duration = 0.0
+
+    def __repr__(self) -> str:
+        return (
+            f"cycles={self.cycles} overruns={self.overruns} skipped={self.skipped}"
+            f" lateness(mean={self.mean_lateness:.6f} max={self.max_lateness:.6f})"
+            f" duration(last={self.duration:.6f} max={self.max_duration:.6f})"
+        )
+
+    def summary(self) -> Dict[str, float]:
+        return {
+            "cycles": self.cycles,
+            "overruns": self.overruns,
+            "skipped": self.skipped,
+            "mean_lateness": self.mean_lateness,
+            "max_lateness": self.max_lateness,
+            "duration": self.duration,
+            "max_duration": self.max_duration,
+        }
+
+    @property
+    def mean_lateness(self) -> float:
+        if self.cycles == 0:
+            return 0.0
+        return self.total_lateness / self.cycles
+
+    def record(self, lateness: float, duration: float, budget: float) -> bool:
+        self.cycles += 1
+        self.lateness = lateness
+        self.total_lateness += lateness
+        self.max_lateness = max(self.max_lateness, lateness)
+        self.duration = duration
+        self.max_duration = max(self.max_duration, duration)
+        if duration > budget:
+            self.overruns += 1
+            return True
+        return False
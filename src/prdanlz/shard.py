@@ -0,0 +1,304 @@
+# Copyright (c) 2022 Yoshihiro Ota <ota@j.email.ne.jp>
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+
+import logging
+import multiprocessing
+import pickle
+import time
+from multiprocessing.connection import Connection
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:  # before Python 3.8
+    shared_memory = None
+
+from . import expression, Incident, Variable
+from .escalation import Batch, Throttle
+from .monitor import Monitor
+
+logger = logging.getLogger(__name__)
+
+
+class Frozen:
+    """
+    A picklable copy of a variable with its value and historical values
+    which expressions access in the same way as the variable.
+    """
+
+    def __init__(self, variable: Variable):
+        self.value = variable.value
+        self._hist = None if variable._hist is None else list(variable._hist)
+
+    def __repr__(self) -> str:
+        return str(self.value)
+
+    def __getitem__(self, key) -> Any:
+        if self._hist is not None:
+            return self._hist[key]
+        return self.value[key]
+
+    @property
+    def last_value(self) -> Any:
+        return self._hist[-1] if self._hist else None
+
+    @property
+    def oldest_value(self) -> Any:
+        return self._hist[0] if self._hist else None
+
+
+def partition(
+    incidents: Dict[str, Set[str]], shards: int
+) -> List[Tuple[List[str], Set[str]]]:
+    """
+    Splits incidents, given with names they refer to, into at most 'shards'
+    shards of about the same number of incidents.  An incident goes to the
+    shard that shares the most names with it so that each shard receives
+    fewer values.  Returns incidents and names of each shard.
+    """
+    capacity = -(-len(incidents) // shards) if incidents else 0
+    parts: List[Tuple[List[str], Set[str]]] = [([], set()) for _ in range(shards)]
+    for name in sorted(incidents, key=lambda n: (-len(incidents[n]), n)):
+        names = incidents[name]
+        part = max(
+            (p for p in parts if len(p[0]) < capacity),
+            key=lambda p: (len(names & p[1]), -len(p[0])),
+        )
+        part[0].append(name)
+        part[1].update(names)
+    return [p for p in parts if p[0]]
+
+
+class Shard:
+    """
+    A worker process evaluating a part of incidents.  Values are passed
+    through a shared memory segment which grows as needed.
+    """
+
+    def __init__(
+        self,
+        context: multiprocessing.context.BaseContext,
+        incidents: List[Incident],
+        names: Set[str],
+    ):
+        self.incidents = {i.name: i for i in incidents}
+        self.names = names
+        self._shm: Optional[Any] = None
+        self._conn, child = context.Pipe()
+        params = {i.name: i.params for i in incidents}
+        states = {i.name: i.triggered for i in incidents}
+        self._process = context.Process(
+            target=_work,
+            args=(child, Incident.levels, params, states),
+            name="prdanlz-shard",
+            daemon=True,
+        )
+        self._process.start()
+        child.close()
+
+    def send(self, locals: Dict, names: List[str]) -> None:
+        snapshot = {}
+        for name in self.names:
+            if name in locals:
+                value = locals[name]
+                snapshot[name] = Frozen(value) if isinstance(value, Variable) else value
+        data = pickle.dumps(snapshot, pickle.HIGHEST_PROTOCOL)
+        if self._shm is None or self._shm.size < len(data):
+            self._release()
+            self._shm = shared_memory.SharedMemory(
+                create=True, size=max(1 << 16, 2 * len(data))
+            )
+        self._shm.buf[: len(data)] = data
+        self._conn.send((self._shm.name, len(data), names))
+
+    def receive(self) -> Tuple[Dict, List, Dict, Optional[Exception]]:
+        return self._conn.recv()
+
+    def close(self) -> None:
+        try:
+            self._conn.send(None)
+        except OSError:
+            pass
+        self._process.join()
+        self._conn.close()
+        self._release()
+
+    def _release(self) -> None:
+        if self._shm is not None:
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
+
+
+def _work(conn: Connection, levels: List[str], params: Dict, states: Dict) -> None:
+    """
+    Evaluates incidents of a shard with values sent for each cycle and
+    returns level transitions, escalations rendered, and seconds taken by
+    each incident.
+    """
+    Incident.levels = levels
+    incidents = {name: Incident(name, p) for name, p in params.items()}
+    for name, triggered in states.items():
+        incidents[name].triggered = triggered
+    shm = None
+    escalations: List[Tuple[str, str, str]] = []
+
+    def escalate(incident: Incident, level: str, cmd: str) -> None:
+        escalations.append((incident.name, level, cmd))
+
+    while True:
+        message = conn.recv()
+        if message is None:
+            break
+        name, size, names = message
+        if shm is None or shm.name != name:
+            if shm is not None:
+                shm.close()
+            shm = shared_memory.SharedMemory(name)
+        locals = pickle.loads(shm.buf[:size])
+        transitions = {}
+        durations = {}
+        error = None
+        for name in names:
+            incident = incidents[name]
+            before = incident.triggered
+            start = time.monotonic()
+            try:
+                incident.escalated(locals, escalate)
+            except Exception as e:
+                error = e
+                break
+            finally:
+                durations[name] = time.monotonic() - start
+            if incident.triggered != before:
+                transitions[name] = incident.triggered
+        conn.send((transitions, escalations, durations, error))
+        escalations.clear()
+    if shm is not None:
+        shm.close()
+    conn.close()
+
+
+class ShardedMonitor(Monitor):
+    """
+    ShardedMonitor evaluates incidents in 'shards' worker processes.
+    Variables are fetched and derivatives are calculated once in this
+    process; each shard receives values of what its incidents refer to.
+    Escalations rendered by shards run in this process.
+    """
+
+    def __init__(
+        self,
+        interval: float = -1,
+        overrun: str = "skip",
+        budget: Optional[float] = None,
+        workers: int = 1,
+        prune: bool = False,
+        escalation_workers: int = 0,
+        timeout: Optional[float] = None,
+        throttle: Optional[Throttle] = None,
+        batch: Optional[Batch] = None,
+        shards: int = 2,
+    ):
+        if shared_memory is None:
+            raise Exception("Sharding requires Python 3.8 or later")
+        super().__init__(
+            interval,
+            overrun,
+            budget,
+            workers,
+            prune=prune,
+            escalation_workers=escalation_workers,
+            timeout=timeout,
+            throttle=throttle,
+            batch=batch,
+        )
+        self._shards_count = shards
+        self._shards: List[Shard] = []
+        self._context = multiprocessing.get_context("spawn")
+
+    def close(self) -> None:
+        self._close_shards()
+        super().close()
+
+    def _close_shards(self) -> None:
+        for shard in self._shards:
+            shard.close()
+        self._shards = []
+
+    def _analyze(self) -> None:
+        """
+        Variables referred only by escalations are fetched every cycle as
+        shards cannot fetch them on demand.
+        """
+        super()._analyze()
+        self._lazy = []
+
+    def _schedule(self) -> None:
+        super()._schedule()
+        self._close_shards()
+        known = {v.name for v in self._constants | self._variables}
+        known.update(self._derivatives)
+        known.add("flight_record")
+        refers = {}
+        for incident in self._incidents:
+            names: Set[str] = set()
+            for expr in incident.expressions:
+                names.update(expression.names(expr, known))
+            refers[incident.name] = names
+        incidents = {i.name: i for i in self._incidents}
+        for names, shared in partition(refers, self._shards_count):
+            shard = Shard(self._context, [incidents[n] for n in names], shared)
+            self._shards.append(shard)
+            logger.info(f"Shard of {len(names)} incidents is started")
+
+    def evaluate_incidents(self, locals: Dict, due: Optional[Set] = None) -> None:
+        if not self._shards:
+            super().evaluate_incidents(locals, due)
+            return
+        due_names = {i.name for i in self._due_incidents(due)}
+        sent = []
+        for shard in self._shards:
+            names = sorted(n for n in shard.incidents if n in due_names)
+            if names:
+                shard.send(locals, names)
+                sent.append((shard, names))
+        for shard, names in sent:
+            transitions, escalations, durations, failed = shard.receive()
+            for name, seconds in durations.items():
+                self._timings.record(("incident", name), seconds)
+            for name, triggered in transitions.items():
+                shard.incidents[name].triggered = triggered
+                logger.debug("'%s' incident moved to %s", name, triggered)
+            for name, level, cmd in escalations:
+                self._escalate(shard.incidents[name], level, cmd)
+            evaluated = len(durations) if failed is None else len(durations) - 1
+            for name in names[:evaluated]:
+                self._stale.discard(("incident", name))
+            if failed is None or isinstance(failed, IndexError):
+                continue
+            # the rest of the shard stays stale to be evaluated again
+            logger.error(f"'{names[evaluated]}' incident failed in a shard: {failed!r}")
+            for name in names[evaluated:]:
+                self._timings.error(("incident", name))
+        logger.debug("Evaluated all incidents")
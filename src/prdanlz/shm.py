@@ -0,0 +1,284 @@
+# Copyright (c) 2022 Yoshihiro Ota <ota@j.email.ne.jp>
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+
+import logging
+import math
+import os
+import struct
+import time
+from typing import Dict, List, Optional, Tuple
+
+try:
+    from multiprocessing import resource_tracker, shared_memory
+except ImportError:  # before Python 3.8
+    shared_memory = None
+
+from .snapshot import flatten, Sink, Snapshot
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"PRDANLZ1"
+# magic, generation, tick, time, slots used, slots, bytes of names, layout,
+# process id of the writer
+HEADER = struct.Struct("<8sQqdIIIII")
+GENERATION = struct.Struct("<Q")
+HEADER_SIZE = 64
+NAME_SIZE = 64
+
+
+def _alive(pid: int) -> bool:
+    if pid <= 0:  # not recorded
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:  # of another user
+        pass
+    return True
+
+
+def _offsets(slots: int) -> Tuple[int, int, int]:
+    """
+    Returns offsets of names and values, and the size of a segment.
+    """
+    names = HEADER_SIZE
+    values = names + slots * NAME_SIZE
+    return (names, values, values + slots * 8)
+
+
+class SharedSnapshot(Sink):
+    """
+    SharedSnapshot publishes numbers of the latest snapshot to a named
+    shared memory segment so that local processes read them with
+    SnapshotReader without system calls.
+    Each series, a name of a value followed by keys of numbers in
+    structures as in flatten(), or "triggered.incident.level", keeps its
+    slot of a double; series missing in a cycle are NaN.
+    A generation counter is odd while a cycle is written so that readers
+    retry torn reads, a seqlock.
+    A segment of the name is replaced only when it was left behind by a
+    process which no longer runs.
+    """
+
+    def __init__(self, name: str = "prdanlz", slots: int = 4096):
+        if shared_memory is None:
+            raise Exception("Shared snapshots require Python 3.8 or later")
+        _, values, size = _offsets(slots)
+        try:
+            self._shm = shared_memory.SharedMemory(name, create=True, size=size)
+        except FileExistsError:
+            self._replace(name)
+            self._shm = shared_memory.SharedMemory(name, create=True, size=size)
+        self._slots: Dict[str, int] = {}
+        self._capacity = slots
+        self._names = b""
+        self._layout = 0
+        self._generation = 0
+        self._full = False
+        self._values = self._shm.buf[values : values + slots * 8].cast("d")
+        self._write(0, 0.0)
+        logger.info(f"Publishing snapshots to shared memory '{name}'")
+
+    @staticmethod
+    def _replace(name: str) -> None:
+        """
+        Removes a segment left behind by a writer which no longer runs.
+        """
+        stale = shared_memory.SharedMemory(name)
+        try:
+            if stale.size < HEADER.size or stale.buf[:8] != MAGIC:
+                owner = "another program"
+            else:
+                pid = HEADER.unpack_from(stale.buf, 0)[8]
+                owner = f"process {pid}" if _alive(pid) else ""
+            if owner:
+                # or the segment is unlinked when this process exits
+                resource_tracker.unregister(stale._name, "shared_memory")
+                raise Exception(f"Shared memory '{name}' is used by {owner}")
+            logger.warning(f"Replacing shared memory '{name}' left behind")
+            stale.unlink()
+        finally:
+            stale.close()
+
+    @property
+    def name(self) -> str:
+        return self._shm.name
+
+    def _write(self, tick: int, time: float) -> None:
+        HEADER.pack_into(
+            self._shm.buf,
+            0,
+            MAGIC,
+            self._generation,
+            tick,
+            time,
+            len(self._slots),
+            self._capacity,
+            len(self._names),
+            self._layout,
+            os.getpid(),
+        )
+
+    def _add(self, series: str) -> None:
+        name = series.encode()
+        offset = HEADER_SIZE + len(self._names)
+        if (
+            len(self._slots) == self._capacity
+            or offset + len(name) + 1 > HEADER_SIZE + self._capacity * NAME_SIZE
+        ):
+            if not self._full:
+                logger.warning(f"No slot for '{series}' and following series")
+                self._full = True
+            return
+        self._shm.buf[offset : offset + len(name) + 1] = name + b"\n"
+        self._names += name + b"\n"
+        self._slots[series] = len(self._slots)
+        self._layout += 1
+
+    def publish(self, snapshot: Snapshot) -> None:
+        numbers: Dict[str, float] = {}
+        for name, value in snapshot.values.items():
+            for key, number in flatten(value):
+                numbers[f"{name}.{key}" if key else name] = number
+        for name, levels in snapshot.levels.items():
+            for level, triggered in levels.items():
+                numbers[f"triggered.{name}.{level}"] = float(triggered)
+
+        self._generation += 1
+        GENERATION.pack_into(self._shm.buf, 8, self._generation)
+        for series in numbers:
+            if series not in self._slots:
+                self._add(series)
+        values = self._values
+        for series, slot in self._slots.items():
+            values[slot] = numbers.get(series, math.nan)
+        self._generation += 1
+        self._write(snapshot.tick, snapshot.time)
+
+    def close(self) -> None:
+        self._values.release()
+        self._shm.close()
+        self._shm.unlink()
+
+
+class SnapshotReader:
+    """
+    SnapshotReader reads numbers published by SharedSnapshot of another
+    process directly from the shared memory.
+    """
+
+    def __init__(self, name: str = "prdanlz", retries: int = 1000):
+        if shared_memory is None:
+            raise Exception("Shared snapshots require Python 3.8 or later")
+        try:
+            self._shm = shared_memory.SharedMemory(name, track=False)
+        except TypeError:  # before Python 3.13
+            self._shm = shared_memory.SharedMemory(name)
+            # or the segment is unlinked when this process exits
+            resource_tracker.unregister(self._shm._name, "shared_memory")
+        header = HEADER.unpack_from(self._shm.buf, 0)
+        if header[0] != MAGIC:
+            self._shm.close()
+            raise Exception(f"'{name}' is not a snapshot of prdanlz")
+        _, values, _ = _offsets(header[5])
+        self._values = self._shm.buf[values : values + header[5] * 8].cast("d")
+        self._retries = retries
+        self._layout = -1
+        self._slots: Dict[str, int] = {}
+
+    def _begin(self) -> int:
+        for _ in range(self._retries):
+            generation = GENERATION.unpack_from(self._shm.buf, 8)[0]
+            if generation % 2 == 0:
+                return generation
+            time.sleep(0)
+        raise TimeoutError("Snapshot is being written for too long")
+
+    def _consistent(self, generation: int) -> bool:
+        return GENERATION.unpack_from(self._shm.buf, 8)[0] == generation
+
+    def _index(self) -> None:
+        """
+        Reloads names of slots when series are added.
+        """
+        while True:
+            generation = self._begin()
+            header = HEADER.unpack_from(self._shm.buf, 0)
+            if header[7] == self._layout:
+                return
+            names = bytes(self._shm.buf[HEADER_SIZE : HEADER_SIZE + header[6]])
+            if self._consistent(generation):
+                break
+        self._slots = {n: i for i, n in enumerate(names.decode().splitlines())}
+        self._layout = header[7]
+
+    def series(self) -> List[str]:
+        self._index()
+        return list(self._slots)
+
+    def get(self, series: str) -> Optional[float]:
+        """
+        Returns the latest number of 'series', or None if not published.
+        """
+        slot = self._slots.get(series, None)
+        if slot is None:
+            self._index()
+            slot = self._slots.get(series, None)
+            if slot is None:
+                return None
+        for _ in range(self._retries):
+            generation = self._begin()
+            value = self._values[slot]
+            if self._consistent(generation):
+                return value
+        raise TimeoutError("Snapshot is being written for too long")
+
+    def read(self) -> Tuple[int, float, Dict[str, float]]:
+        """
+        Returns the tick, the time, and numbers of all series of the latest
+        snapshot.
+        """
+        self._index()
+        for _ in range(self._retries):
+            generation = self._begin()
+            _, _, tick, when, used, _, _, layout, _ = HEADER.unpack_from(
+                self._shm.buf, 0
+            )
+            if layout != self._layout:
+                self._index()
+                continue
+            values = self._values[:used].tolist()
+            if self._consistent(generation):
+                return (tick, when, dict(zip(self._slots, values)))
+        raise TimeoutError("Snapshot is being written for too long")
+
+    def close(self) -> None:
+        self._values.release()
+        self._shm.close()
+
+    def __enter__(self) -> "SnapshotReader":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
@@ -0,0 +1,87 @@
+# Copyright (c) 2022 Yoshihiro Ota <ota@j.email.ne.jp>
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+
+
+class Snapshot:
+    """
+    Snapshot holds what a cycle ended with: values of constants, variables,
+    and derivatives, levels triggered of incidents, and timings of the
+    monitor, which are summarized only when accessed.
+    """
+
+    def __init__(
+        self,
+        tick: int,
+        time: float,
+        values: Dict[str, Any],
+        levels: Dict[str, Dict[str, bool]],
+        timings: Callable[[], Dict[str, Dict]],
+    ):
+        self.tick = tick
+        self.time = time
+        self.values = values
+        self.levels = levels
+        self._timings = timings
+        self._summary: Optional[Dict[str, Dict]] = None
+
+    @property
+    def timings(self) -> Dict[str, Dict]:
+        if self._summary is None:
+            self._summary = self._timings()
+        return self._summary
+
+
+class Sink:
+    """
+    A sink receives a snapshot at the end of every cycle.
+    'publish' runs in the cycle and thus should return quickly.
+    """
+
+    def publish(self, snapshot: Snapshot) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+def flatten(value: Any, key: str = "") -> Iterator[Tuple[str, float]]:
+    """
+    Yields numbers in a value with their keys; keys of dictionaries and
+    indexes of lists and tuples are joined with ".".  Numeric strings are
+    converted and other strings are skipped.
+    """
+    if isinstance(value, (int, float)):
+        yield (key, float(value))
+    elif isinstance(value, str):
+        try:
+            yield (key, float(value))
+        except ValueError:
+            pass
+    elif isinstance(value, dict):
+        for k, v in value.items():
+            yield from flatten(v, f"{key}.{k}" if key else str(k))
+    elif isinstance(value, (list, tuple)):
+        for i, v in enumerate(value):
+            yield from flatten(v, f"{key}.{i}" if key else str(i))
@@ -0,0 +1,132 @@
+# Copyright (c) 2022 Yoshihiro Ota <ota@j.email.ne.jp>
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+
+import fnmatch
+import logging
+import math
+import re
+import socket
+from typing import List, Optional
+
+from .snapshot import flatten, Sink, Snapshot
+
+logger = logging.getLogger(__name__)
+
+_UNSAFE = re.compile(r"[^A-Za-z0-9_.-]")
+
+
+class StatsdSink(Sink):
+    """
+    StatsdSink sends numbers of values and triggered levels of incidents
+    as statsd gauges every cycle to "host:port" over UDP or to a Unix
+    datagram socket given by its path.
+    Gauges are packed into datagrams of up to 'mtu' bytes.  Sending never
+    blocks the cycle; datagrams that cannot be sent are dropped and
+    counted.
+    'include' limits values to names matching any of its glob patterns,
+    and 'tags' are appended to every gauge in DogStatsD format.
+    Numbers which are not finite are not sent, and a negative number is
+    sent after a zero in the same datagram since a signed gauge changes
+    the gauge by the number instead.
+    """
+
+    def __init__(
+        self,
+        address: str,
+        prefix: str = "prdanlz",
+        include: Optional[List[str]] = None,
+        tags: Optional[List[str]] = None,
+        mtu: int = 1432,
+    ):
+        if "/" in address:
+            self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            self._address = address
+        else:
+            host, port = address.rsplit(":", 1)
+            family, _, _, _, self._address = socket.getaddrinfo(
+                host, int(port), type=socket.SOCK_DGRAM
+            )[0]
+            self._socket = socket.socket(family, socket.SOCK_DGRAM)
+        self._socket.setblocking(False)
+        self._prefix = f"{prefix}." if prefix else ""
+        self._include = include
+        self._suffix = f"|g|#{','.join(tags)}" if tags else "|g"
+        self._mtu = mtu
+        self.sent = 0
+        self.dropped = 0
+        logger.info(f"Sending statsd gauges to '{address}'")
+
+    def _included(self, name: str) -> bool:
+        if self._include is None:
+            return True
+        return any(fnmatch.fnmatchcase(name, p) for p in self._include)
+
+    def lines(self, snapshot: Snapshot) -> List[bytes]:
+        """
+        Returns lines of gauges; the two lines of a negative number are
+        returned together as one.
+        """
+        lines = []
+        for name, value in snapshot.values.items():
+            if not self._included(name):
+                continue
+            for key, number in flatten(value):
+                if not math.isfinite(number):
+                    continue
+                metric = _UNSAFE.sub("_", f"{name}.{key}" if key else name)
+                line = f"{self._prefix}{metric}:{number!r}{self._suffix}"
+                if number < 0:
+                    line = f"{self._prefix}{metric}:0{self._suffix}\n{line}"
+                lines.append(line)
+        for name, levels in snapshot.levels.items():
+            for level, triggered in levels.items():
+                metric = _UNSAFE.sub("_", f"{name}.{level}")
+                lines.append(
+                    f"{self._prefix}triggered.{metric}:{int(triggered)}{self._suffix}"
+                )
+        return [line.encode() for line in lines]
+
+    def publish(self, snapshot: Snapshot) -> None:
+        datagram = b""
+        for line in self.lines(snapshot):
+            if datagram and len(datagram) + 1 + len(line) > self._mtu:
+                self._send(datagram)
+                datagram = b""
+            datagram = datagram + b"\n" + line if datagram else line
+        if datagram:
+            self._send(datagram)
+
+    def _send(self, datagram: bytes) -> None:
+        try:
+            self._socket.sendto(datagram, self._address)
+            self.sent += 1
+        except OSError as e:
+            # full buffers, or nobody listening on the Unix socket
+            if self.dropped == 0:
+                logger.warning(f"Dropping statsd datagrams: {e}")
+            self.dropped += 1
+
+    def close(self) -> None:
+        if self.dropped:
+            logger.info(f"Sent {self.sent} and dropped {self.dropped} datagrams")
+        self._socket.close()
@@ -0,0 +1,373 @@
+# Copyright (c) 2022 Yoshihiro Ota <ota@j.email.ne.jp>
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+
+import argparse
+import bisect
+import datetime
+import math
+import mmap
+import os
+import struct
+import sys
+import time
+import urllib.parse
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from .snapshot import flatten, Sink, Snapshot
+
+try:
+    import numpy  # type: ignore
+except ImportError:
+    numpy = None
+
+RECORD = struct.Struct("<dd")
+aggregations = ["avg", "min", "max", "sum", "count", "last"]
+
+
+def _directory(root: str, series: str) -> str:
+    return os.path.join(root, urllib.parse.quote(series, safe=""))
+
+
+def _chunks(directory: str) -> List[str]:
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return []
+    return [os.path.join(directory, n) for n in sorted(names) if n.endswith(".col")]
+
+
+class _Column:
+    """
+    Appends records of a series to chunk files of 'chunk' records each.
+    Times of records never decrease; when the clock steps back, records
+    take the last time until the clock catches up so that they can be
+    searched by times.
+    """
+
+    def __init__(self, directory: str, chunk: int):
+        self._directory = directory
+        self._chunk = chunk
+        os.makedirs(directory, exist_ok=True)
+        chunks = _chunks(directory)
+        self._index = len(chunks) - 1 if chunks else 0
+        self._records = 0
+        self._last = -math.inf
+        if chunks:
+            path = self._path()
+            size = os.path.getsize(path)
+            self._records = size // RECORD.size
+            if size % RECORD.size:  # a record torn by a crash while written
+                os.truncate(path, self._records * RECORD.size)
+            if self._records:
+                with open(path, "rb") as f:
+                    f.seek((self._records - 1) * RECORD.size)
+                    self._last = RECORD.unpack(f.read(RECORD.size))[0]
+        self._buffer = bytearray()
+
+    def _path(self) -> str:
+        return os.path.join(self._directory, f"{self._index:08d}.col")
+
+    def append(self, time: float, value: float) -> None:
+        self._last = max(self._last, time)
+        self._buffer += RECORD.pack(self._last, value)
+
+    def flush(self) -> None:
+        data = memoryview(self._buffer)
+        while data:
+            if self._records >= self._chunk:
+                self._index += 1
+                self._records = 0
+            count = min(len(data) // RECORD.size, self._chunk - self._records)
+            with open(self._path(), "ab") as f:
+                f.write(data[: count * RECORD.size])
+            self._records += count
+            data = data[count * RECORD.size :]
+        self._buffer = bytearray()
+
+
+class ColumnStore(Sink):
+    """
+    ColumnStore appends every number of values of a cycle to a column of
+    its series under 'directory'; a series is a variable or derivative
+    name, followed by keys of numbers in structures as in flatten().
+    A column is a directory of chunk files of fixed-width records of the
+    time and the value, both little-endian doubles.
+    Records are buffered and written every 'interval' seconds.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        interval: float = 10,
+        chunk: int = 1 << 20,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self._directory = directory
+        self._interval = interval
+        self._chunk = chunk
+        self._clock = clock
+        self._columns: Dict[str, _Column] = {}
+        self._flushed = clock()
+        os.makedirs(directory, exist_ok=True)
+
+    def publish(self, snapshot: Snapshot) -> None:
+        for name, value in snapshot.values.items():
+            for key, number in flatten(value):
+                series = f"{name}.{key}" if key else name
+                column = self._columns.get(series, None)
+                if column is None:
+                    column = _Column(_directory(self._directory, series), self._chunk)
+                    self._columns[series] = column
+                column.append(snapshot.time, number)
+        if self._clock() - self._flushed >= self._interval:
+            self.flush()
+
+    def flush(self) -> None:
+        self._flushed = self._clock()
+        for column in self._columns.values():
+            column.flush()
+
+    def close(self) -> None:
+        self.flush()
+
+
+class _Times:
+    """
+    A sequence of times in mapped records for bisect.
+    """
+
+    def __init__(self, view: memoryview):
+        self._view = view
+
+    def __len__(self) -> int:
+        return len(self._view) // 2
+
+    def __getitem__(self, i: int) -> float:
+        return self._view[i * 2]
+
+
+class Reader:
+    """
+    Reader maps chunk files of a series to read records between times.
+    With NumPy, times and values are arrays viewing the mapped files
+    without copies.
+    """
+
+    def __init__(self, directory: str, series: str):
+        self._maps: List[mmap.mmap] = []
+        for path in _chunks(_directory(directory, series)):
+            size = os.path.getsize(path) // RECORD.size * RECORD.size
+            if size == 0:
+                continue
+            with open(path, "rb") as f:
+                self._maps.append(mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ))
+        if not self._maps:
+            raise KeyError(f"No records of '{series}' in '{directory}'")
+
+    def close(self) -> None:
+        for m in self._maps:
+            m.close()
+        self._maps = []
+
+    def __enter__(self) -> "Reader":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def arrays(self, start: float, end: float) -> Tuple[Any, Any]:
+        """
+        Returns NumPy arrays of times and values in [start, end).
+        """
+        times = []
+        values = []
+        for m in self._maps:
+            records = numpy.frombuffer(m, dtype="<f8").reshape(-1, 2)
+            lo, hi = numpy.searchsorted(records[:, 0], [start, end])
+            if lo < hi:
+                times.append(records[lo:hi, 0])
+                values.append(records[lo:hi, 1])
+        if len(times) == 1:
+            return (times[0], values[0])
+        if not times:
+            return (numpy.empty(0), numpy.empty(0))
+        return (numpy.concatenate(times), numpy.concatenate(values))
+
+    def records(self, start: float, end: float) -> Iterator[Tuple[float, float]]:
+        """
+        Yields times and values in [start, end).
+        """
+        for m in self._maps:
+            view = memoryview(m).cast("d")
+            try:
+                times = _Times(view)
+                lo = bisect.bisect_left(times, start)
+                hi = bisect.bisect_left(times, end)
+                for i in range(lo, hi):
+                    yield (view[i * 2], view[i * 2 + 1])
+            finally:
+                view.release()
+
+
+def aggregate(
+    reader: Reader, start: float, end: float, agg: str = "avg", step: float = 0
+) -> List[Tuple[float, float]]:
+    """
+    Returns the aggregation of values per 'step' seconds from 'start' as a
+    list of the start time of each step and its aggregation; steps without
+    values are left out.  With 'step' of 0, all values are aggregated into
+    one at the time of the first value.
+    """
+    if agg not in aggregations:
+        raise ValueError(f"Unknown aggregation '{agg}'")
+    if numpy is not None:
+        return _aggregate_arrays(reader, start, end, agg, step)
+
+    results: List[Tuple[float, float]] = []
+    bucket = None
+    for t, v in reader.records(start, end):
+        b = math.floor((t - start) / step) if step > 0 else 0
+        if b != bucket:
+            if bucket is not None:
+                results.append(_result(start, step, bucket, acc, agg))
+            bucket = b
+            acc = [0.0, 0, v, v, v, t]
+        acc[0] += v
+        acc[1] += 1
+        acc[2] = min(acc[2], v)
+        acc[3] = max(acc[3], v)
+        acc[4] = v
+    if bucket is not None:
+        results.append(_result(start, step, bucket, acc, agg))
+    return results
+
+
+def _result(
+    start: float, step: float, bucket: int, acc: List, agg: str
+) -> Tuple[float, float]:
+    total, count, low, high, last, first = acc
+    value = {
+        "avg": total / count,
+        "min": low,
+        "max": high,
+        "sum": total,
+        "count": count,
+        "last": last,
+    }[agg]
+    return (start + bucket * step if step > 0 else first, float(value))
+
+
+def _aggregate_arrays(
+    reader: Reader, start: float, end: float, agg: str, step: float
+) -> List[Tuple[float, float]]:
+    times, values = reader.arrays(start, end)
+    if len(times) == 0:
+        return []
+    if step > 0:
+        # times are sorted; find where each step begins instead of
+        # dividing every time
+        low = math.floor((times[0] - start) / step)
+        high = math.floor((times[-1] - start) / step)
+        steps = numpy.arange(low, high + 1)
+        firsts = numpy.searchsorted(times, start + steps * step)
+        firsts[0] = 0
+        counts = numpy.diff(numpy.append(firsts, len(values)))
+        present = counts > 0
+        firsts, counts, bases = firsts[present], counts[present], steps[present]
+        bases = start + bases * step
+    else:
+        firsts = numpy.zeros(1, dtype=numpy.int64)
+        counts = numpy.array([len(values)])
+        bases = times[:1]
+    if agg == "avg":
+        result = numpy.add.reduceat(values, firsts) / counts
+    elif agg == "min":
+        result = numpy.minimum.reduceat(values, firsts)
+    elif agg == "max":
+        result = numpy.maximum.reduceat(values, firsts)
+    elif agg == "sum":
+        result = numpy.add.reduceat(values, firsts)
+    elif agg == "count":
+        result = counts
+    else:
+        result = values[firsts + counts - 1]
+    return list(zip(bases.tolist(), result.astype(float).tolist()))
+
+
+def _time(value: str) -> float:
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    for format in ["%Y-%m-%dT%H:%M:%S", "%Y-%m-%d %H:%M:%S", "%Y-%m-%d"]:
+        try:
+            return datetime.datetime.strptime(value, format).timestamp()
+        except ValueError:
+            pass
+    raise argparse.ArgumentTypeError(f"'{value}' is neither seconds nor a time")
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        prog="python -m prdanlz query",
+        description="aggregate a series written by --store",
+    )
+    parser.add_argument("series", type=str)
+    parser.add_argument(
+        "--store", dest="store", type=str, required=True, help="store directory"
+    )
+    parser.add_argument(
+        "--from",
+        dest="start",
+        type=_time,
+        default=-math.inf,
+        help="epoch seconds or ISO 8601 time to start from",
+    )
+    parser.add_argument(
+        "--to",
+        dest="end",
+        type=_time,
+        default=math.inf,
+        help="epoch seconds or ISO 8601 time to end before",
+    )
+    parser.add_argument(
+        "--agg", dest="agg", type=str, default="avg", choices=aggregations
+    )
+    parser.add_argument(
+        "--step",
+        dest="step",
+        type=float,
+        default=0,
+        help="seconds to aggregate each; 0 aggregates the whole range",
+    )
+    args = parser.parse_args(argv)
+    if args.step > 0 and math.isinf(args.start):
+        parser.error("--step requires --from")
+
+    try:
+        with Reader(args.store, args.series) as reader:
+            rows = aggregate(reader, args.start, args.end, args.agg, args.step)
+    except KeyError as e:
+        sys.exit(e.args[0])
+    for t, value in rows:
+        print(f"{datetime.datetime.fromtimestamp(t).isoformat()} {value!r}")
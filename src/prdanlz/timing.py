@@ -0,0 +1,140 @@
+# Copyright (c) 2022 Yoshihiro Ota <ota@j.email.ne.jp>
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+
+import collections
+import contextlib
+import math
+import threading
+import time
+from typing import Deque, Dict, Iterator, List, Tuple
+
+Key = Tuple[str, str]
+
+
+class Histogram:
+    """
+    Histogram keeps the count, the total, and the maximum of all samples
+    and percentiles of the latest 'size' samples.
+    """
+
+    def __init__(self, size: int = 256):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._samples: Deque[float] = collections.deque(maxlen=size)
+
+    def add(self, value: float) -> None:
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+        self._samples.append(value)
+
+    def summary(self) -> Dict[str, float]:
+        samples = sorted(self._samples)
+
+        def percentile(p: float) -> float:
+            if not samples:
+                return 0.0
+            return samples[max(0, math.ceil(p / 100 * len(samples)) - 1)]
+
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else 0.0,
+            "p50": percentile(50),
+            "p95": percentile(95),
+            "p99": percentile(99),
+            "max": self.max,
+        }
+
+
+class Timings:
+    """
+    Timings keeps a histogram of seconds taken and a count of errors per
+    item such as ("variable", name).
+    """
+
+    def __init__(self, size: int = 256):
+        self._size = size
+        self._lock = threading.Lock()
+        self._histograms: Dict[Key, Histogram] = {}
+        self._errors: Dict[Key, int] = {}
+
+    def record(self, key: Key, seconds: float) -> None:
+        with self._lock:
+            histogram = self._histograms.get(key, None)
+            if histogram is None:
+                histogram = Histogram(self._size)
+                self._histograms[key] = histogram
+            histogram.add(seconds)
+
+    def error(self, key: Key) -> None:
+        with self._lock:
+            self._errors[key] = self._errors.get(key, 0) + 1
+
+    @contextlib.contextmanager
+    def measure(self, key: Key) -> Iterator[None]:
+        """
+        Records time taken by the block and counts exceptions other than
+        IndexError, which means historical values are not available yet.
+        """
+        start = time.monotonic()
+        try:
+            yield
+        except IndexError:
+            raise
+        except Exception:
+            self.error(key)
+            raise
+        finally:
+            self.record(key, time.monotonic() - start)
+
+    def summary(self) -> Dict[str, Dict[str, Dict[str, float]]]:
+        """
+        Returns summaries grouped by kinds and then names of items.
+        """
+        with self._lock:
+            keys = set(self._histograms) | set(self._errors)
+            summary: Dict[str, Dict[str, Dict[str, float]]] = {}
+            for kind, name in sorted(keys):
+                histogram = self._histograms.get((kind, name), None)
+                item = histogram.summary() if histogram else Histogram().summary()
+                item["errors"] = self._errors.get((kind, name), 0)
+                summary.setdefault(kind, {})[name] = item
+            return summary
+
+    def report(self) -> List[str]:
+        """
+        Returns a line per item, the slowest first.
+        """
+        items = [
+            (item["max"], kind, name, item)
+            for kind, names in self.summary().items()
+            for name, item in names.items()
+        ]
+        return [
+            f"{kind} '{name}' count={item['count']} mean={item['mean']:.6f}"
+            f" p50={item['p50']:.6f} p95={item['p95']:.6f} p99={item['p99']:.6f}"
+            f" max={item['max']:.6f} errors={item['errors']}"
+            for _, kind, name, item in sorted(items, key=lambda i: -i[0])
+        ]
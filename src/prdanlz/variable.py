@@ -23,11 +23,13 @@
 
 import logging
 import os
+import random
+import re
 import struct
 import sys
 import time
 from abc import ABC, abstractmethod
-from typing import Any, Dict
+from typing import Any, Dict, Optional
 
 from .libc import sysctl
 
@@ -46,6 +48,7 @@ class Variable(ABC):
         if params.get(typename, None) is None:
             raise TypeError(f"Incomplete {typename} type specification")
         self._name = name
+        self._params = params
         self._value = None
         self._depth = params.get("depth", None) or params.get("history", 0)
         if self._depth < 0:
@@ -54,6 +57,9 @@ class Variable(ABC):
             self._hist = list()
         else:
             self._hist = None
+        self._interval = params.get("interval", None)
+        self._when = params.get("when", None)
+        self._deferred = params.get("defer", False) or self._when is not None
 
     def __hash__(self):
         return hash(self._name)
@@ -82,6 +88,34 @@ class Variable(ABC):
     def value(self) -> Any:
         return self._value
 
+    @property
+    def params(self) -> Dict:
+        return self._params
+
+    @property
+    def interval(self) -> Optional[float]:
+        return self._interval
+
+    @property
+    def when(self) -> Optional[str]:
+        """
+        An expression that must hold to fetch the variable
+        """
+        return self._when
+
+    def close(self) -> None:
+        """
+        Releases what the variable holds open.
+        """
+        pass
+
+    def resolved(self) -> Dict:
+        """
+        Returns parameters with what was looked up to set up the variable
+        so that it is set up again without looking up.
+        """
+        return dict(self._params)
+
     @property
     def last_value(self) -> Any:
         if len(self._hist) > 0:
@@ -95,12 +129,18 @@ class Variable(ABC):
         return None
 
     def new_value(self) -> Any:
+        return self.store_value(self._fetch_value())
+
+    def store_value(self, value: Any) -> Any:
+        """
+        Stores a value fetched outside of the variable as the newest value.
+        """
         if self._value is not None:
             if self._hist is not None:
                 self._hist.append(self._value)
                 while len(self._hist) > self._depth:
                     self._hist.pop(0)
-        self._value = self._fetch_value()
+        self._value = value
         return self._value
 
     @abstractmethod
@@ -117,7 +157,12 @@ class SyscmdVariable(Variable):
         super().__init__(name, "syscmd", params)
 
         self._cmd = params["syscmd"]
-        self._value = self._fetch_value()
+        if not self._deferred:
+            self._value = self._fetch_value()
+
+    @property
+    def command(self) -> str:
+        return self._cmd
 
     def _fetch_value(self) -> Any:
         return os.popen(self._cmd).read().strip()
@@ -132,13 +177,185 @@ class SysctlVariable(Variable):
         super().__init__(name, "sysctl", params)
 
         self._sysctl_name = params["sysctl"]
-        self._sysctl = sysctl.Sysctl(self._sysctl_name)
-        self._value = self._sysctl.value
+        oid = params.get("oid", None)
+        if oid:
+            self._sysctl = sysctl.Sysctl(self._sysctl_name, *oid)
+        else:
+            self._sysctl = sysctl.Sysctl(self._sysctl_name)
+        if not self._deferred:
+            self._value = self._sysctl.value
+
+    def resolved(self) -> Dict:
+        s = self._sysctl
+        return {**self._params, "oid": [s.mib, s.kind, s.fmt]}
 
     def _fetch_value(self) -> Any:
         return self._sysctl.value
 
 
+class FileVariable(Variable):
+    """
+    A user defines a variable with its "name" and a file to follow.
+    Only the bytes appended since the previous fetch are read.  The value
+    is a dictionary of line counts and of lines matching each "patterns".
+    """
+
+    CHUNK = 1 << 20
+
+    def __init__(self, name: str, params: Dict):
+        super().__init__(name, "file", params)
+
+        self._path = params["file"]
+        self._patterns = {
+            key: re.compile(pattern.encode())
+            for key, pattern in params.get("patterns", {}).items()
+        }
+        if "lines" in self._patterns:
+            raise TypeError("'lines' cannot be used as a pattern name")
+        self._file = None
+        self._inode = None
+        self._offset = 0
+        self._partial = b""
+        self._counts = {"lines": 0}
+        for key in self._patterns:
+            self._counts[key] = 0
+        if params.get("tail", False):
+            self._open(skip=True)
+        if not self._deferred:
+            self._value = self._fetch_value()
+
+    def _open(self, skip: bool = False) -> None:
+        try:
+            self._file = open(self._path, "rb", buffering=0)
+        except OSError as e:
+            logger.debug(f"Cannot open '{self._path}': {e}")
+            self._file = None
+            return
+        st = os.fstat(self._file.fileno())
+        self._inode = (st.st_dev, st.st_ino)
+        self._offset = st.st_size if skip else 0
+        self._partial = b""
+        self._file.seek(self._offset)
+
+    def close(self) -> None:
+        self._close()
+
+    def _close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _read(self) -> None:
+        while True:
+            data = self._file.read(FileVariable.CHUNK)
+            if not data:
+                break
+            self._offset += len(data)
+            self._consume(data)
+
+    def _consume(self, data: bytes) -> None:
+        data = self._partial + data
+        end = data.rfind(b"\n") + 1
+        self._partial = data[end:]
+        if end == 0:
+            return
+        self._counts["lines"] += data.count(b"\n", 0, end)
+        if self._patterns:
+            for line in data[:end].splitlines():
+                for key, pattern in self._patterns.items():
+                    if pattern.search(line):
+                        self._counts[key] += 1
+
+    def _fetch_value(self) -> Any:
+        try:
+            st = os.stat(self._path)
+        except OSError:
+            st = None
+        if self._file is not None:
+            if st is None or (st.st_dev, st.st_ino) != self._inode:
+                # rotated; pick up what was appended before the rename
+                self._read()
+                self._close()
+            elif st.st_size < self._offset:
+                # truncated in place
+                logger.debug(f"'{self._path}' is truncated")
+                self._offset = 0
+                self._partial = b""
+                self._file.seek(0)
+        if self._file is None and st is not None:
+            self._open()
+        if self._file is not None:
+            self._read()
+        return dict(self._counts)
+
+
+class SyntheticVariable(Variable):
+    """
+    A user defines a variable with its "name" and a kind of generated values
+    to try configurations without a system to monitor.
+    "random" values are between "min" and "max", and "counter" values
+    increase by "step".
+    """
+
+    def __init__(self, name: str, params: Dict):
+        super().__init__(name, "synthetic", params)
+
+        self._kind = params["synthetic"]
+        if self._kind not in ["random", "counter"]:
+            raise TypeError(f"Unknown synthetic kind '{self._kind}'")
+        self._min = params.get("min", 0)
+        self._max = params.get("max", 100)
+        self._step = params.get("step", 1)
+        self._count = 0
+        self._random = random.Random(params.get("seed", name))
+        if not self._deferred:
+            self._value = self._fetch_value()
+
+    def _fetch_value(self) -> Any:
+        if self._kind == "random":
+            return self._random.uniform(self._min, self._max)
+        self._count += self._step
+        return self._count
+
+
+class LazyVariable:
+    """
+    LazyVariable stands for a variable in a cycle and fetches the variable
+    when it is accessed for the first time.
+    """
+
+    def __init__(self, variable: Variable):
+        self._variable = variable
+        self._fetched = False
+
+    @property
+    def fetched(self) -> bool:
+        return self._fetched
+
+    @property
+    def variable(self) -> Variable:
+        return self._variable
+
+    def _get(self) -> Variable:
+        if not self._fetched:
+            self._fetched = True
+            self._variable.new_value()
+            logger.info(f"'{self._variable.name}' is loaded on demand")
+        return self._variable
+
+    def __repr__(self) -> Any:
+        return repr(self._get())
+
+    def __format__(self, spec: str) -> str:
+        return format(self._get(), spec)
+
+    def __getitem__(self, key) -> Any:
+        return self._get()[key]
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._get(), name)
+
+
 def instantiate_variable(name: str, params: Dict) -> Any:
     assert name
 
@@ -147,5 +364,9 @@ def instantiate_variable(name: str, params: Dict) -> Any:
         return SysctlVariable(name, params)
     elif type == "syscmd":
         return SyscmdVariable(name, params)
+    elif type == "file":
+        return FileVariable(name, params)
+    elif type == "synthetic":
+        return SyntheticVariable(name, params)
     else:
         raise TypeError("Unknown variable type")
@@ -0,0 +1,124 @@
+# Copyright (c) 2022 Yoshihiro Ota <ota@j.email.ne.jp>
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+
+import json
+import pytest
+from unittest import mock
+
+from prdanlz import artifact, expression, Incident, Monitor
+
+CONFIG = {
+    "constants": {"ncpu": {"type": "sysctl", "sysctl": "hw.ncpu"}},
+    "variables": {
+        "one": {"type": "syscmd", "syscmd": "echo 1", "history": 2},
+        "os": {"type": "sysctl", "sysctl": "kern.ostype"},
+    },
+    "derivatives": {"two": {"expression": "{one} * 2", "interval": 10}},
+    "incidents": {
+        "check": {
+            "description": "compiled",
+            "info": {
+                "trigger": "{two} == 2",
+                "untrigger": "{two} != 2",
+                "escalation": "echo {ncpu}",
+            },
+        }
+    },
+}
+
+
+def test_artifact__build():
+    # GIVEN
+    m = Monitor()
+    m.load_json(CONFIG)
+
+    # WHEN
+    data = artifact.build(m)
+
+    # THEN
+    config = data["config"]
+    assert config["derivatives"] == CONFIG["derivatives"]
+    assert config["incidents"] == CONFIG["incidents"]
+    assert len(config["constants"]["ncpu"]["oid"]) == 3
+    assert "defer" not in config["constants"]["ncpu"]
+    assert len(config["variables"]["os"]["oid"]) == 3
+    assert config["variables"]["one"]["defer"]
+    assert data["expressions"]["{one} * 2"]["names"] == ["one"]
+    assert "echo {ncpu}" in data["expressions"]
+
+
+def test_artifact__read(tmp_path):
+    # GIVEN
+    path = str(tmp_path / "artifact.json")
+    m = Monitor()
+    m.load_json(CONFIG)
+    artifact.write(m, path)
+
+    # WHEN
+    with mock.patch.dict(expression._templates, clear=True):
+        config = artifact.read(path)
+        m = Monitor()
+        m.load_json(config)
+
+        # THEN - first values are deferred to the first cycle
+        assert expression._templates.keys() == m.expressions()
+        assert all(v.value is None for v in m._variables)
+        with mock.patch("os.system") as system:
+            m.fetch_constants()
+            m.fetch_and_evaluate()
+        assert m._last["os"].value == "FreeBSD"
+        assert system.call_args_list == [mock.call("echo 4")]
+
+
+def test_artifact__other_python(tmp_path):
+    # GIVEN
+    path = tmp_path / "artifact.json"
+    m = Monitor()
+    m.load_json(CONFIG)
+    data = artifact.build(m)
+    data["cache_tag"] = "other-00"
+    path.write_text(json.dumps(data))
+
+    # WHEN
+    with mock.patch.dict(expression._templates, clear=True):
+        with mock.patch("prdanlz.artifact.logger") as logger:
+            config = artifact.read(str(path))
+
+        # THEN - expressions are compiled when used
+        assert "compiled again" in logger.warning.mock_calls[0][1][0]
+        assert not expression._templates
+        assert config == data["config"]
+
+
+def test_artifact__other_levels(tmp_path):
+    # GIVEN
+    path = str(tmp_path / "artifact.json")
+    m = Monitor()
+    m.load_json(CONFIG)
+    artifact.write(m, path)
+
+    # WHEN/THEN
+    with mock.patch.object(Incident, "levels", ["critical", "info"]):
+        with pytest.raises(Exception, match="compiled with levels error, warn, info"):
+            artifact.read(path)
+        assert Incident.levels == ["critical", "info"]
@@ -0,0 +1,236 @@
+# Copyright (c) 2022 Yoshihiro Ota <ota@j.email.ne.jp>
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+
+import asyncio
+import pytest
+import threading
+import time
+from unittest import mock
+
+from prdanlz import AsyncMonitor
+
+
+def escalating(out) -> dict:
+    return {
+        "variables": {"echo": {"type": "syscmd", "syscmd": "echo 3"}},
+        "derivatives": {"twice": "{echo} * 2"},
+        "incidents": {
+            "check": {
+                "description": "echo",
+                "info": {
+                    "trigger": "{twice} == 6",
+                    "untrigger": "{twice} != 6",
+                    "escalation": f"sleep 0.2; echo {{level}} >> {out}",
+                },
+            }
+        },
+    }
+
+
+def exit_monitor(m: AsyncMonitor, wait: float) -> None:
+    time.sleep(wait)
+    m.exit()
+
+
+def test_async_monitor__once(tmp_path):
+    # GIVEN
+    out = tmp_path / "out"
+    m = AsyncMonitor()
+    m.load_json(escalating(out))
+
+    # WHEN
+    m.start()
+
+    # THEN - escalation is awaited before returning
+    assert out.read_text() == "info\n"
+    assert m._last["twice"] == 6
+
+
+def test_async_monitor__interval(tmp_path):
+    # GIVEN
+    out = tmp_path / "out"
+    m = AsyncMonitor(0.1)
+    m.load_json(escalating(out))
+
+    thread = threading.Thread(target=exit_monitor, args=(m, 0.35))
+    thread.start()
+
+    # WHEN
+    m.start()
+
+    # THEN
+    thread.join()
+    assert m.stats.cycles >= 3
+    assert out.read_text() == "info\n"
+
+
+def test_async_monitor__variable_timeout():
+    # GIVEN
+    m = AsyncMonitor(timeout=0.1)
+    m.load_json({"variables": {"slow": {"type": "syscmd", "syscmd": "echo 1"}}})
+    slow = next(iter(m._variables))
+    slow._cmd = "sleep 1; echo 2"
+
+    # WHEN
+    start = time.monotonic()
+    m.start()
+
+    # THEN - the value is not refreshed
+    assert time.monotonic() - start < 0.9
+    assert slow.value == "1"
+    assert "slow" not in m._last
+
+
+def test_async_monitor__variable_in_executor():
+    # GIVEN
+    m = AsyncMonitor()
+    m.load_json({"variables": {"count": {"type": "synthetic", "synthetic": "counter"}}})
+    count = next(iter(m._variables))
+    threads = []
+    new_value = count.new_value
+    count.new_value = lambda: (threads.append(threading.get_ident()), new_value())
+
+    # WHEN
+    m.start()
+
+    # THEN - not fetched in the thread of the loop
+    assert len(threads) == 1
+    assert threads[0] != threading.get_ident()
+
+
+def test_async_monitor__escalation_timeout(tmp_path):
+    # GIVEN
+    out = tmp_path / "out"
+    json = escalating(out)
+    json["incidents"]["check"]["info"]["escalation"] = f"sleep 1; echo x > {out}"
+    m = AsyncMonitor(timeout=0.1)
+    m.load_json(json)
+
+    # WHEN
+    start = time.monotonic()
+    m.start()
+
+    # THEN - killed
+    assert time.monotonic() - start < 0.9
+    assert not out.exists()
+
+
+def test_async_monitor__escalations_in_order(tmp_path):
+    # GIVEN - the first escalation takes longer
+    out = tmp_path / "out"
+    m = AsyncMonitor()
+    m.load_json(escalating(out))
+    incident = next(iter(m._incidents))
+
+    async def escalate():
+        m._dispatch(incident, "info", f"sleep 0.2; echo 1 >> {out}")
+        m._dispatch(incident, "info", f"echo 2 >> {out}")
+        await m._drain()
+
+    # WHEN
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(escalate())
+    finally:
+        loop.close()
+
+    # THEN
+    assert out.read_text() == "1\n2\n"
+    assert not m._last_tasks
+
+
+@mock.patch("prdanlz.asyncmonitor.logger")
+def test_async_monitor__escalation_status_and_output(logger, tmp_path):
+    # GIVEN
+    m = AsyncMonitor()
+    m.load_json(escalating(tmp_path / "out"))
+    incident = next(iter(m._incidents))
+
+    async def escalate():
+        m._dispatch(incident, "info", "echo hello; exit 3")
+        await m._drain()
+
+    # WHEN
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(escalate())
+    finally:
+        loop.close()
+
+    # THEN - as escalations in threads
+    assert "exited with 3" in logger.info.mock_calls[-2][1][0]
+    assert "hello" in logger.info.mock_calls[-1][1][0]
+
+
+@mock.patch("prdanlz.asyncmonitor.logger")
+def test_async_monitor__escalation_cancelled(logger, tmp_path):
+    # GIVEN
+    out = tmp_path / "out"
+    m = AsyncMonitor()
+    m.load_json(escalating(out))
+    incident = next(iter(m._incidents))
+
+    async def escalate():
+        m._dispatch(incident, "info", f"sleep 1; echo x > {out}")
+        task = next(iter(m._tasks))
+        await asyncio.sleep(0.1)
+        task.cancel()
+        await asyncio.wait([task])
+        return task
+
+    # WHEN
+    loop = asyncio.new_event_loop()
+    try:
+        task = loop.run_until_complete(escalate())
+    finally:
+        loop.close()
+
+    # THEN - killed and the cancellation reaches the awaiter
+    assert task.cancelled()
+    assert "was cancelled" in logger.error.mock_calls[0][1][0]
+    time.sleep(1)
+    assert not out.exists()
+
+
+@mock.patch("prdanlz.asyncmonitor.logger")
+def test_async_monitor__interval_survives_failing_cycle(logger):
+    # GIVEN - the derivative divides by zero at the first cycle only
+    m = AsyncMonitor(0.05)
+    m.load_json(
+        {
+            "variables": {"count": {"type": "synthetic", "synthetic": "counter"}},
+            "derivatives": {"inverse": "1 / ({count} - 2)"},
+        }
+    )
+    thread = threading.Thread(target=lambda: (time.sleep(0.3), m.exit()))
+    thread.start()
+
+    # WHEN
+    m.start()
+
+    # THEN
+    thread.join()
+    cycle = m.timings()["stage"]["cycle"]
+    assert cycle["count"] >= 3
+    assert cycle["errors"] == 1
+    assert logger.exception.call_count == 1
@@ -0,0 +1,69 @@
+# Copyright (c) 2021, 2022 Yoshihiro Ota <ota@j.email.ne.jp>
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+
+import pytest
+
+from prdanlz import Monitor
+from prdanlz import bench
+
+
+def test_generate():
+    # GIVEN/WHEN
+    config = bench.generate(10, 5, 4, ["error", "warn"], history=2, complexity=3)
+
+    # THEN
+    assert len(config["variables"]) == 10
+    assert config["variables"]["v0"]["history"] == 2
+    assert len(config["derivatives"]) == 5
+    assert config["derivatives"]["d0"].count("+") == 2
+    assert len(config["incidents"]) == 4
+    assert set(config["incidents"]["i0"]) == {"description", "error", "warn"}
+
+
+def test_generate__repeatable():
+    # GIVEN/WHEN/THEN
+    assert bench.generate(5, 5, 5, seed=3) == bench.generate(5, 5, 5, seed=3)
+    assert bench.generate(5, 5, 5, seed=3) != bench.generate(5, 5, 5, seed=4)
+
+
+def test_generate__no_variables():
+    # GIVEN/WHEN/THEN
+    with pytest.raises(ValueError):
+        bench.generate(0, 1, 1)
+
+
+def test_run():
+    # GIVEN
+    m = Monitor(-1, escalation_workers=0)
+    m.load_json(bench.generate(20, 10, 10, history=3))
+
+    # WHEN
+    result = bench.run(m, 5)
+
+    # THEN - warm-up cycles to fill history are not counted
+    assert result["count"] == 5
+    assert m.timings()["stage"]["cycle"]["count"] == 8
+    assert 0 < result["p50"] <= result["max"]
+    assert result["throughput"] > 0
+    assert result["peak_rss_kb"] > 0
+    assert len(bench.report(result)) == 3
@@ -0,0 +1,143 @@
+# Copyright (c) 2021, 2022 Yoshihiro Ota <ota@j.email.ne.jp>
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+
+import json
+
+import pytest
+
+from prdanlz import control
+
+from .conftest import snapshot
+
+TIMINGS = {"stage": {"cycle": {"count": 1}}, "variable": {"load": {"count": 1}}}
+VALUES = {"vm__free": 3, "name": "db1"}
+
+
+@pytest.fixture
+def server(tmp_path):
+    s = control.ControlServer(str(tmp_path / "ctl.sock"), history=3)
+    yield s
+    s.close()
+
+
+def test_before_cycle(server, tmp_path):
+    # GIVEN/WHEN
+    responses = control.query(str(tmp_path / "ctl.sock"), [{"get": "*"}])
+
+    # THEN
+    assert responses == [{"error": "No cycle has ended yet"}]
+
+
+def test_queries(server, tmp_path):
+    # GIVEN
+    for tick in range(5):
+        values = {"vm__load": tick / 10, **VALUES}
+        levels = {"check": {"error": tick > 1}, "other": {"info": False}}
+        server.publish(snapshot(tick, values, levels, lambda: TIMINGS))
+
+    # WHEN
+    responses = control.query(
+        str(tmp_path / "ctl.sock"),
+        [
+            {"get": "vm__*"},
+            {"levels": "check"},
+            {"history": "vm__load", "last": 10},
+            {"timings": "variable"},
+            {"unknown": 1},
+        ],
+    )
+
+    # THEN - history is kept for 3 cycles
+    assert responses[0] == {
+        "tick": 4,
+        "time": 104.0,
+        "values": {"vm__load": 0.4, "vm__free": 3},
+    }
+    assert responses[1]["levels"] == {"check": {"error": True}}
+    assert responses[2]["history"] == [[102.0, 0.2], [103.0, 0.3], [104.0, 0.4]]
+    assert responses[3]["timings"] == {"load": {"count": 1}}
+    assert responses[4] == {"error": "Unknown query"}
+
+
+def test_invalid_query(server, tmp_path):
+    # GIVEN
+    path = str(tmp_path / "ctl.sock")
+    server.publish(snapshot(0))
+
+    # WHEN
+    responses = control.query(path, [[1]])
+
+    # THEN
+    assert responses == [{"error": "ValueError: A query must be an object"}]
+
+
+def test_invalid_history(server, tmp_path):
+    # GIVEN
+    path = str(tmp_path / "ctl.sock")
+    server.publish(snapshot(0))
+
+    # WHEN
+    responses = control.query(
+        path, [{"history": "vm__load", "last": last} for last in (0, -1, "2", True)]
+    )
+
+    # THEN
+    assert all(r["error"].startswith("ValueError: 'last' must be") for r in responses)
+
+
+def test_timings_summarized_at_publish(server, tmp_path):
+    # GIVEN
+    calls = []
+
+    def timings():
+        calls.append(1)
+        return TIMINGS
+
+    server.publish(snapshot(0, timings=timings))
+    assert not calls
+
+    # WHEN - queried once
+    control.query(str(tmp_path / "ctl.sock"), [{"timings": None}])
+    server.publish(snapshot(1, timings=timings))
+
+    # THEN - the next cycle is summarized as it ends
+    assert len(calls) == 2
+
+
+def test_ctl(server, tmp_path, capsys):
+    # GIVEN
+    path = str(tmp_path / "ctl.sock")
+    server.publish(snapshot(0, VALUES))
+    server.publish(snapshot(1, VALUES))
+
+    # WHEN
+    control.main(["-s", path, "history", "vm__free", "--last", "1"])
+
+    # THEN
+    assert json.loads(capsys.readouterr().out)["history"] == [[101.0, 3]]
+
+
+def test_ctl__error(server, tmp_path):
+    # GIVEN/WHEN/THEN
+    with pytest.raises(SystemExit):
+        control.main(["-s", str(tmp_path / "ctl.sock"), "get"])
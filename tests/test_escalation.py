@@ -0,0 +1,315 @@
+# Copyright (c) 2022 Yoshihiro Ota <ota@j.email.ne.jp>
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+
+import pytest
+import time
+from unittest import mock
+
+from prdanlz import Monitor
+from prdanlz.escalation import Batch, Escalator, Throttle, TokenBucket
+
+from .conftest import Clock
+
+
+class Named:
+    def __init__(self, name: str, **params):
+        self.name = name
+        self.rate_limit = params.get("rate_limit", None)
+        self.rate_period = params.get("rate_period", 60)
+        self.dedup = params.get("dedup", None)
+
+
+def test_escalator__in_order_per_incident(tmp_path):
+    # GIVEN
+    out = tmp_path / "out"
+    e = Escalator(4)
+
+    # WHEN
+    e.submit(Named("a"), "warn", f"sleep 0.2; echo 1 >> {out}")
+    e.submit(Named("a"), "error", f"echo 2 >> {out}")
+    e.submit(Named("a"), "info", f"echo 3 >> {out}")
+
+    # THEN
+    assert e.drain(5)
+    assert out.read_text().split() == ["1", "2", "3"]
+    e.shutdown()
+
+
+def test_escalator__incidents_in_parallel():
+    # GIVEN
+    e = Escalator(4)
+
+    # WHEN
+    start = time.monotonic()
+    for name in ["a", "b", "c", "d"]:
+        e.submit(Named(name), "info", "sleep 0.3")
+
+    # THEN - submitting does not wait
+    assert time.monotonic() - start < 0.2
+    assert e.drain(5)
+    assert time.monotonic() - start < 1.0
+    e.shutdown()
+
+
+@mock.patch("prdanlz.escalation.logger")
+def test_escalator__timeout(logger):
+    # GIVEN
+    e = Escalator(1, timeout=0.1)
+
+    # WHEN
+    start = time.monotonic()
+    assert e.run("a", "info", "sleep 2; echo late") is None
+
+    # THEN
+    assert time.monotonic() - start < 1.0
+    assert "was killed" in logger.error.mock_calls[0][1][0]
+    e.shutdown()
+
+
+@mock.patch("prdanlz.escalation.logger")
+def test_escalator__status_and_output(logger):
+    # GIVEN
+    e = Escalator(1)
+
+    # WHEN & THEN
+    assert e.run("a", "info", "echo hello; exit 3") == 3
+    assert "exited with 3" in logger.info.mock_calls[0][1][0]
+    assert "hello" in logger.info.mock_calls[1][1][0]
+    e.shutdown()
+
+
+@mock.patch("prdanlz.escalation.logger")
+def test_escalator__limit(logger):
+    # GIVEN
+    e = Escalator(1, limit=2)
+
+    # WHEN & THEN
+    assert e.submit(Named("a"), "info", "sleep 0.2")
+    assert e.submit(Named("a"), "info", "true")
+    assert not e.submit(Named("a"), "info", "true")
+    assert "Dropped escalation" in logger.error.mock_calls[0][1][0]
+    assert e.drain(5)
+    assert e.pending == 0
+    e.shutdown()
+
+
+def test_monitor__escalation_workers(tmp_path):
+    # GIVEN
+    out = tmp_path / "out"
+    m = Monitor(escalation_workers=2)
+    m.load_json(
+        {
+            "variables": {"one": {"type": "syscmd", "syscmd": "echo 1"}},
+            "incidents": {
+                "check": {
+                    "description": "slow escalation",
+                    "info": {
+                        "trigger": "{one} == 1",
+                        "untrigger": "{one} != 1",
+                        "escalation": f"sleep 0.5; echo done > {out}",
+                    },
+                }
+            },
+        }
+    )
+
+    # WHEN
+    start = time.monotonic()
+    m.fetch_and_evaluate()
+
+    # THEN - evaluation does not wait for the escalation
+    assert time.monotonic() - start < 0.4
+    assert not out.exists()
+
+    # WHEN - drained on shutdown
+    m.start()
+
+    # THEN
+    assert out.read_text() == "done\n"
+
+
+def test_token_bucket():
+    # GIVEN
+    clock = Clock()
+    b = TokenBucket(2, 10, clock)
+
+    # WHEN/THEN - burst up to count
+    assert b.take()
+    assert b.take()
+    assert not b.take()
+
+    # WHEN/THEN - refills count per period
+    clock.now = 5
+    assert b.take()
+    assert not b.take()
+    clock.now = 100
+    assert [b.take() for _ in range(3)] == [True, True, False]
+
+
+def test_throttle__dedup():
+    # GIVEN
+    clock = Clock()
+    t = Throttle(clock=clock)
+    i = Named("a", dedup=30)
+
+    # WHEN/THEN
+    assert t.admit(i, "info", "echo 1")
+    assert not t.admit(i, "info", "echo 1")
+    assert t.admit(i, "info", "echo 2")
+    clock.now = 31
+    assert t.admit(i, "info", "echo 1")
+
+
+def test_throttle__dedup_per_incident_and_level():
+    # GIVEN
+    t = Throttle(clock=Clock())
+    a = Named("a", dedup=30)
+    b = Named("b", dedup=30)
+
+    # WHEN
+    admitted = [
+        t.admit(a, "info", "echo 1"),
+        t.admit(a, "warn", "echo 1"),
+        t.admit(b, "info", "echo 1"),
+        t.admit(b, "info", "echo 1"),
+    ]
+
+    # THEN - the same command of another incident or level is not suppressed
+    assert admitted == [True, True, True, False]
+
+
+def test_throttle__rate_limit():
+    # GIVEN
+    clock = Clock()
+    t = Throttle(3, 60, clock=clock)
+    a = Named("a", rate_limit=1, rate_period=10)
+    b = Named("b")
+
+    # WHEN/THEN - per incident
+    assert t.admit(a, "info", "echo a")
+    assert not t.admit(a, "info", "echo a")
+
+    # WHEN/THEN - global
+    assert t.admit(b, "info", "echo b")
+    assert t.admit(b, "info", "echo b")
+    assert not t.admit(b, "info", "echo b")
+    clock.now = 20
+    assert t.admit(a, "info", "echo a")
+
+
+@pytest.mark.parametrize("period", [0, -1])
+def test_token_bucket__period_not_positive(period):
+    # WHEN/THEN
+    with pytest.raises(ValueError):
+        TokenBucket(2, period)
+    with pytest.raises(ValueError):
+        Throttle(2, period)
+
+
+def test_batch():
+    # GIVEN
+    b = Batch()
+    c = Batch("logger -t prdanlz {count} {summary}")
+
+    # WHEN/THEN
+    assert b.flush() is None
+    for batch in [b, c]:
+        batch.add(Named("a"), "info", "echo a")
+        batch.add(Named("b"), "error", "echo b")
+    assert len(b) == 2
+    assert b.flush() == "echo a\necho b"
+    assert len(b) == 0
+    assert c.flush() == "logger -t prdanlz 2 'a info: echo a\nb error: echo b'"
+
+
+def test_batch__braces_in_command():
+    # GIVEN
+    b = Batch("awk '{print $1}' <<< {summary}; echo {count}")
+
+    # WHEN
+    b.add(Named("a"), "info", "echo a")
+
+    # THEN
+    assert b.flush() == "awk '{print $1}' <<< 'a info: echo a'; echo 1"
+
+
+@mock.patch("prdanlz.monitor.logger")
+def test_monitor__batch_fails(logger):
+    # GIVEN
+    m = Monitor(escalation_workers=0)
+    m.load_json(
+        {
+            "variables": {"one": {"type": "syscmd", "syscmd": "echo 1"}},
+            "incidents": {
+                "a": {
+                    "description": "a",
+                    "batch": True,
+                    "info": {
+                        "trigger": "True",
+                        "untrigger": "False",
+                        "escalation": "echo a",
+                    },
+                },
+            },
+        }
+    )
+    m._batch.flush = mock.Mock(side_effect=OSError("no shell"))
+
+    # WHEN
+    m.fetch_and_evaluate()
+
+    # THEN - the cycle still ends
+    assert logger.error.call_count == 1
+    assert m._last["one"].value == "1"
+
+
+def test_monitor__batch():
+    # GIVEN
+    m = Monitor()
+    incident = {
+        "batch": True,
+        "info": {
+            "trigger": "True",
+            "untrigger": "False",
+            "escalation": "echo {description}",
+        },
+    }
+    m.load_json(
+        {
+            "variables": {},
+            "incidents": {
+                "a": {**incident, "description": "a"},
+                "b": {**incident, "description": "b"},
+                "c": {**incident, "description": "c", "batch": False},
+            },
+        }
+    )
+
+    # WHEN
+    with mock.patch("os.system") as system:
+        m.fetch_and_evaluate()
+
+    # THEN - "a" and "b" in a batch at the end of the cycle
+    assert system.call_count == 2
+    assert system.call_args_list[0] == mock.call("echo c")
+    assert sorted(system.call_args_list[1][0][0].split("\n")) == ["echo a", "echo b"]
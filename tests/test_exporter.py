@@ -0,0 +1,162 @@
+# Copyright (c) 2022 Yoshihiro Ota <ota@j.email.ne.jp>
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+
+import http.client
+import socket
+
+from prdanlz import Monitor
+from prdanlz.exporter import MetricsExporter, render
+from prdanlz.snapshot import flatten, Snapshot
+
+CONFIG = {
+    "variables": {
+        "one": {"type": "syscmd", "syscmd": "echo 1"},
+        "name": {"type": "syscmd", "syscmd": "echo name"},
+    },
+    "derivatives": {"load": "[0.5, 1.25]", "mem": "{{'free': 3}}"},
+    "incidents": {
+        "check": {
+            "description": "exported",
+            "info": {
+                "trigger": "{one} == 1",
+                "untrigger": "{one} != 1",
+                "escalation": "true",
+            },
+        }
+    },
+}
+
+
+def test_flatten():
+    # GIVEN
+    value = {"a": 1, "b": [2.5, "3", "x"], "c": {"d": True}}
+
+    # WHEN/THEN
+    assert list(flatten(value)) == [
+        ("a", 1.0),
+        ("b.0", 2.5),
+        ("b.1", 3.0),
+        ("c.d", 1.0),
+    ]
+    assert list(flatten("name")) == []
+    assert list(flatten(7)) == [("", 7.0)]
+
+
+def test_render():
+    # GIVEN
+    timings = {
+        "variable": {
+            "a": {
+                "count": 2,
+                "mean": 0.5,
+                "p50": 0.25,
+                "p95": 0.75,
+                "p99": 0.75,
+                "max": 0.75,
+                "errors": 1,
+            }
+        },
+        "cycles": {"cycles": 3, "overruns": 1, "skipped": 0},
+    }
+    snapshot = Snapshot(
+        2, 100.0, {'a"b': 1, "c": [2]}, {"i": {"info": True}}, lambda: timings
+    )
+
+    # WHEN
+    text = render(snapshot)
+
+    # THEN
+    lines = text.splitlines()
+    assert 'prdanlz_value{name="a\\"b"} 1.0' in lines
+    assert 'prdanlz_value{name="c",key="0"} 2.0' in lines
+    assert 'prdanlz_triggered{incident="i",level="info"} 1' in lines
+    assert 'prdanlz_seconds{kind="variable",name="a",quantile="0.95"} 0.75' in lines
+    assert 'prdanlz_seconds_sum{kind="variable",name="a"} 1.0' in lines
+    assert 'prdanlz_seconds_count{kind="variable",name="a"} 2' in lines
+    assert 'prdanlz_errors_total{kind="variable",name="a"} 1' in lines
+    assert "prdanlz_cycles_total 3" in lines
+    assert "prdanlz_overruns_total 1" in lines
+    assert "prdanlz_snapshot_timestamp_seconds 100.0" in lines
+
+
+def test_exporter__tcp():
+    # GIVEN
+    m = Monitor()
+    m.load_json(CONFIG)
+    exporter = MetricsExporter("127.0.0.1:0")
+    m.add_sink(exporter)
+
+    try:
+        # WHEN
+        host, port = exporter.address
+        conn = http.client.HTTPConnection(host, port)
+        conn.request("GET", "/metrics")
+        empty = conn.getresponse().read()
+        m.fetch_and_evaluate()
+        conn.request("GET", "/metrics")
+        response = conn.getresponse()
+        body = response.read()
+        conn.request("GET", "/")
+        missing = conn.getresponse()
+        missing.read()
+
+        # THEN - the body is cached until the next cycle
+        assert empty == b""
+        assert response.status == 200
+        assert response.getheader("Content-Type").startswith("text/plain")
+        lines = body.decode().splitlines()
+        assert 'prdanlz_value{name="one"} 1.0' in lines
+        assert 'prdanlz_value{name="load",key="1"} 1.25' in lines
+        assert 'prdanlz_value{name="mem",key="free"} 3.0' in lines
+        assert not [line for line in lines if 'value{name="name"' in line]
+        assert 'prdanlz_triggered{incident="check",level="info"} 1' in lines
+        assert exporter.body() is exporter.body()
+        assert missing.status == 404
+    finally:
+        exporter.close()
+
+
+def test_exporter__unix(tmp_path):
+    # GIVEN
+    path = str(tmp_path / "metrics.sock")
+    exporter = MetricsExporter(path)
+    exporter.publish(Snapshot(0, 1.0, {"a": 2}, {}, lambda: {}))
+
+    try:
+        # WHEN
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+            s.connect(path)
+            s.sendall(b"GET /metrics HTTP/1.0\r\n\r\n")
+            response = b""
+            while True:
+                data = s.recv(4096)
+                if not data:
+                    break
+                response += data
+
+        # THEN
+        assert response.startswith(b"HTTP/1.0 200")
+        assert b'prdanlz_value{name="a"} 2.0\n' in response
+    finally:
+        exporter.close()
+    assert not (tmp_path / "metrics.sock").exists()
@@ -0,0 +1,151 @@
+# Copyright (c) 2021, 2022 Yoshihiro Ota <ota@j.email.ne.jp>
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+
+import json
+import os
+from unittest import mock
+
+from prdanlz import Monitor
+from prdanlz.flight import FlightRecorder
+
+from .conftest import snapshot
+
+
+def ticks(path) -> list:
+    with open(path, "rb") as f:
+        return [json.loads(line)["tick"] for line in f]
+
+
+def test_dump(tmp_path):
+    # GIVEN
+    recorder = FlightRecorder(str(tmp_path), cycles=2)
+    for tick in range(3):
+        recorder.publish(snapshot(tick))
+
+    # WHEN
+    path = recorder.dump(3)
+
+    # THEN - only the recent cycles
+    assert path == str(tmp_path / f"prdanlz-{os.getpid()}-3.jsonl")
+    assert ticks(path) == [1, 2]
+
+    # WHEN - escalated again in the same cycle, which then ends
+    recorder.dump(3)
+    recorder.publish(snapshot(3))
+
+    # THEN
+    assert ticks(path) == [1, 2, 3]
+    assert os.listdir(tmp_path) == [os.path.basename(path)]
+
+
+def test_dump__keeps_files(tmp_path):
+    # GIVEN
+    recorder = FlightRecorder(str(tmp_path), files=2)
+
+    # WHEN
+    paths = [recorder.dump(tick) for tick in range(3)]
+
+    # THEN
+    assert sorted(os.listdir(tmp_path)) == sorted(
+        os.path.basename(p) for p in paths[1:]
+    )
+
+
+def test_monitor(tmp_path):
+    # GIVEN
+    copy = tmp_path / "copy.jsonl"
+    m = Monitor(escalation_workers=0)
+    m.load_json(
+        {
+            "variables": {"count": {"type": "synthetic", "synthetic": "counter"}},
+            "incidents": {
+                "check": {
+                    "description": str(copy),
+                    "error": {
+                        "trigger": "{count} >= 4",
+                        "untrigger": "{count} < 4",
+                        "escalation": "cp {flight_record} {description}",
+                    },
+                }
+            },
+        }
+    )
+    m.set_flight_recorder(FlightRecorder(str(tmp_path / "flight")))
+
+    # WHEN
+    for _ in range(3):
+        m.fetch_and_evaluate()
+
+    # THEN - the escalation sees cycles before it and the cycle is appended
+    assert ticks(copy) == [0, 1]
+    path = tmp_path / "flight" / f"prdanlz-{os.getpid()}-2.jsonl"
+    assert ticks(path) == [0, 1, 2]
+    with open(path, "rb") as f:
+        assert "flight_record" not in json.loads(f.readline())["values"]
+
+
+def test_monitor__dump_fails(tmp_path):
+    # GIVEN - the directory becomes a file
+    m = Monitor(escalation_workers=0)
+    m.load_json(
+        {
+            "variables": {"count": {"type": "synthetic", "synthetic": "counter"}},
+            "incidents": {
+                "check": {
+                    "description": "check",
+                    "error": {
+                        "trigger": "{count} >= 2",
+                        "untrigger": "{count} < 2",
+                        "escalation": "report '{flight_record}' {description}",
+                    },
+                }
+            },
+        }
+    )
+    directory = tmp_path / "flight"
+    m.set_flight_recorder(FlightRecorder(str(directory)))
+    directory.rmdir()
+    directory.write_text("")
+    dispatch = mock.Mock()
+    m.set_escalation_handler(dispatch)
+
+    # WHEN
+    with mock.patch("prdanlz.monitor.logger") as logger:
+        for _ in range(3):
+            m.fetch_and_evaluate()
+
+    # THEN - escalated anyway without the file
+    assert logger.error.call_count == 1
+    assert dispatch.call_args_list == [mock.call(mock.ANY, "error", "report '' check")]
+
+
+def test_monitor__without_recorder():
+    # GIVEN
+    m = Monitor(escalation_workers=0)
+    m.load_json({"derivatives": {"path": "'{flight_record}'"}})
+
+    # WHEN
+    m.fetch_and_evaluate()
+
+    # THEN
+    assert m._last["path"] == ""
@@ -149,6 +149,17 @@ def test_incident_missing_optional_fields(fields):
         assert i
 
 
+@pytest.mark.parametrize("period", [0, -60])
+def test_incident_rate_period_not_positive(period):
+    # GIVEN
+    incident_dict = copy.deepcopy(INCIDENT_DICT1)
+    incident_dict["rate_period"] = period
+
+    # WHEN/THEN
+    with pytest.raises(Exception, match="'rate_period' of 'test' incident"):
+        Incident("test", incident_dict)
+
+
 def test_incident():
     # GIVEN
     incident_dict = copy.deepcopy(INCIDENT_DICT1)
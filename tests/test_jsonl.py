@@ -0,0 +1,129 @@
+# Copyright (c) 2021, 2022 Yoshihiro Ota <ota@j.email.ne.jp>
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+
+import json
+
+import pytest
+
+from prdanlz import Monitor
+from prdanlz.jsonl import encode, JsonlSink
+
+from .conftest import Clock, snapshot
+
+VALUES = {"one": 1, "load": (0.5, 1)}
+LEVELS = {"check": {"error": False, "info": True}}
+
+
+def test_encode():
+    # GIVEN/WHEN
+    line = encode(snapshot(3, VALUES, LEVELS))
+
+    # THEN
+    assert line.endswith(b"\n")
+    assert b" " not in line
+    assert json.loads(line) == {
+        "time": 103.0,
+        "tick": 3,
+        "values": {"one": 1, "load": [0.5, 1]},
+        "levels": {"check": ["info"]},
+    }
+
+
+def test_sink__buffers_until_interval(tmp_path):
+    # GIVEN
+    path = tmp_path / "samples.jsonl"
+    clock = Clock()
+    sink = JsonlSink(str(path), interval=10, clock=clock)
+
+    # WHEN
+    sink.publish(snapshot(0, VALUES, LEVELS))
+    sink.publish(snapshot(1, VALUES, LEVELS))
+
+    # THEN
+    assert path.read_bytes() == b""
+
+    # WHEN
+    clock.now = 10
+    sink.publish(snapshot(2, VALUES, LEVELS))
+
+    # THEN
+    assert [json.loads(l)["tick"] for l in path.read_bytes().splitlines()] == [0, 1, 2]
+    sink.close()
+
+
+def test_sink__buffers_until_size(tmp_path):
+    # GIVEN
+    path = tmp_path / "samples.jsonl"
+    size = len(encode(snapshot(0, VALUES, LEVELS)))
+    sink = JsonlSink(str(path), buffer_size=size * 2, clock=Clock())
+
+    # WHEN
+    for tick in range(3):
+        sink.publish(snapshot(tick, VALUES, LEVELS))
+
+    # THEN
+    assert len(path.read_bytes().splitlines()) == 2
+
+    # WHEN
+    sink.close()
+
+    # THEN
+    assert len(path.read_bytes().splitlines()) == 3
+
+
+def test_sink__rotates(tmp_path):
+    # GIVEN
+    path = tmp_path / "samples.jsonl"
+    size = len(encode(snapshot(0, VALUES, LEVELS)))
+    sink = JsonlSink(str(path), 0, max_bytes=size, backups=2, fsync="flush")
+
+    # WHEN
+    for tick in range(4):
+        sink.publish(snapshot(tick, VALUES, LEVELS))
+    sink.close()
+
+    # THEN - the oldest is removed
+    assert path.read_bytes() == b""
+    assert json.loads((tmp_path / "samples.jsonl.1").read_bytes())["tick"] == 3
+    assert json.loads((tmp_path / "samples.jsonl.2").read_bytes())["tick"] == 2
+    assert not (tmp_path / "samples.jsonl.3").exists()
+
+
+def test_sink__unknown_fsync(tmp_path):
+    # GIVEN/WHEN/THEN
+    with pytest.raises(ValueError):
+        JsonlSink(str(tmp_path / "samples.jsonl"), fsync="always")
+
+
+def test_monitor(tmp_path):
+    # GIVEN
+    path = tmp_path / "samples.jsonl"
+    m = Monitor()
+    m.load_json({"variables": {"one": {"type": "syscmd", "syscmd": "echo 1"}}})
+    m.add_sink(JsonlSink(str(path)))
+
+    # WHEN
+    m.start()
+
+    # THEN
+    assert json.loads(path.read_bytes())["values"] == {"one": "1"}
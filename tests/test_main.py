@@ -21,6 +21,8 @@
 # OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
 # SUCH DAMAGE.
 
+import logging
+import logging.handlers
 import pytest
 import sys
 from unittest.mock import patch
@@ -82,3 +84,35 @@ def test_main__verify(start):
     # Testing with capsys is more desirable but doesn't seem to capture stdout via logger
     # captured = capsys.readouterr()
     # assert "Resolved" in captured.out
+
+
+@pytest.mark.parametrize("option", [["--verify"], ["--bench", "1"]])
+@patch("prdanlz.monitor.Monitor.close")
+def test_main__closes_monitor_on_early_exits(close, option, capsys):
+    # GIVEN
+    with patch("sys.argv", ["prdanlz", "-c", "prdanlz.json"] + option):
+
+        # WHEN
+        main()
+
+    # THEN
+    close.assert_called_once_with()
+
+
+@patch("prdanlz.monitor.Monitor.fetch_and_evaluate")
+def test_main__log_is_written_by_listener(fetch_and_eval, tmp_path):
+    # GIVEN
+    log = tmp_path / "prdanlz.log"
+    argv = ["prdanlz", "-c", "prdanlz.json", "-l", str(log)]
+    with patch("sys.argv", argv), patch("logging.basicConfig") as config:
+
+        # WHEN
+        main()
+
+    # THEN - the root logger only queues records to format them later
+    handler = config.call_args[1]["handlers"][0]
+    assert isinstance(handler, logging.handlers.QueueHandler)
+    handler.handle(logging.makeLogRecord({"msg": "after %s", "args": ("stop",)}))
+    record = handler.queue.get_nowait()
+    assert record.args == ("stop",)
+    assert record.getMessage() == "after stop"
@@ -25,8 +25,9 @@ import pytest
 import copy
 import threading
 import time
+from unittest import mock
 
-from prdanlz import Monitor
+from prdanlz import expression, Monitor
 
 VARIABLE = {"ncpu": {"type": "sysctl", "sysctl": "hw.ncpu"}}
 VARIABLES = {
@@ -352,3 +353,591 @@ def test_monitor__interval():
 
     # THEN
     thread.join()
+
+
+def test_monitor__add_derivative_with_interval():
+    # GIVEN
+    m = Monitor()
+
+    # WHEN
+    count = m.add_derivatives({"expr": {"expression": "1 + 1", "interval": 10}})
+
+    # THEN
+    assert count == 1
+    m.evaludate_derivatives(m._locals)
+    assert m._locals["expr"] == 2
+
+
+def test_monitor__add_derivative_without_expression():
+    # GIVEN
+    m = Monitor()
+
+    # WHEN & THEN
+    with pytest.raises(Exception) as e:
+        m.add_derivatives({"expr": {"interval": 10}})
+    assert "'expression' is missing" in str(e)
+
+
+MULTI_RATE = {
+    "variables": {
+        "fast": {"type": "syscmd", "syscmd": "echo 1", "depth": 10},
+        "slow": {"type": "syscmd", "syscmd": "echo 1", "depth": 10, "interval": 3},
+    },
+    "derivatives": {
+        "fast_count": "len(fast._hist)",
+        "slow_count": {"expression": "len(fast._hist)", "interval": 3},
+    },
+    "incidents": {
+        "slow_check": {
+            "description": "check slow",
+            "info": {
+                "trigger": "{slow} == 0",
+                "untrigger": "{slow} == 1",
+                "escalation": "echo {slow}",
+            },
+        }
+    },
+}
+
+
+@mock.patch("prdanlz.incident.Incident.escalated")
+def test_monitor__multi_rate(escalated):
+    # GIVEN
+    m = Monitor(1)
+    m.load_json(MULTI_RATE)
+
+    # WHEN
+    for i in range(4):
+        m.fetch_and_evaluate()
+
+    # THEN - "slow" was fetched at 0 and 3 after its initial value
+    assert len(m._last["fast"]._hist) == 4
+    assert len(m._last["slow"]._hist) == 2
+    assert m._last["fast_count"] == 4
+    # staggered from "slow" and evaluated at 1 and keeps its value until due
+    assert m._last["slow_count"] == 2
+    # incident is evaluated only when "slow" was refreshed
+    assert escalated.call_count == 2
+
+    # WHEN
+    m.fetch_and_evaluate()
+
+    # THEN
+    assert m._last["fast_count"] == 5
+    assert m._last["slow_count"] == 5
+    assert escalated.call_count == 2
+
+
+def test_monitor__bad_overrun():
+    # GIVEN & WHEN & THEN
+    with pytest.raises(ValueError) as e:
+        m = Monitor(1, "wait")
+    assert "Unknown overrun policy" in str(e)
+
+
+def slow_cycle(m: Monitor, ticks: list):
+    def fetch_and_evaluate():
+        ticks.append(m._tick)
+        time.sleep(0.5)
+
+    return fetch_and_evaluate
+
+
+@pytest.mark.parametrize(
+    "overrun,expected",
+    [
+        ("skip", [0, 3, 6]),
+        ("catch-up", [0, 1, 2]),
+        ("coalesce", [0, 2, 5]),
+    ],
+)
+def test_monitor__overrun(overrun, expected):
+    # GIVEN - each cycle takes 2.5 intervals
+    m = Monitor(0.2, overrun)
+    ticks = []
+    m.fetch_and_evaluate = slow_cycle(m, ticks)
+
+    thread = threading.Thread(target=exit_monitor, args=(m, 1.3))
+    thread.start()
+
+    # WHEN
+    m.start()
+
+    # THEN
+    thread.join()
+    assert ticks == expected
+    assert m.stats.overruns == len(expected)
+
+
+def test_monitor__fetch_variables_in_order(tmp_path):
+    # GIVEN
+    out = tmp_path / "order"
+    m = Monitor()
+    m.add_variables(
+        {
+            name: {"type": "syscmd", "syscmd": f"echo {name} >> {out}"}
+            for name in ["c", "a", "b"]
+        }
+    )
+    out.write_text("")
+
+    # WHEN
+    m.fetch_variables(m._locals)
+
+    # THEN
+    assert out.read_text().split() == ["a", "b", "c"]
+
+
+def test_monitor__fetch_variables_in_parallel():
+    # GIVEN
+    m = Monitor(workers=4)
+    m.add_variables(
+        {
+            name: {"type": "syscmd", "syscmd": "sleep 0.3; echo done"}
+            for name in ["a", "b", "c", "d"]
+        }
+    )
+
+    # WHEN
+    start = time.monotonic()
+    m.fetch_variables(m._locals)
+    elapsed = time.monotonic() - start
+
+    # THEN
+    assert elapsed < 1.2
+    for name in ["a", "b", "c", "d"]:
+        assert m._locals[name].value == "done"
+
+
+PRUNING = {
+    "variables": {
+        "used": {"type": "syscmd", "syscmd": "echo 1"},
+        "unused": {"type": "syscmd", "syscmd": "echo 2"},
+        "through": {"type": "syscmd", "syscmd": "echo 3"},
+        "detail": {"type": "syscmd", "syscmd": "echo 4"},
+    },
+    "derivatives": {"derived": "{through} * 2", "orphan": "{unused} * 2"},
+    "incidents": {
+        "check": {
+            "description": "pruning",
+            "info": {
+                "trigger": "{used} + {derived} == 7",
+                "untrigger": "{used} + {derived} != 7",
+                "escalation": "echo {detail}",
+            },
+        }
+    },
+}
+
+
+@mock.patch("prdanlz.monitor.logger")
+def test_monitor__prune(logger):
+    # GIVEN
+    m = Monitor(prune=True)
+    m.load_json(PRUNING)
+
+    # WHEN
+    with mock.patch("os.system") as os_system:
+        m.fetch_and_evaluate()
+
+    # THEN
+    assert "derived" in m._last
+    assert "through" in m._last
+    assert "unused" not in m._last
+    assert "orphan" not in m._last
+    assert "orphan, unused" in logger.warning.mock_calls[0][1][0]
+    assert mock.call("Fetching only when escalations refer to: detail") in (
+        logger.info.mock_calls
+    )
+    # "detail" is fetched only to render the escalation
+    assert os_system.call_args_list[0][0][0] == "echo 4"
+
+
+def test_monitor__prune_lazily():
+    # GIVEN
+    m = Monitor(prune=True)
+    m.load_json(PRUNING)
+    detail = [v for v in m._variables if v.name == "detail"][0]
+    detail.new_value = mock.Mock()
+
+    # WHEN - not escalated
+    m._variables = {v for v in m._variables if v.name != "used"}
+    m.add_variables({"used": {"type": "syscmd", "syscmd": "echo 0"}})
+    m.fetch_and_evaluate()
+
+    # THEN
+    detail.new_value.assert_not_called()
+
+
+def test_monitor__without_prune():
+    # GIVEN
+    m = Monitor()
+    m.load_json(PRUNING)
+
+    # WHEN
+    with mock.patch("os.system") as os_system:
+        m.fetch_and_evaluate()
+
+    # THEN
+    for name in ["used", "unused", "through", "detail", "derived", "orphan"]:
+        assert name in m._last
+
+
+GUARDED = {
+    "variables": {
+        "load": {"type": "syscmd", "syscmd": "echo 5"},
+        "deep": {"type": "syscmd", "syscmd": "echo deep", "when": "{load} > 4"},
+        "deeper": {"type": "syscmd", "syscmd": "echo deeper", "when": "{load} > 8"},
+        "history": {"type": "syscmd", "syscmd": "echo 1", "depth": 2},
+        "later": {"type": "syscmd", "syscmd": "echo later", "when": "{history[1]}"},
+    },
+}
+
+
+def test_monitor__fetch_guarded_variables():
+    # GIVEN
+    m = Monitor()
+    m.load_json(GUARDED)
+
+    # WHEN
+    m.fetch_and_evaluate()
+
+    # THEN
+    assert m._last["deep"].value == "deep"
+    assert m._last["deeper"].value is None
+    # not enough history yet
+    assert m._last["later"].value is None
+
+    # WHEN
+    m.fetch_and_evaluate()
+    m.fetch_and_evaluate()
+
+    # THEN
+    assert m._last["later"].value == "later"
+
+
+def test_monitor__prune_keeps_guard_inputs():
+    # GIVEN
+    json = copy.deepcopy(GUARDED)
+    json["incidents"] = {
+        "check": {
+            "description": "guarded",
+            "info": {
+                "trigger": "'{deep}' == 'deep'",
+                "untrigger": "'{deep}' != 'deep'",
+                "escalation": "true",
+            },
+        }
+    }
+    m = Monitor(prune=True)
+    m.load_json(json)
+
+    # WHEN
+    with mock.patch("os.system"):
+        m.fetch_and_evaluate()
+
+    # THEN
+    assert m._last["load"].value == "5"
+    assert m._last["deep"].value == "deep"
+    assert "deeper" not in m._last
+
+
+RELOADED = {
+    "variables": {
+        "one": {"type": "syscmd", "syscmd": "echo 1", "history": 3},
+        "two": {"type": "syscmd", "syscmd": "echo 2"},
+    },
+    "incidents": {
+        "check": {
+            "description": "reloaded",
+            "info": {
+                "trigger": "{one} == 1",
+                "untrigger": "{one} != 1",
+                "escalation": "echo check",
+            },
+        }
+    },
+}
+
+
+def test_monitor__reload():
+    # GIVEN
+    m = Monitor()
+    m.load_json(RELOADED)
+    with mock.patch("os.system") as system:
+        m.fetch_and_evaluate()
+    one = m._last["one"]
+    two = m._last["two"]
+    json = copy.deepcopy(RELOADED)
+    json["variables"]["two"]["syscmd"] = "echo 3"
+    json["incidents"]["other"] = json["incidents"]["check"]
+
+    # WHEN
+    assert m.reload([json])
+    with mock.patch("os.system") as system:
+        m.fetch_and_evaluate()
+
+    # THEN - "one" and "check" are carried over
+    assert m._last["one"] is one
+    assert len(one._hist) == 2
+    assert m._last["two"] is not two
+    assert m._last["two"].value == "3"
+    assert system.call_args_list == [mock.call("echo check")]
+
+
+def test_monitor__reload_on_hangup():
+    # GIVEN
+    m = Monitor()
+    m.load_json(RELOADED)
+    json = copy.deepcopy(RELOADED)
+    json["variables"]["two"]["syscmd"] = "echo 3"
+    reloader = mock.Mock(return_value=[json])
+    m.set_reloader(reloader)
+
+    # WHEN - the signal handler only takes note
+    m._hangup()
+
+    # THEN
+    reloader.assert_not_called()
+
+    # WHEN
+    with mock.patch("os.system"):
+        m.fetch_and_evaluate()
+
+    # THEN - read and applied by the cycle
+    reloader.assert_called_once_with()
+    assert m._last["two"].value == "3"
+
+
+def test_monitor__reload_keeps_class_and_settings():
+    # GIVEN
+    class Custom(Monitor):
+        pass
+
+    m = Custom(prune=True)
+    m.load_json(RELOADED)
+
+    # WHEN
+    assert m.reload([RELOADED])
+
+    # THEN
+    assert type(m._staged) is Custom
+    assert m._staged._prune
+
+
+def test_monitor__reload_releases_replaced(tmp_path):
+    # GIVEN
+    log = tmp_path / "log"
+    log.write_text("a\n")
+    m = Monitor()
+    m.load_json(
+        {
+            "variables": {"log": {"type": "file", "file": str(log)}},
+            "derivatives": {"old": "{log}"},
+        }
+    )
+    m.fetch_and_evaluate()
+    replaced = next(iter(m._variables))
+    json = copy.deepcopy(RELOADED)
+    json["derivatives"] = {"next": "{one} + 1"}
+    assert "{log}" in expression._templates
+
+    # WHEN
+    assert m.reload([json])
+    with mock.patch("os.system"):
+        m.fetch_and_evaluate()
+
+    # THEN - the file is closed and templates of the old one are dropped
+    assert replaced._file is None
+    assert "{log}" not in expression._templates
+    assert "{one} + 1" in expression._templates
+
+
+def test_monitor__reload_invalid():
+    # GIVEN
+    m = Monitor()
+    m.load_json(RELOADED)
+    json = copy.deepcopy(RELOADED)
+    json["incidents"]["check"]["info"]["trigger"] = "{one"
+
+    # WHEN/THEN
+    assert not m.reload([json])
+    assert not m.reload([RELOADED, RELOADED])
+    assert m._staged is None
+
+
+def test_monitor__timings():
+    # GIVEN
+    m = Monitor()
+    m.load_json(RELOADED)
+
+    # WHEN
+    with mock.patch("os.system", return_value=1):
+        m.fetch_constants()
+        m.fetch_and_evaluate()
+    timings = m.timings()
+
+    # THEN
+    assert set(timings["stage"]) == {
+        "constants",
+        "cycle",
+        "variables",
+        "derivatives",
+        "incidents",
+    }
+    assert set(timings["variable"]) == {"one", "two"}
+    assert timings["incident"]["check"]["count"] == 1
+    assert set(timings["level"]) == {"check.info"}
+    assert timings["escalation"]["check"]["errors"] == 1
+    assert timings["cycles"]["skipped"] == 0
+
+
+@mock.patch("prdanlz.monitor.logger")
+def test_log_changes(logger):
+    # GIVEN
+    logger.isEnabledFor.return_value = True
+    m = Monitor()
+    m.load_json({"variables": VARIABLE, "derivatives": DERIVATIVE})
+    m.set_log_changes()
+    logger.reset_mock()
+
+    # WHEN
+    m.fetch_and_evaluate()
+    m.fetch_and_evaluate()
+
+    # THEN - unchanged values are logged once
+    assert [c[1][1] for c in logger.info.mock_calls] == ["ncpu", "expr"]
+
+
+@mock.patch("prdanlz.monitor.logger")
+def test_log_disabled(logger):
+    # GIVEN
+    logger.isEnabledFor.return_value = False
+    m = Monitor()
+    m.load_json({"variables": VARIABLE, "derivatives": DERIVATIVE})
+    logger.reset_mock()
+
+    # WHEN
+    m.fetch_and_evaluate()
+
+    # THEN - nothing to format is passed
+    logger.info.assert_not_called()
+    assert all(len(c[1]) == 1 for c in logger.debug.mock_calls)
+
+
+@mock.patch("prdanlz.monitor.logger")
+def test_monitor__interval_survives_failing_cycle(logger):
+    # GIVEN - the derivative divides by zero at the first cycle only
+    m = Monitor(0.05)
+    m.load_json(
+        {
+            "variables": {"count": {"type": "synthetic", "synthetic": "counter"}},
+            "derivatives": {"inverse": "1 / ({count} - 2)"},
+        }
+    )
+    thread = threading.Thread(target=exit_monitor, args=(m, 0.3))
+    thread.start()
+
+    # WHEN
+    m.start()
+
+    # THEN
+    thread.join()
+    cycle = m.timings()["stage"]["cycle"]
+    assert cycle["count"] >= 3
+    assert cycle["errors"] == 1
+    assert logger.exception.call_count == 1
+    assert m._last["inverse"] > 0
+
+
+@pytest.mark.parametrize(
+    "when, message",
+    [
+        ("{ratio} > 1", "refers to derivative 'ratio'"),
+        ("{missing[0]} > 1", "refers to unknown 'missing'"),
+    ],
+)
+def test_monitor__guard_refers_to_derivative_or_unknown(when, message):
+    # GIVEN
+    json = {
+        "variables": {
+            "load": {"type": "syscmd", "syscmd": "echo 5"},
+            "deep": {"type": "syscmd", "syscmd": "echo deep", "when": when},
+        },
+        "derivatives": {"ratio": "{load} / 2"},
+    }
+    m = Monitor()
+    m.load_json(json)
+
+    # WHEN/THEN
+    with pytest.raises(Exception) as e:
+        m.start()
+    assert message in str(e.value)
+    assert not m.reload([json])
+
+
+def test_monitor__guard_failing_is_false():
+    # GIVEN - neither holds nor fails the cycle
+    m = Monitor()
+    m.load_json(
+        {
+            "variables": {
+                "word": {"type": "syscmd", "syscmd": "echo x"},
+                "named": {"type": "syscmd", "syscmd": "echo 1", "when": "{word}"},
+                "typed": {"type": "syscmd", "syscmd": "echo 2", "when": "'{word}' > 1"},
+            },
+            "derivatives": {"ran": "1"},
+        }
+    )
+
+    # WHEN
+    m.fetch_and_evaluate()
+
+    # THEN
+    assert m._last["named"].value is None
+    assert m._last["typed"].value is None
+    assert m._last["ran"] == 1
+
+
+def test_monitor__escalation_handler():
+    # GIVEN
+    m = Monitor(escalation_workers=0)
+    m.load_json(
+        {
+            "variables": {},
+            "incidents": {
+                "check": {
+                    "description": "handled",
+                    "info": {
+                        "trigger": "True",
+                        "untrigger": "False",
+                        "escalation": "echo {description}",
+                    },
+                }
+            },
+        }
+    )
+    handler = mock.Mock()
+    m.set_escalation_handler(handler)
+
+    # WHEN
+    with mock.patch("os.system") as system:
+        m.fetch_and_evaluate()
+
+    # THEN - passed to the handler instead of run
+    handler.assert_called_once_with(mock.ANY, "info", "echo handled")
+    system.assert_not_called()
+
+
+def test_monitor__close():
+    # GIVEN
+    m = Monitor(workers=2, escalation_workers=1)
+    sink = mock.Mock()
+    m.add_sink(sink)
+
+    # WHEN
+    m.close()
+    m.close()
+
+    # THEN - only once
+    sink.close.assert_called_once_with()
@@ -0,0 +1,69 @@
+# Copyright (c) 2022 Yoshihiro Ota <ota@j.email.ne.jp>
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+
+import pstats
+import tracemalloc
+
+from prdanlz import Monitor
+from prdanlz.profiler import Profiler
+
+CONFIG = {
+    "variables": {"one": {"type": "syscmd", "syscmd": "echo 1", "history": 5}},
+    "derivatives": {"two": "{one} * 2"},
+}
+
+
+def test_profiler__idle(tmp_path):
+    # GIVEN
+    m = Monitor()
+    m.load_json(CONFIG)
+    m.set_profiler(Profiler(str(tmp_path)))
+
+    # WHEN
+    m._cycle()
+
+    # THEN
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_profiler__cycles(tmp_path):
+    # GIVEN
+    m = Monitor()
+    m.load_json(CONFIG)
+    profiler = Profiler(str(tmp_path), frames=5)
+    m.set_profiler(profiler)
+
+    # WHEN
+    profiler.arm(2)
+    for tick in range(3):
+        m._tick = tick
+        m._cycle()
+
+    # THEN - 2 cycles are profiled
+    names = sorted(p.name.split("-")[-1] for p in tmp_path.iterdir())
+    assert names == ["0.pstats", "0.tracemalloc", "1.pstats", "1.tracemalloc"]
+    profile = next(tmp_path.glob("*-0.pstats"))
+    stats = pstats.Stats(str(profile))
+    assert any(f[2] == "fetch_and_evaluate" for f in stats.stats)
+    assert not profiler.begin(3)
+    assert not tracemalloc.is_tracing()
@@ -0,0 +1,161 @@
+# Copyright (c) 2021, 2022 Yoshihiro Ota <ota@j.email.ne.jp>
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+
+import json
+from unittest import mock
+
+from prdanlz import replay
+
+CONFIG = {
+    "variables": {
+        "cpu": {"type": "sysctl", "sysctl": "kern.cp_time", "history": 1},
+        "host": {"type": "syscmd", "syscmd": "exit 1"},
+    },
+    "derivatives": {"rising": "{cpu} > {cpu[-1]}"},
+    "incidents": {
+        "busy": {
+            "description": "load",
+            "dedup": 60,
+            "error": {
+                "trigger": "{cpu} > 2 and {rising}",
+                "untrigger": "{cpu} < 1",
+                "escalation": "echo {cpu} on {host}",
+            },
+        }
+    },
+}
+
+
+def record(path, cpus, skip=None) -> str:
+    with open(path, "w") as f:
+        for i, cpu in enumerate(cpus):
+            values = {"cpu": cpu, "host": "db1"}
+            line = json.dumps({"time": 1000.0 + i * 10, "values": values})
+            f.write(line[:10] if i == skip else line)
+            f.write("\n")
+    return str(path)
+
+
+def test_replay(tmp_path):
+    # GIVEN
+    path = record(tmp_path / "samples.jsonl", [0.5, 2.5, 3, 0.5, 2.5, 2])
+
+    # WHEN
+    cycles, events, skipped = replay.replay([CONFIG], [path])
+
+    # THEN - the second escalation is within "dedup" of the first one
+    assert cycles == 6
+    assert skipped == {}
+    assert events == [
+        (1010.0, "busy", "error", "triggered", None),
+        (1010.0, "busy", "error", "escalated", "echo 2.5 on db1"),
+        (1030.0, "busy", "error", "untriggered", None),
+        (1040.0, "busy", "error", "triggered", None),
+    ]
+
+
+def test_replay__files_in_order(tmp_path):
+    # GIVEN
+    older = record(tmp_path / "samples.jsonl.1", [0.5, 2.5])
+    newer = record(tmp_path / "samples.jsonl", [0.5], skip=1)
+
+    # WHEN
+    cycles, events, skipped = replay.replay([CONFIG], [older, newer])
+
+    # THEN
+    assert cycles == 3
+    assert [e[3] for e in events] == ["triggered", "escalated", "untriggered"]
+
+
+def test_replay__gaps(tmp_path):
+    # GIVEN - "cpu" is missing from the first and the third records
+    path = tmp_path / "samples.jsonl"
+    with open(path, "w") as f:
+        for i, cpu in enumerate([None, 0.5, None, 2.5, 3]):
+            values = {"host": "db1"} if cpu is None else {"cpu": cpu, "host": "db1"}
+            f.write(json.dumps({"time": 1000.0 + i * 10, "values": values}) + "\n")
+
+    # WHEN
+    with mock.patch("prdanlz.replay.logger"):
+        cycles, events, skipped = replay.replay([CONFIG], [str(path)])
+
+    # THEN - the gap keeps the last value and the replay goes on
+    assert cycles == 5
+    assert events == [
+        (1030.0, "busy", "error", "triggered", None),
+        (1030.0, "busy", "error", "escalated", "echo 2.5 on db1"),
+    ]
+
+
+def test_replay__empty(tmp_path):
+    # GIVEN
+    path = record(tmp_path / "samples.jsonl", [])
+
+    # WHEN
+    cycles, events, skipped = replay.replay([CONFIG], [path])
+
+    # THEN - nothing is recorded for "busy" to refer to either
+    assert (cycles, events) == (0, [])
+    assert skipped == {"busy": {"cpu"}}
+
+
+def test_replay__variable_not_recorded(tmp_path):
+    # GIVEN - "swap" was not fetched when recorded
+    path = record(tmp_path / "samples.jsonl", [0.5, 2.5, 3])
+    config = json.loads(json.dumps(CONFIG))
+    config["variables"]["swap"] = {"type": "sysctl", "sysctl": "vm.swap_total"}
+    config["derivatives"]["swapping"] = "{swap} > 0"
+    config["incidents"]["swap"] = {
+        "description": "swap",
+        "warn": {
+            "trigger": "{swapping}",
+            "untrigger": "not {swapping}",
+            "escalation": "echo swapping",
+        },
+    }
+
+    # WHEN
+    cycles, events, skipped = replay.replay([config], [path])
+
+    # THEN - "busy" is still replayed
+    assert cycles == 3
+    assert skipped == {"swap": {"swap"}}
+    assert [e[1] for e in events] == ["busy", "busy"]
+    assert "swapping" in config["derivatives"]
+
+
+def test_report():
+    # GIVEN
+    events = [
+        (1010.0, "busy", "error", "triggered", None),
+        (1010.0, "busy", "error", "escalated", "echo"),
+    ]
+
+    # WHEN
+    lines = replay.report(2, events, {"swap": {"swap"}})
+
+    # THEN
+    assert lines[0] == "Skipped 'swap' which refers to what is not recorded: swap"
+    assert lines[1].endswith(" 'busy' error triggered")
+    assert lines[2].endswith(" 'busy' error escalated: [echo]")
+    assert lines[3] == "Replayed 2 cycles with 1 transitions"
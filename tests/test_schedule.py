@@ -0,0 +1,103 @@
+# Copyright (c) 2022 Yoshihiro Ota <ota@j.email.ne.jp>
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+
+import pytest
+
+from prdanlz.schedule import CycleStats, Scheduler
+
+
+def test_scheduler__all_due_at_first():
+    # GIVEN
+    s = Scheduler()
+    s.add("a", 1)
+    s.add("b", 3)
+
+    # WHEN & THEN
+    assert s.due(0) == {"a", "b"}
+
+
+def test_scheduler__periods():
+    # GIVEN
+    s = Scheduler()
+    s.add("a", 1)
+    s.add("b", 3)
+
+    # WHEN
+    due = [s.due(tick) for tick in range(7)]
+
+    # THEN
+    assert due == [{"a", "b"}, {"a"}, {"a"}, {"a", "b"}, {"a"}, {"a"}, {"a", "b"}]
+
+
+def test_scheduler__staggered():
+    # GIVEN
+    s = Scheduler()
+    for item in ["a", "b", "c"]:
+        s.add(item, 3)
+
+    # WHEN
+    s.due(0)
+    due = [s.due(tick) for tick in range(1, 7)]
+
+    # THEN - each item at its own tick
+    assert due == [{"b"}, {"c"}, {"a"}, {"b"}, {"c"}, {"a"}]
+
+
+def test_scheduler__skipped_ticks():
+    # GIVEN
+    s = Scheduler()
+    s.add("a", 2)
+    s.due(0)
+
+    # WHEN & THEN - due once even though ticks 2 and 4 were missed
+    assert s.due(5) == {"a"}
+    assert s.due(6) == {"a"}
+    assert s.due(7) == set()
+
+
+@pytest.mark.parametrize("period", [0, -1])
+def test_scheduler__non_positive_period(period):
+    # GIVEN
+    s = Scheduler()
+    s.add("a", period)
+
+    # WHEN & THEN
+    assert s.due(0) == {"a"}
+    assert s.due(1) == {"a"}
+
+
+def test_cycle_stats():
+    # GIVEN
+    stats = CycleStats()
+
+    # WHEN & THEN
+    assert not stats.record(0.1, 0.5, 1)
+    assert stats.record(0.3, 1.5, 1)
+
+    # THEN
+    assert stats.cycles == 2
+    assert stats.overruns == 1
+    assert stats.max_lateness == 0.3
+    assert stats.mean_lateness == pytest.approx(0.2)
+    assert stats.max_duration == 1.5
+    assert "overruns=1" in str(stats)
@@ -0,0 +1,176 @@
+# Copyright (c) 2022 Yoshihiro Ota <ota@j.email.ne.jp>
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+
+from unittest import mock
+
+from prdanlz import ShardedMonitor, SyscmdVariable
+from prdanlz.shard import Frozen, partition
+
+
+def incident(trigger: str, escalation: str) -> dict:
+    return {
+        "description": "sharded",
+        "info": {
+            "trigger": trigger,
+            "untrigger": f"not ({trigger})",
+            "escalation": escalation,
+        },
+    }
+
+
+SHARDED = {
+    "variables": {
+        "one": {"type": "syscmd", "syscmd": "echo 1", "history": 3},
+        "two": {"type": "syscmd", "syscmd": "echo 2"},
+    },
+    "derivatives": {"three": "{one} + {two}"},
+    "incidents": {
+        "a": incident("{one} == 1", "echo a {one}"),
+        "b": incident("{three} == 3", "echo b {three}"),
+        "c": incident("{two} == 2", "echo c {two}"),
+        "d": incident("{one[-3]} == 1", "echo d"),
+    },
+}
+
+
+def test_partition():
+    # GIVEN
+    incidents = {
+        "a": {"x", "y"},
+        "b": {"z"},
+        "c": {"x"},
+        "d": {"z", "w"},
+    }
+
+    # WHEN
+    shards = partition(incidents, 2)
+
+    # THEN - incidents sharing names are together
+    assert shards == [(["a", "c"], {"x", "y"}), (["d", "b"], {"z", "w"})]
+    assert partition(incidents, 8) == [
+        (["a"], {"x", "y"}),
+        (["d"], {"z", "w"}),
+        (["b"], {"z"}),
+        (["c"], {"x"}),
+    ]
+    assert partition({}, 2) == []
+
+
+def test_frozen():
+    # GIVEN
+    v = SyscmdVariable("v", {"type": "syscmd", "syscmd": "echo 1", "history": 2})
+    v.new_value()
+
+    # WHEN
+    f = Frozen(v)
+    v.new_value()
+
+    # THEN
+    assert f"{f}" == "1"
+    assert f[-1] == "1"
+    assert f.last_value == "1"
+    assert f.oldest_value == "1"
+    assert len(v._hist) == 2
+
+
+def test_sharded_monitor():
+    # GIVEN
+    m = ShardedMonitor(shards=2)
+    m.load_json(SHARDED)
+
+    try:
+        # WHEN
+        with mock.patch("os.system") as system:
+            m.fetch_and_evaluate()
+
+        # THEN - "d" waits for history
+        assert len(m._shards) == 2
+        assert sorted(system.call_args_list) == [
+            mock.call("echo a 1"),
+            mock.call("echo b 3"),
+            mock.call("echo c 2"),
+        ]
+        levels = {i.name: i.triggered_level for i in m._incidents}
+        assert levels == {"a": "info", "b": "info", "c": "info", "d": None}
+
+        # WHEN
+        with mock.patch("os.system") as system:
+            m.fetch_and_evaluate()
+            m.fetch_and_evaluate()
+
+        # THEN - levels are kept in shards
+        assert system.call_args_list == [mock.call("echo d")]
+        assert {i.name: i.triggered_level for i in m._incidents}["d"] == "info"
+    finally:
+        m.close()
+
+
+def test_sharded_monitor__incident_fails():
+    # GIVEN - "b" fails and "c" after it in the same shard is not evaluated
+    m = ShardedMonitor(shards=1)
+    m.load_json(
+        {
+            "variables": SHARDED["variables"],
+            "incidents": {
+                "a": incident("{one} == 1", "echo a"),
+                "b": incident("1 / ({two} - 2) > 0", "echo b"),
+                "c": incident("{two} == 2", "echo c"),
+            },
+        }
+    )
+
+    try:
+        # WHEN
+        with mock.patch("os.system") as system, mock.patch(
+            "prdanlz.shard.logger"
+        ) as logger:
+            m.fetch_and_evaluate()
+
+        # THEN - logged instead of raised
+        assert system.call_args_list == [mock.call("echo a")]
+        assert logger.error.call_count == 1
+        errors = {n: t["errors"] for n, t in m.timings()["incident"].items()}
+        assert errors == {"a": 0, "b": 1, "c": 1}
+        assert ("incident", "a") not in m._stale
+        assert ("incident", "c") in m._stale
+    finally:
+        m.close()
+
+
+def test_sharded_monitor__close():
+    # GIVEN - cycles run without start()
+    m = ShardedMonitor(shards=2)
+    m.load_json(SHARDED)
+    sink = mock.Mock()
+    m.add_sink(sink)
+    with mock.patch("os.system"):
+        m.fetch_and_evaluate()
+    processes = [shard._process for shard in m._shards]
+
+    # WHEN
+    m.close()
+
+    # THEN
+    assert m._shards == []
+    assert not any(p.is_alive() for p in processes)
+    sink.close.assert_called_once_with()
@@ -0,0 +1,155 @@
+# Copyright (c) 2021, 2022 Yoshihiro Ota <ota@j.email.ne.jp>
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+
+import math
+import os
+import subprocess
+import sys
+
+import pytest
+
+pytest.importorskip("multiprocessing.shared_memory")
+
+from prdanlz.shm import GENERATION, HEADER, SharedSnapshot, SnapshotReader
+from prdanlz.snapshot import Snapshot
+
+LEVELS = {"check": {"error": False, "info": True}}
+
+
+@pytest.fixture
+def shared():
+    s = SharedSnapshot(f"prdanlz-test-{os.getpid()}", slots=8)
+    yield s
+    s.close()
+
+
+def test_read(shared):
+    # GIVEN
+    shared.publish(Snapshot(3, 100.0, {"load": [0.5, 1], "name": "x"}, LEVELS, dict))
+
+    # WHEN
+    with SnapshotReader(shared.name) as reader:
+        tick, time, numbers = reader.read()
+        load = reader.get("load.1")
+        missing = reader.get("missing")
+
+    # THEN
+    assert (tick, time) == (3, 100.0)
+    assert numbers == {
+        "load.0": 0.5,
+        "load.1": 1.0,
+        "triggered.check.error": 0.0,
+        "triggered.check.info": 1.0,
+    }
+    assert load == 1.0
+    assert missing is None
+
+
+def test_read__series_added_and_missing(shared):
+    # GIVEN
+    reader = SnapshotReader(shared.name)
+    shared.publish(Snapshot(0, 100.0, {"one": 1}, {}, dict))
+    assert reader.series() == ["one"]
+
+    # WHEN
+    shared.publish(Snapshot(1, 101.0, {"two": 2}, {}, dict))
+
+    # THEN
+    _, _, numbers = reader.read()
+    assert math.isnan(numbers["one"])
+    assert numbers["two"] == 2.0
+    assert reader.get("two") == 2.0
+    reader.close()
+
+
+def test_read__full(shared):
+    # GIVEN/WHEN
+    shared.publish(Snapshot(0, 100.0, {"v": list(range(10))}, {}, dict))
+
+    # THEN
+    with SnapshotReader(shared.name) as reader:
+        assert len(reader.series()) == 8
+
+
+def test_read__being_written(shared):
+    # GIVEN
+    shared.publish(Snapshot(0, 100.0, {"one": 1}, {}, dict))
+    reader = SnapshotReader(shared.name, retries=3)
+    assert reader.get("one") == 1.0
+
+    # WHEN - a writer stopped in the middle
+    GENERATION.pack_into(shared._shm.buf, 8, 3)
+
+    # THEN
+    with pytest.raises(TimeoutError):
+        reader.get("one")
+    reader.close()
+
+
+def test_read__another_process(shared):
+    # GIVEN
+    shared.publish(Snapshot(0, 100.0, {"one": 1}, {}, dict))
+    code = (
+        "import sys; from prdanlz.shm import SnapshotReader;"
+        f"print(SnapshotReader('{shared.name}').get('one'))"
+    )
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join(sys.path)}
+
+    # WHEN
+    for _ in range(2):
+        out = subprocess.run(
+            [sys.executable, "-c", code], env=env, stdout=subprocess.PIPE, check=True
+        ).stdout
+
+        # THEN - readers leave the segment when they exit
+        assert out.strip() == b"1.0"
+
+
+def test_shared__in_use(shared):
+    # GIVEN/WHEN/THEN
+    with pytest.raises(Exception, match=f"used by process {os.getpid()}"):
+        SharedSnapshot(shared.name, slots=8)
+    shared.publish(Snapshot(0, 100.0, {"one": 1}, {}, dict))
+    with SnapshotReader(shared.name) as reader:
+        assert reader.get("one") == 1.0
+
+
+def test_shared__left_behind():
+    # GIVEN - a writer which exited without removing the segment
+    stale = SharedSnapshot(f"prdanlz-test-{os.getpid()}", slots=8)
+    stale.publish(Snapshot(0, 100.0, {"one": 1}, {}, dict))
+    exited = subprocess.Popen([sys.executable, "-c", ""])
+    exited.wait()
+    HEADER.pack_into(
+        stale._shm.buf, 0, *HEADER.unpack_from(stale._shm.buf)[:8], exited.pid
+    )
+
+    # WHEN
+    shared = SharedSnapshot(stale.name, slots=8)
+
+    # THEN
+    with SnapshotReader(shared.name) as reader:
+        assert reader.series() == []
+    shared.close()
+    stale._values.release()
+    stale._shm.close()
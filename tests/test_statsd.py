@@ -0,0 +1,135 @@
+# Copyright (c) 2021, 2022 Yoshihiro Ota <ota@j.email.ne.jp>
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+
+import socket
+
+import pytest
+
+from prdanlz.snapshot import Snapshot
+from prdanlz.statsd import StatsdSink
+
+VALUES = {"load": [0.5, 1], "name": "db1", "free mem": 3, "swap": 7}
+LEVELS = {"check": {"error": False, "info": True}}
+
+
+@pytest.fixture
+def listener():
+    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    s.bind(("127.0.0.1", 0))
+    s.settimeout(5)
+    yield s
+    s.close()
+
+
+def receive(s: socket.socket, count: int):
+    return [s.recv(65536).split(b"\n") for _ in range(count)]
+
+
+def test_publish(listener):
+    # GIVEN
+    sink = StatsdSink("127.0.0.1:%d" % listener.getsockname()[1])
+
+    # WHEN
+    sink.publish(Snapshot(0, 0.0, VALUES, LEVELS, dict))
+
+    # THEN - strings are skipped, and unsafe characters are replaced
+    assert receive(listener, 1) == [
+        [
+            b"prdanlz.load.0:0.5|g",
+            b"prdanlz.load.1:1.0|g",
+            b"prdanlz.free_mem:3.0|g",
+            b"prdanlz.swap:7.0|g",
+            b"prdanlz.triggered.check.error:0|g",
+            b"prdanlz.triggered.check.info:1|g",
+        ]
+    ]
+    assert sink.sent == 1
+    sink.close()
+
+
+def test_publish__negative_and_not_finite(listener):
+    # GIVEN
+    sink = StatsdSink("127.0.0.1:%d" % listener.getsockname()[1], mtu=30)
+    values = {"a": -3.5, "b": float("nan"), "c": [float("inf"), -float("inf")]}
+
+    # WHEN
+    sink.publish(Snapshot(0, 0.0, values, {}, dict))
+
+    # THEN - a negative value is set from zero within a datagram
+    assert receive(listener, 1) == [[b"prdanlz.a:0|g", b"prdanlz.a:-3.5|g"]]
+    sink.close()
+
+
+def test_publish__include_and_tags(listener):
+    # GIVEN
+    address = "127.0.0.1:%d" % listener.getsockname()[1]
+    sink = StatsdSink(address, "host", ["lo*"], ["host:db1", "env:prod"])
+
+    # WHEN
+    sink.publish(Snapshot(0, 0.0, VALUES, {}, dict))
+
+    # THEN
+    assert receive(listener, 1) == [
+        [
+            b"host.load.0:0.5|g|#host:db1,env:prod",
+            b"host.load.1:1.0|g|#host:db1,env:prod",
+        ]
+    ]
+    sink.close()
+
+
+def test_publish__packs_up_to_mtu(listener):
+    # GIVEN
+    sink = StatsdSink("127.0.0.1:%d" % listener.getsockname()[1], mtu=50)
+
+    # WHEN
+    sink.publish(Snapshot(0, 0.0, VALUES, LEVELS, dict))
+
+    # THEN
+    datagrams = receive(listener, 4)
+    assert [len(d) for d in datagrams] == [2, 2, 1, 1]
+    assert all(len(b"\n".join(d)) <= 50 for d in datagrams)
+    assert sink.sent == 4
+    sink.close()
+
+
+def test_publish__unix(tmp_path):
+    # GIVEN
+    path = str(tmp_path / "statsd.sock")
+    s = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    s.bind(path)
+    sink = StatsdSink(path, include=["swap"])
+
+    # WHEN
+    sink.publish(Snapshot(0, 0.0, VALUES, {}, dict))
+
+    # THEN
+    assert s.recv(65536) == b"prdanlz.swap:7.0|g"
+    s.close()
+
+    # WHEN - nobody listens
+    sink.publish(Snapshot(1, 0.0, VALUES, {}, dict))
+
+    # THEN
+    assert (sink.sent, sink.dropped) == (1, 1)
+    sink.close()
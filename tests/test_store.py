@@ -0,0 +1,189 @@
+# Copyright (c) 2021, 2022 Yoshihiro Ota <ota@j.email.ne.jp>
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+
+import os
+
+import pytest
+
+from prdanlz import store
+from prdanlz.snapshot import Snapshot
+
+from .conftest import Clock
+
+
+def write(directory, count: int, chunk: int = 4) -> None:
+    s = store.ColumnStore(str(directory), chunk=chunk, clock=Clock())
+    for i in range(count):
+        values = {"load": [i / 10, 2 * i], "name": "x", "/dev": i}
+        s.publish(Snapshot(i, 1000.0 + i, values, {}, dict))
+    s.close()
+
+
+@pytest.fixture(params=["numpy", "python"])
+def aggregation(request, monkeypatch):
+    if request.param == "numpy":
+        pytest.importorskip("numpy")
+    else:
+        monkeypatch.setattr(store, "numpy", None)
+    return request.param
+
+
+def test_store__columns_in_chunks(tmp_path):
+    # GIVEN/WHEN
+    write(tmp_path, 10)
+
+    # THEN - strings are skipped, and names are quoted
+    assert sorted(os.listdir(tmp_path)) == ["%2Fdev", "load.0", "load.1"]
+    chunks = sorted(os.listdir(tmp_path / "load.1"))
+    assert chunks == ["00000000.col", "00000001.col", "00000002.col"]
+    sizes = [os.path.getsize(tmp_path / "load.1" / c) for c in chunks]
+    assert sizes == [64, 64, 32]
+
+
+def test_store__buffers_until_interval(tmp_path):
+    # GIVEN
+    clock = Clock()
+    s = store.ColumnStore(str(tmp_path), interval=10, clock=clock)
+
+    # WHEN
+    s.publish(Snapshot(0, 1000.0, {"one": 1}, {}, dict))
+
+    # THEN
+    assert not os.path.exists(tmp_path / "one" / "00000000.col")
+
+    # WHEN
+    clock.now = 10
+    s.publish(Snapshot(1, 1001.0, {"one": 1}, {}, dict))
+
+    # THEN
+    assert os.path.getsize(tmp_path / "one" / "00000000.col") == 32
+
+
+def test_store__appends_to_last_chunk(tmp_path):
+    # GIVEN
+    write(tmp_path, 6)
+
+    # WHEN
+    write(tmp_path, 3)
+
+    # THEN
+    sizes = [
+        os.path.getsize(tmp_path / "load.1" / c)
+        for c in sorted(os.listdir(tmp_path / "load.1"))
+    ]
+    assert sizes == [64, 64, 16]
+
+
+def test_store__truncates_torn_record(tmp_path):
+    # GIVEN - the last record was partly written
+    write(tmp_path, 3)
+    path = tmp_path / "load.1" / "00000000.col"
+    with open(path, "ab") as f:
+        f.write(b"\0" * 5)
+
+    # WHEN
+    write(tmp_path, 1)
+
+    # THEN
+    with store.Reader(str(tmp_path), "load.1") as reader:
+        records = list(reader.records(0, 2000))
+    assert records == [(1000.0, 0.0), (1001.0, 2.0), (1002.0, 4.0), (1002.0, 0.0)]
+
+
+def test_store__time_stepping_back(tmp_path):
+    # GIVEN
+    s = store.ColumnStore(str(tmp_path), interval=0, clock=Clock())
+
+    # WHEN - the clock steps back by 10 seconds
+    for i, time in enumerate([1000.0, 1001.0, 991.0, 1002.0]):
+        s.publish(Snapshot(i, time, {"one": i}, {}, dict))
+    s.close()
+
+    # THEN - searched in order
+    with store.Reader(str(tmp_path), "one") as reader:
+        records = list(reader.records(1001, 1003))
+    assert records == [(1001.0, 1.0), (1001.0, 2.0), (1002.0, 3.0)]
+
+
+def test_reader__records(tmp_path):
+    # GIVEN
+    write(tmp_path, 10)
+
+    # WHEN
+    with store.Reader(str(tmp_path), "load.1") as reader:
+        records = list(reader.records(1003, 1007))
+
+    # THEN
+    assert records == [(1003.0, 6.0), (1004.0, 8.0), (1005.0, 10.0), (1006.0, 12.0)]
+
+
+def test_reader__missing(tmp_path):
+    # GIVEN/WHEN/THEN
+    with pytest.raises(KeyError):
+        store.Reader(str(tmp_path), "missing")
+
+
+@pytest.mark.parametrize(
+    "agg, expect",
+    [
+        ("avg", [(1000.0, 2.0), (1003.0, 8.0), (1006.0, 14.0), (1009.0, 18.0)]),
+        ("min", [(1000.0, 0.0), (1003.0, 6.0), (1006.0, 12.0), (1009.0, 18.0)]),
+        ("max", [(1000.0, 4.0), (1003.0, 10.0), (1006.0, 16.0), (1009.0, 18.0)]),
+        ("sum", [(1000.0, 6.0), (1003.0, 24.0), (1006.0, 42.0), (1009.0, 18.0)]),
+        ("count", [(1000.0, 3.0), (1003.0, 3.0), (1006.0, 3.0), (1009.0, 1.0)]),
+        ("last", [(1000.0, 4.0), (1003.0, 10.0), (1006.0, 16.0), (1009.0, 18.0)]),
+    ],
+)
+def test_aggregate(tmp_path, aggregation, agg, expect):
+    # GIVEN
+    write(tmp_path, 10)
+
+    # WHEN
+    with store.Reader(str(tmp_path), "load.1") as reader:
+        result = store.aggregate(reader, 1000, 1100, agg, 3)
+
+    # THEN
+    assert result == expect
+
+
+def test_aggregate__whole_range(tmp_path, aggregation):
+    # GIVEN
+    write(tmp_path, 10)
+
+    # WHEN
+    with store.Reader(str(tmp_path), "load.1") as reader:
+        result = store.aggregate(reader, 1002, 1005, "avg")
+
+    # THEN
+    assert result == [(1002.0, 6.0)]
+
+
+def test_query(tmp_path, capsys):
+    # GIVEN
+    write(tmp_path, 10)
+
+    # WHEN
+    store.main(["load.1", "--store", str(tmp_path), "--agg", "max"])
+
+    # THEN
+    assert capsys.readouterr().out.split()[-1] == "18.0"
@@ -0,0 +1,98 @@
+# Copyright (c) 2022 Yoshihiro Ota <ota@j.email.ne.jp>
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE AUTHOR AND CONTRIBUTORS ``AS IS'' AND
+# ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.  IN NO EVENT SHALL THE AUTHOR OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS
+# OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION)
+# HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY
+# OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+
+import pytest
+
+from prdanlz.timing import Histogram, Timings
+
+
+def test_histogram():
+    # GIVEN
+    h = Histogram(size=100)
+
+    # WHEN
+    for i in range(1, 201):
+        h.add(i / 1000)
+
+    # THEN - percentiles of the latest 100 samples
+    s = h.summary()
+    assert s["count"] == 200
+    assert s["mean"] == pytest.approx(0.1005)
+    assert s["p50"] == 0.15
+    assert s["p95"] == 0.195
+    assert s["p99"] == 0.199
+    assert s["max"] == 0.2
+
+
+def test_histogram__empty():
+    # GIVEN
+    h = Histogram()
+
+    # WHEN/THEN
+    assert h.summary() == {
+        "count": 0,
+        "mean": 0.0,
+        "p50": 0.0,
+        "p95": 0.0,
+        "p99": 0.0,
+        "max": 0.0,
+    }
+
+
+def test_timings__measure():
+    # GIVEN
+    t = Timings()
+
+    # WHEN
+    with t.measure(("variable", "a")):
+        pass
+    with pytest.raises(IndexError):
+        with t.measure(("variable", "a")):
+            raise IndexError()
+    with pytest.raises(ValueError):
+        with t.measure(("derivative", "b")):
+            raise ValueError()
+    t.error(("escalation", "c"))
+
+    # THEN - IndexError is not an error
+    s = t.summary()
+    assert s["variable"]["a"]["count"] == 2
+    assert s["variable"]["a"]["errors"] == 0
+    assert s["derivative"]["b"]["count"] == 1
+    assert s["derivative"]["b"]["errors"] == 1
+    assert s["escalation"]["c"]["count"] == 0
+    assert s["escalation"]["c"]["errors"] == 1
+
+
+def test_timings__report():
+    # GIVEN
+    t = Timings()
+    t.record(("variable", "fast"), 0.001)
+    t.record(("variable", "slow"), 0.5)
+
+    # WHEN
+    lines = t.report()
+
+    # THEN - the slowest first
+    assert lines[0].startswith("variable 'slow' count=1")
+    assert lines[1].startswith("variable 'fast' count=1")
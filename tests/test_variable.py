@@ -24,7 +24,14 @@
 import pytest
 import copy
 
-from prdanlz import Variable, SyscmdVariable, SysctlVariable, instantiate_variable
+from prdanlz import (
+    Variable,
+    SyscmdVariable,
+    SysctlVariable,
+    FileVariable,
+    SyntheticVariable,
+    instantiate_variable,
+)
 
 
 class CheckVariable(Variable):
@@ -172,6 +179,21 @@ def test_sysctl__kern_ostype():
     assert v.value == "FreeBSD"
 
 
+def test_sysctl__resolved():
+    # GIVEN
+    v = SysctlVariable("os", {"type": "sysctl", "sysctl": "kern.ostype"})
+
+    # WHEN
+    params = v.resolved()
+    resolved = SysctlVariable("os", {**params, "defer": True})
+
+    # THEN
+    assert params["sysctl"] == "kern.ostype"
+    assert len(params["oid"]) == 3
+    assert resolved.value is None
+    assert resolved.new_value() == "FreeBSD"
+
+
 def test_sysctl__bad_ostype():
     # GIVEN
     os = {"type": "sysctl", "sysctl": "ostype"}
@@ -243,3 +265,189 @@ def test_instantiate_variable__sysctl_over_syscmd():
     # THEN
     assert v.value != "ABC"
     assert v.new_value() != "ABC"
+
+
+def test_file__counts_lines(tmp_path):
+    # GIVEN
+    log = tmp_path / "messages"
+    log.write_bytes(b"one\ntwo\n")
+
+    # WHEN
+    v = FileVariable("log", {"type": "file", "file": str(log)})
+
+    # THEN
+    assert v.value == {"lines": 2}
+
+
+def test_file__reads_appended_lines(tmp_path):
+    # GIVEN
+    log = tmp_path / "messages"
+    log.write_bytes(b"one\n")
+    v = FileVariable("log", {"type": "file", "file": str(log)})
+
+    # WHEN
+    with open(log, "ab") as f:
+        f.write(b"two\nthr")
+
+    # THEN - an incomplete line is not counted
+    assert v.new_value() == {"lines": 2}
+
+    # WHEN
+    with open(log, "ab") as f:
+        f.write(b"ee\n")
+
+    # THEN
+    assert v.new_value() == {"lines": 3}
+
+
+def test_file__tail(tmp_path):
+    # GIVEN
+    log = tmp_path / "messages"
+    log.write_bytes(b"one\ntwo\n")
+
+    # WHEN
+    v = FileVariable("log", {"type": "file", "file": str(log), "tail": True})
+
+    # THEN
+    assert v.value == {"lines": 0}
+
+
+def test_file__patterns(tmp_path):
+    # GIVEN
+    log = tmp_path / "messages"
+    log.write_bytes(b"kernel: panic\nsshd: Failed password\nsshd: Accepted\n")
+    params = {
+        "type": "file",
+        "file": str(log),
+        "patterns": {"failed": "Failed password", "sshd": "^sshd:"},
+    }
+
+    # WHEN
+    v = FileVariable("log", params)
+
+    # THEN
+    assert v.value == {"lines": 3, "failed": 1, "sshd": 2}
+
+
+def test_file__bad_pattern_name(tmp_path):
+    # GIVEN
+    params = {"type": "file", "file": str(tmp_path), "patterns": {"lines": "x"}}
+
+    # WHEN
+    with pytest.raises(TypeError) as e:
+        v = FileVariable("log", params)
+
+        # THEN
+    assert "'lines' cannot be used" in str(e)
+
+
+def test_file__rotated(tmp_path):
+    # GIVEN
+    log = tmp_path / "messages"
+    log.write_bytes(b"one\n")
+    v = FileVariable("log", {"type": "file", "file": str(log)})
+
+    # WHEN - appended, renamed and re-created before the next fetch
+    with open(log, "ab") as f:
+        f.write(b"two\n")
+    log.rename(tmp_path / "messages.0")
+    log.write_bytes(b"three\n")
+
+    # THEN
+    assert v.new_value() == {"lines": 3}
+
+
+def test_file__truncated(tmp_path):
+    # GIVEN
+    log = tmp_path / "messages"
+    log.write_bytes(b"one\ntwo\n")
+    v = FileVariable("log", {"type": "file", "file": str(log)})
+
+    # WHEN
+    log.write_bytes(b"three\n")
+
+    # THEN
+    assert v.new_value() == {"lines": 3}
+
+
+def test_file__missing(tmp_path):
+    # GIVEN
+    log = tmp_path / "messages"
+
+    # WHEN
+    v = FileVariable("log", {"type": "file", "file": str(log)})
+
+    # THEN
+    assert v.value == {"lines": 0}
+
+    # WHEN
+    log.write_bytes(b"one\n")
+
+    # THEN
+    assert v.new_value() == {"lines": 1}
+
+
+def test_instantiate_variable__file(tmp_path):
+    # GIVEN & WHEN
+    v = instantiate_variable("log", {"type": "file", "file": str(tmp_path / "x")})
+
+    # THEN
+    assert v.value == {"lines": 0}
+
+
+def test_syscmd__when_is_not_fetched_initially():
+    # GIVEN
+    ls = {"type": "syscmd", "syscmd": "ls -d /tmp", "when": "{load} > 4"}
+
+    # WHEN
+    v = SyscmdVariable("ls", ls)
+
+    # THEN
+    assert v.when == "{load} > 4"
+    assert v.value is None
+    assert v.new_value() == "/tmp"
+
+
+def test_syscmd__defer():
+    # GIVEN
+    ls = {"type": "syscmd", "syscmd": "ls -d /tmp", "defer": True}
+
+    # WHEN
+    v = SyscmdVariable("ls", ls)
+
+    # THEN
+    assert v.value is None
+    assert v.new_value() == "/tmp"
+
+
+def test_synthetic__counter():
+    # GIVEN
+    v = instantiate_variable(
+        "count", {"type": "synthetic", "synthetic": "counter", "step": 2}
+    )
+
+    # WHEN
+    v.new_value()
+
+    # THEN
+    assert isinstance(v, SyntheticVariable)
+    assert v.value == 4
+
+
+def test_synthetic__random_is_repeatable():
+    # GIVEN
+    params = {"type": "synthetic", "synthetic": "random", "min": 5, "max": 10}
+
+    # WHEN
+    a = SyntheticVariable("r", params)
+    b = SyntheticVariable("r", params)
+
+    # THEN
+    assert 5 <= a.value <= 10
+    assert [a.new_value() for _ in range(3)] == [b.new_value() for _ in range(3)]
+
+
+def test_synthetic__unknown_kind():
+    # GIVEN/WHEN/THEN
+    with pytest.raises(TypeError):
+        SyntheticVariable("r", {"type": "synthetic", "synthetic": "sine"})